@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+class CommonConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.common'
+    
+    def ready(self):
+        from .db import tune_sqlite
+        from .metrics import install_query_recorder
+        connection_created.connect(tune_sqlite, dispatch_uid='common.tune_sqlite')
+        connection_created.connect(install_query_recorder, dispatch_uid='common.install_query_recorder')
@@ -0,0 +1,130 @@
+"""
+Async views for the hot read endpoints.
+
+DRF views are sync only, so under ASGI every DRF request holds a thread
+while it waits on the cache or the database. The endpoints students hit
+all exam long are also served by plain async Django views: they
+authenticate with the API's authentication classes, check DRF permission
+classes and render with DRF's JSON renderer, so responses match the DRF
+view's. Other methods on the same URL are handed to the DRF view.
+
+The URLconfs route to them only under SERVER_MODE=asgi; a sync worker
+would have to run each one in an event loop of its own. The async views
+read the cache through its async API (`aget_or_build`) and build misses on
+the async ORM, while the DRF views stay sync throughout; both shape their
+payloads with the same serializers.
+"""
+import functools
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+READ_METHODS = ('GET', 'HEAD')
+# How much of a sync streamed body is read per hop to a worker thread under ASGI.
+STREAM_BATCH_BYTES = 64 * 1024
+
+
+def json_response(data, status=200, headers=None):
+    response = HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json', headers=headers)
+    # Like a DRF Response, keep the unrendered data around.
+    response.data = data
+    return response
+
+
+def error_response(error, authenticators, request):
+    """The response DRF's exception handler gives for `error`."""
+    if isinstance(error, Http404):
+        error = exceptions.NotFound()
+    headers = {}
+    if isinstance(error, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        auth_header = authenticators[0].authenticate_header(request) if authenticators else None
+        if auth_header:
+            headers['WWW-Authenticate'] = auth_header
+        else:
+            error.status_code = 403
+    if getattr(error, 'wait', None):
+        headers['Retry-After'] = '%d' % error.wait
+    data = error.detail if isinstance(error.detail, (list, dict)) else {'detail': error.detail}
+    return json_response(data, status=error.status_code, headers=headers)
+
+
+async def authenticate(request, authenticators):
+    """Return the user the first authenticator accepts, as DRF's Request does."""
+    # Set by APIClient.force_authenticate(), which DRF's Request honours too.
+    force_user = getattr(request, '_force_auth_user', None)
+    if force_user is not None:
+        return force_user
+    for authenticator in authenticators:
+        result = await sync_to_async(authenticator.authenticate)(request)
+        if result is not None:
+            return result[0]
+    raise exceptions.NotAuthenticated
+
+
+def async_read_view(sync_view, permission_classes):
+    """
+    Serve GET and HEAD with the decorated coroutine, called with the
+    authenticated user on `request.user`; any other method goes to
+    `sync_view`. The wrapper keeps `sync_view`'s attributes (csrf_exempt,
+    and the DRF view class the schema is generated from).
+    """
+    def decorator(handler):
+        @functools.wraps(sync_view)
+        async def view(request, *args, **kwargs):
+            if request.method not in READ_METHODS:
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+            authenticators = [authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+            try:
+                request.user = await authenticate(request, authenticators)
+                for permission in permission_classes:
+                    if not permission().has_permission(request, None):
+                        raise exceptions.PermissionDenied
+                return await handler(request, *args, **kwargs)
+            except (exceptions.APIException, Http404) as error:
+                return error_response(error, authenticators, request)
+
+        return view
+    return decorator
+
+
+def streaming_response(request, chunks, **kwargs):
+    """
+    A StreamingHttpResponse of the sync iterator `chunks` that streams under
+    both handlers. Django's ASGI handler reads a sync iterator to the end
+    before it sends anything, so under ASGI the chunks are handed over by
+    `iterate_in_thread` instead.
+    """
+    # DRF's Request wraps the HttpRequest.
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = iterate_in_thread(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
+
+
+async def iterate_in_thread(chunks):
+    """
+    Yield the chunks of a sync iterator, read about STREAM_BATCH_BYTES at a
+    time in the request's worker thread, where its database connection and
+    server-side cursors live.
+    """
+    iterator = iter(chunks)
+
+    def next_batch():
+        batch, size = [], 0
+        for chunk in iterator:
+            batch.append(chunk)
+            size += len(chunk)
+            if size >= STREAM_BATCH_BYTES:
+                break
+        return batch
+
+    try:
+        while batch := await sync_to_async(next_batch)():
+            for chunk in batch:
+                yield chunk
+    finally:
+        if hasattr(iterator, 'close'):
+            await sync_to_async(iterator.close)()
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from threading import Lock
+from django.core.cache import caches
+from django.db import transaction
+from .metrics import record_cache_event
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 60 * 60
+# Single flight: one process rebuilds a missing entry while the others wait
+# up to LOCK_WAIT seconds for it before building it themselves.
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 2
+LOCK_POLL_INTERVAL = 0.05
+# Early recompute (XFetch): an entry is rebuilt before it expires with a
+# probability that grows as expiry nears and with how long it took to build.
+EARLY_RECOMPUTE_BETA = 1.0
+
+VERSION_KEY = '{namespace}:version:{scope}'
+ENTRY_KEY = '{namespace}:{scope}:{name}:{version}'
+LOCK_KEY = '{key}:lock'
+
+try:
+    from django_redis.exceptions import ConnectionInterrupted
+    from redis.exceptions import RedisError
+    CACHE_ERRORS = (ConnectionInterrupted, RedisError, OSError)
+except ImportError:
+    CACHE_ERRORS = (OSError,)
+
+_counters = Counter()
+_counters_lock = Lock()
+
+
+def count(event, amount=1):
+    with _counters_lock:
+        _counters[event] += amount
+    record_cache_event(event)
+
+
+def cache_counters():
+    """
+    Hits, misses, early recomputes, single-flight waits and backend
+    fallbacks counted by this process since it started.
+    """
+    with _counters_lock:
+        return dict(_counters)
+
+
+def cache_call(method, *args, **kwargs):
+    """Call the shared cache, or the process-local one while the shared cache is unreachable."""
+    try:
+        return getattr(caches['default'], method)(*args, **kwargs)
+    except CACHE_ERRORS:
+        logger.warning('Cache backend unavailable, using the local cache', exc_info=True)
+        count('fallbacks')
+        return getattr(caches['local'], method)(*args, **kwargs)
+
+
+async def acache_call(method, *args, **kwargs):
+    """`cache_call` on the caches' async API (`aget`, `aset`, ...)."""
+    try:
+        return await getattr(caches['default'], f'a{method}')(*args, **kwargs)
+    except CACHE_ERRORS:
+        logger.warning('Cache backend unavailable, using the local cache', exc_info=True)
+        count('fallbacks')
+        return await getattr(caches['local'], f'a{method}')(*args, **kwargs)
+
+
+def namespace_version(namespace, scope):
+    """Return the content version of one scope (e.g. a test id) of a namespace, creating it on first use."""
+    key = VERSION_KEY.format(namespace=namespace, scope=scope)
+    version = cache_call('get', key)
+    if version is None:
+        cache_call('add', key, uuid.uuid4().hex, timeout=None)
+        version = cache_call('get', key)
+    return version
+
+
+async def anamespace_version(namespace, scope):
+    key = VERSION_KEY.format(namespace=namespace, scope=scope)
+    version = await acache_call('get', key)
+    if version is None:
+        await acache_call('add', key, uuid.uuid4().hex, timeout=None)
+        version = await acache_call('get', key)
+    return version
+
+
+def bump_namespace(namespace, scope):
+    """
+    Invalidate everything cached for one scope of a namespace. The version is
+    bumped again on commit so that a reader that rebuilt from the not yet
+    committed rows in between is discarded.
+    """
+    _new_version(namespace, scope)
+    transaction.on_commit(lambda: _new_version(namespace, scope))
+
+
+def _new_version(namespace, scope):
+    cache_call('set', VERSION_KEY.format(namespace=namespace, scope=scope), uuid.uuid4().hex, timeout=None)
+
+
+def get_or_build(namespace, scope, name, build, timeout=DEFAULT_TIMEOUT, version=None):
+    """
+    Return the value cached as `name` for the current version of a scope,
+    calling `build()` on a miss.
+    
+    Pass `version` when the caller already looked it up (e.g. for an ETag).
+    Misses are single-flight and hot entries are recomputed shortly before
+    they expire, so an expiry or invalidation does not send every worker to
+    the database at once.
+    """
+    if version is None:
+        version = namespace_version(namespace, scope)
+    key = ENTRY_KEY.format(namespace=namespace, name=name, scope=scope, version=version)
+    lock_key = LOCK_KEY.format(key=key)
+    
+    entry = cache_call('get', key)
+    if entry is not None:
+        if is_fresh(entry):
+            count('hits')
+            return entry[0]
+        if not cache_call('add', lock_key, 1, timeout=LOCK_TIMEOUT):
+            # Another process is already recomputing it.
+            count('hits')
+            return entry[0]
+        count('early_recomputes')
+        return _rebuild(key, lock_key, build, timeout)
+    
+    count('misses')
+    if cache_call('add', lock_key, 1, timeout=LOCK_TIMEOUT):
+        return _rebuild(key, lock_key, build, timeout)
+    
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache_call('get', key)
+        if entry is not None:
+            count('waits')
+            return entry[0]
+    count('lock_timeouts')
+    return build()
+
+
+async def aget_or_build(namespace, scope, name, build, timeout=DEFAULT_TIMEOUT, version=None):
+    """
+    `get_or_build` for async views: the cache is read through its async API,
+    `build` is a coroutine function and waiting for another process's build
+    sleeps on the event loop.
+    """
+    if version is None:
+        version = await anamespace_version(namespace, scope)
+    key = ENTRY_KEY.format(namespace=namespace, name=name, scope=scope, version=version)
+    lock_key = LOCK_KEY.format(key=key)
+    
+    entry = await acache_call('get', key)
+    if entry is not None:
+        if is_fresh(entry):
+            count('hits')
+            return entry[0]
+        if not await acache_call('add', lock_key, 1, timeout=LOCK_TIMEOUT):
+            count('hits')
+            return entry[0]
+        count('early_recomputes')
+        return await _arebuild(key, lock_key, build, timeout)
+    
+    count('misses')
+    if await acache_call('add', lock_key, 1, timeout=LOCK_TIMEOUT):
+        return await _arebuild(key, lock_key, build, timeout)
+    
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        entry = await acache_call('get', key)
+        if entry is not None:
+            count('waits')
+            return entry[0]
+    count('lock_timeouts')
+    return await build()
+
+
+def is_fresh(entry):
+    """Whether a cached (value, build_seconds, expires_at) entry is served as is, or recomputed early."""
+    _, build_seconds, expires_at = entry
+    return time.time() - build_seconds * EARLY_RECOMPUTE_BETA * math.log(random.random()) < expires_at
+
+
+def _rebuild(key, lock_key, build, timeout):
+    try:
+        started = time.time()
+        value = build()
+        finished = time.time()
+        cache_call('set', key, (value, finished - started, finished + timeout), timeout=timeout)
+        return value
+    finally:
+        cache_call('delete', lock_key)
+
+
+async def _arebuild(key, lock_key, build, timeout):
+    try:
+        started = time.time()
+        value = await build()
+        finished = time.time()
+        await acache_call('set', key, (value, finished - started, finished + timeout), timeout=timeout)
+        return value
+    finally:
+        await acache_call('delete', lock_key)
@@ -0,0 +1,128 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DB_ALIAS = 'replica'
+
+_reading_from_replica = ContextVar('reading_from_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def use_replica(enabled=True):
+    """
+    Route ORM reads made inside the block to the replica, when one is
+    configured. `route_reads_to_replica()` can switch it on later in the block.
+    """
+    token = _reading_from_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _reading_from_replica.reset(token)
+
+
+def route_reads_to_replica():
+    """Send the remaining reads of the enclosing `use_replica()` block to the replica."""
+    _reading_from_replica.set(True)
+
+
+def read_database():
+    """The alias ORM reads are routed to right now, for querysets evaluated later (e.g. streamed)."""
+    if _reading_from_replica.get() and replica_configured():
+        return REPLICA_DB_ALIAS
+    return DEFAULT_DB_ALIAS
+
+
+def primary_pin_key(user_id):
+    return f'db:primary-pin:{user_id}'
+
+
+def pin_reads_to_primary(user):
+    """
+    Read-your-writes: keep the user's reads on the primary for
+    REPLICA_STICKY_SECONDS after they wrote, longer than the replica lags.
+    """
+    cache.set(primary_pin_key(user.pk), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def reads_pinned_to_primary(user):
+    return user.is_authenticated and cache.get(primary_pin_key(user.pk)) is not None
+
+
+async def areads_pinned_to_primary(user):
+    return user.is_authenticated and await cache.aget(primary_pin_key(user.pk)) is not None
+
+
+class PrimaryReplicaRouter:
+    """
+    Reads inside `use_replica()` go to the `replica` alias; every other read,
+    all writes and all migrations go to the primary.
+    """
+    
+    def db_for_read(self, model, **hints):
+        return read_database()
+    
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return True
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_DB_ALIAS
+
+
+class PrimaryStickinessMiddleware:
+    """Pin a user's reads to the primary after each of their successful writes."""
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        user = self.writer(request, response)
+        if user is not None:
+            pin_reads_to_primary(user)
+        return response
+    
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        user = self.writer(request, response)
+        if user is not None:
+            await sync_to_async(pin_reads_to_primary)(user)
+        return response
+    
+    def writer(self, request, response):
+        """The authenticated user whose successful write `response` answers, if any."""
+        if (
+            replica_configured()
+            and request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and response.status_code < 400
+        ):
+            # DRF copies the user it authenticated onto the Django request.
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                return user
+        return None
+
+
+def tune_sqlite(sender, connection, **kwargs):
+    """`connection_created` receiver applying SQLITE_PRAGMAS to new SQLite connections."""
+    if connection.vendor != 'sqlite' or not settings.SQLITE_TUNING:
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
@@ -0,0 +1,179 @@
+import ipaddress
+import logging
+import os
+import time
+from collections import Counter
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter as MetricCounter, Histogram, generate_latest,
+    multiprocess,
+)
+
+slow_request_logger = logging.getLogger('apps.slow_requests')
+
+KNOWN_METHODS = {'GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'}
+LABELS = ('view', 'method')
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Request latency.', LABELS + ('status',),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_queries', 'SQL queries per request.', LABELS,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, 377),
+)
+REQUEST_QUERY_SECONDS = Histogram(
+    'http_request_query_seconds', 'Time spent in SQL per request.', LABELS,
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+RESPONSE_BYTES = Histogram(
+    'http_response_size_bytes', 'Response body size (streamed responses excluded).', LABELS,
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+CACHE_EVENTS = MetricCounter(
+    'http_request_cache_events', 'apps.common.cache hits, misses and rebuilds per view.', LABELS + ('event',),
+)
+
+_request_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """What one request did: SQL statements and their time, cache events."""
+
+    def __init__(self, keep_sql=False):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.cache_events = Counter()
+        self.statements = Counter() if keep_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - started
+            if self.statements is not None:
+                self.statements[sql] += 1
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper on every connection; counts into the current request's RequestStats."""
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    `connection_created` receiver. The request's stats live in a context
+    variable rather than on the connection, so queries that async views run
+    in worker threads are counted too.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_cache_event(event):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.cache_events[event] += 1
+
+
+class MetricsMiddleware:
+    """
+    Record latency, SQL query count and time, cache events and response size
+    per URL name and method. With SLOW_REQUEST_SECONDS set, requests slower
+    than that are logged with their most repeated SQL statements, which is
+    how N+1 queries show up.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats(keep_sql=settings.SLOW_REQUEST_SECONDS is not None)
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats(keep_sql=settings.SLOW_REQUEST_SECONDS is not None)
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def record(self, request, response, elapsed, stats):
+        slow_seconds = settings.SLOW_REQUEST_SECONDS
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        method = request.method if request.method in KNOWN_METHODS else 'other'
+        REQUEST_SECONDS.labels(view, method, response.status_code).observe(elapsed)
+        REQUEST_QUERIES.labels(view, method).observe(stats.queries)
+        REQUEST_QUERY_SECONDS.labels(view, method).observe(stats.query_seconds)
+        if not response.streaming:
+            RESPONSE_BYTES.labels(view, method).observe(len(response.content))
+        for event, amount in stats.cache_events.items():
+            CACHE_EVENTS.labels(view, method, event).inc(amount)
+
+        if slow_seconds is not None and elapsed >= slow_seconds:
+            self.log_slow_request(request, view, elapsed, stats)
+
+    def log_slow_request(self, request, view, elapsed, stats):
+        repeated = '\n'.join(
+            f'  {count}x {sql}' for sql, count in stats.statements.most_common(settings.SLOW_REQUEST_TOP_STATEMENTS)
+        )
+        slow_request_logger.warning(
+            'Slow request %s %s (%s): %.3fs, %d queries in %.3fs\n%s',
+            request.method, request.path, view, elapsed, stats.queries, stats.query_seconds, repeated,
+        )
+
+
+def may_scrape(request):
+    """
+    Whether the request may read /metrics: it carries METRICS_TOKEN, or
+    comes from one of the METRICS_ALLOWED_NETWORKS. Neither is set by
+    default, so the metrics are not public.
+    """
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') == f'Bearer {settings.METRICS_TOKEN}':
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+def metrics_view(request):
+    """
+    Prometheus exposition. Under gunicorn, PROMETHEUS_MULTIPROC_DIR makes it
+    aggregate the samples every worker wrote there, not just this worker's.
+    """
+    if not may_scrape(request):
+        return HttpResponseForbidden()
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -1,5 +1,6 @@
 from rest_framework.response import Response
 from rest_framework import status
+from .db import use_replica, route_reads_to_replica, reads_pinned_to_primary
 
 class CreateModelMixin:
     def create(self, request, *args, **kwargs):
@@ -16,4 +17,30 @@ class CreateModelMixin:
         try:
             return {'Location': str(data[self.lookup_field])}
         except (TypeError, KeyError):
-            return {}
\ No newline at end of file
+            return {}
+
+class ReplicaReadMixin:
+    """
+    Serve safe requests (GET, HEAD, OPTIONS) from the read replica, except
+    for users who wrote within the last REPLICA_STICKY_SECONDS. On viewsets,
+    `replica_actions` limits it to the listed actions. Authentication always
+    reads from the primary.
+    """
+    replica_actions = None
+
+    def reads_from_replica(self, request):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return False
+        if self.replica_actions is None:
+            return True
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        return action in self.replica_actions
+
+    def dispatch(self, request, *args, **kwargs):
+        with use_replica(False):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.reads_from_replica(request) and not reads_pinned_to_primary(request.user):
+            route_reads_to_replica()
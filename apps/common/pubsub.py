@@ -0,0 +1,151 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'pubsub:'
+RECONNECT_DELAY = 1
+# A Redis key per channel marks that some process has a subscriber to it;
+# it is refreshed while the subscriber lives and expires after it is gone.
+LISTENING_PREFIX = 'pubsub-listening:'
+LISTENING_TTL = 30
+
+
+class LocalBroker:
+    """
+    Fan messages out to the subscribers of this process. `publish` may be
+    called from any thread; every subscriber gets the messages in an
+    asyncio queue on its own event loop.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        self.deliver(channel, json.loads(json.dumps(message, cls=DjangoJSONEncoder)))
+
+    def has_subscribers(self, channel):
+        with self._lock:
+            return bool(self._subscribers.get(channel))
+
+    def deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+            except RuntimeError:
+                # The subscriber's loop closed before it unsubscribed.
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+class RedisBroker(LocalBroker):
+    """
+    Publish through Redis so subscribers in every worker get the message.
+    Each process holds one pattern subscription per event loop and fans
+    what it receives out to its local subscribers.
+    """
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+        self._client = None
+        self._listeners = {}
+
+    def client(self):
+        import redis
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        return self._client
+
+    def publish(self, channel, message):
+        import redis
+        try:
+            self.client().publish(CHANNEL_PREFIX + channel, json.dumps(message, cls=DjangoJSONEncoder))
+        except (redis.RedisError, OSError):
+            logger.warning('Could not publish to %s', channel, exc_info=True)
+
+    def has_subscribers(self, channel):
+        """Whether a subscriber in any process listens; True when Redis can't tell."""
+        import redis
+        try:
+            return bool(self.client().exists(LISTENING_PREFIX + channel))
+        except (redis.RedisError, OSError):
+            return True
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._listeners:
+                self._listeners[loop] = loop.create_task(self.listen())
+        async with super().subscribe(channel) as queue:
+            announcing = loop.create_task(self.announce(channel))
+            try:
+                yield queue
+            finally:
+                announcing.cancel()
+
+    async def announce(self, channel):
+        """Keep the channel's listening key alive while a subscriber of this process uses it."""
+        from redis import asyncio as aioredis
+        client = aioredis.Redis.from_url(self.url)
+        try:
+            while True:
+                try:
+                    await client.set(LISTENING_PREFIX + channel, 1, ex=LISTENING_TTL)
+                except (aioredis.RedisError, OSError):
+                    logger.warning('Could not announce a subscriber to %s', channel, exc_info=True)
+                await asyncio.sleep(LISTENING_TTL / 3)
+        finally:
+            await client.aclose()
+
+    async def listen(self):
+        from redis import asyncio as aioredis
+        while True:
+            client = aioredis.Redis.from_url(self.url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(CHANNEL_PREFIX + '*')
+                    async for item in pubsub.listen():
+                        if item['type'] == 'pmessage':
+                            channel = item['channel'].decode().removeprefix(CHANNEL_PREFIX)
+                            self.deliver(channel, json.loads(item['data']))
+            except (aioredis.RedisError, OSError):
+                logger.warning('Lost the Redis subscription, reconnecting', exc_info=True)
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                await client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The process's broker: Redis when PUBSUB_URL is set, in-process otherwise."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = RedisBroker(settings.PUBSUB_URL) if settings.PUBSUB_URL else LocalBroker()
+        return _broker
@@ -0,0 +1,374 @@
+import re
+import sqlite3
+import time
+import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import connection, connections
+from django.db.models import Count
+from django.urls import resolve
+from django.utils import timezone
+from django.test import AsyncClient
+from rest_framework.test import APIClient
+from apps.tests.models import Test, Choice
+from apps.results.models import TestSubmission, Answer
+from apps.stats.aggregates import COUNTED_STATUSES
+from apps.stats.models import TestStats
+from apps.users.serializers import ClaimsTokenObtainPairSerializer
+from .db import PrimaryReplicaRouter, use_replica
+from . import cache as versioned_cache
+
+User = get_user_model()
+
+# Queries on the request and grading hot paths; each must be served by an index.
+HOT_QUERIES = {
+    'stats-totals': lambda: TestSubmission.objects.filter(test_id=1, status__in=COUNTED_STATUSES).values('score'),
+    'student-stats': lambda: TestSubmission.objects.filter(student_id=1, status__in=COUNTED_STATUSES),
+    'existing-submission': lambda: TestSubmission.objects.filter(test_id=1, student_id=1),
+    'student-submissions-page': lambda: TestSubmission.objects.filter(student_id=1).order_by('id')[:10],
+    'pending-grading': lambda: TestSubmission.objects.filter(status='grading').order_by('id').values('id'),
+    'expired-sessions': lambda: TestSubmission.objects.filter(
+        status='in_progress', expires_at__lt=timezone.now()
+    ).order_by('expires_at').values('id')[:2000],
+    'question-correct-answers': lambda: Answer.objects.filter(question_id=1, is_correct=True),
+    'results-export-answers': lambda: Answer.objects.filter(submission__test_id=1).order_by('submission_id', 'id'),
+    'student-tests-page': lambda: Test.objects.filter(is_active=True).annotate(
+        question_count=Count('questions')
+    ).order_by('-created_at', '-id')[:10],
+    'answer-key-choices': lambda: Choice.objects.filter(question__test_id=1).values('question_id', 'id', 'is_correct'),
+    'users-by-role-page': lambda: User.objects.filter(role='teacher').order_by('id')[:10],
+}
+
+
+def explain(queryset):
+    if connection.vendor == 'postgresql':
+        # Tiny test tables always favour a sequential scan; with it disabled,
+        # a Seq Scan left in the plan means no index can serve the query.
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+    return queryset.explain()
+
+
+def sequential_scans(plan):
+    if connection.vendor == 'postgresql':
+        return [line.strip() for line in plan.splitlines() if 'Seq Scan' in line]
+    # SQLite reports a full table scan as a bare `SCAN <table>`.
+    return [line.strip() for line in plan.splitlines() if re.search(r'\bSCAN \w+$', line.strip())]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('name', HOT_QUERIES)
+def test_hot_query_uses_an_index(name):
+    plan = explain(HOT_QUERIES[name]())
+    assert not sequential_scans(plan), f'{name} scans a whole table:\n{plan}'
+
+
+@pytest.mark.django_db
+def test_unindexed_query_is_reported():
+    plan = explain(TestSubmission.objects.filter(score=50))
+    assert sequential_scans(plan)
+
+
+@pytest.mark.django_db
+def test_sqlite_connections_are_tuned():
+    if connection.vendor != 'sqlite':
+        pytest.skip('SQLite tuning only')
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA synchronous')
+        assert cursor.fetchone()[0] == 1  # NORMAL
+
+
+def test_reads_go_to_the_replica_only_when_asked(settings):
+    router = PrimaryReplicaRouter()
+    with use_replica():
+        assert router.db_for_read(Test) == 'default'
+    
+    settings.DATABASES = {**settings.DATABASES, 'replica': settings.DATABASES['default']}
+    assert router.db_for_read(Test) == 'default'
+    with use_replica():
+        assert router.db_for_read(Test) == 'replica'
+        assert router.db_for_write(Test) == 'default'
+    assert not router.allow_migrate('replica', 'tests')
+
+
+@pytest.fixture
+def replica(settings, tmp_path):
+    """
+    A second SQLite file standing in for a lagging replica: it holds a copy
+    of the primary taken when the fixture starts or when `sync()` is called.
+    Copying needs the primary outside a transaction, hence transaction=True.
+    """
+    if connection.vendor != 'sqlite':
+        pytest.skip('The replica is simulated with SQLite files')
+    path = tmp_path / 'replica.sqlite3'
+    
+    def sync():
+        connections['replica'].close()
+        target = sqlite3.connect(path)
+        connection.ensure_connection()
+        connection.connection.backup(target)
+        target.close()
+    
+    settings.DATABASES = {
+        **settings.DATABASES,
+        'replica': {**settings.DATABASES['default'], 'NAME': str(path), 'TEST': {}},
+    }
+    connections.settings['replica'] = connections.configure_settings(settings.DATABASES)['replica']
+    cache.clear()
+    sync()
+    yield sync
+    connections['replica'].close()
+    del connections['replica']
+    del connections.settings['replica']
+    cache.clear()
+
+
+def listed_titles(response):
+    data = response.json()
+    if isinstance(data, dict):
+        data = data['results']
+    return sorted(test['title'] for test in data)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_listings_read_from_the_replica_until_the_user_writes(replica):
+    teacher = User.objects.create_user(email='teacher@example.com', password='testpass123', role='teacher')
+    admin = User.objects.create_user(email='admin@example.com', password='testpass123', role='admin')
+    Test.objects.create(title='Replicated', subject='Math', created_by=teacher)
+    replica()
+    Test.objects.create(title='Not replicated yet', subject='Math', created_by=teacher)
+    
+    teacher_client = APIClient()
+    teacher_client.force_authenticate(user=teacher)
+    admin_client = APIClient()
+    admin_client.force_authenticate(user=admin)
+    
+    assert listed_titles(teacher_client.get('/api/v1/tests/')) == ['Replicated']
+    # Detail views and writes always use the primary.
+    response = teacher_client.post('/api/v1/tests/', {'title': 'Written', 'subject': 'Math', 'time_limit': 30})
+    assert response.status_code == 201
+    
+    assert listed_titles(teacher_client.get('/api/v1/tests/')) == ['Not replicated yet', 'Replicated', 'Written']
+    assert listed_titles(admin_client.get('/api/v1/tests/')) == ['Replicated']
+    
+    replica()
+    assert len(listed_titles(admin_client.get('/api/v1/tests/'))) == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_results_export_streams_from_the_replica(replica):
+    teacher = User.objects.create_user(email='teacher@example.com', password='testpass123', role='teacher')
+    student = User.objects.create_user(email='student@example.com', password='testpass123', role='student')
+    test = Test.objects.create(title='Exam', subject='Math', created_by=teacher)
+    replica()
+    TestSubmission.objects.create(test=test, student=student, status='completed', completed_at=timezone.now())
+    
+    client = APIClient()
+    client.force_authenticate(user=teacher)
+    response = client.get(f'/api/v1/results/tests/{test.id}/export/', {'export_format': 'ndjson'})
+    assert response.status_code == 200
+    assert b''.join(response.streaming_content) == b''
+    
+    replica()
+    response = client.get(f'/api/v1/results/tests/{test.id}/export/', {'export_format': 'ndjson'})
+    assert len(b''.join(response.streaming_content).splitlines()) == 1
+
+
+
+@pytest.mark.django_db(transaction=True)
+def test_stats_are_rebuilt_from_the_primary(replica):
+    teacher = User.objects.create_user(email='teacher@example.com', password='testpass123', role='teacher')
+    student = User.objects.create_user(email='student@example.com', password='testpass123', role='student')
+    test = Test.objects.create(title='Exam', subject='Math', created_by=teacher)
+    replica()
+    # Graded while the test has no stats row, so only a rebuild counts it.
+    TestSubmission.objects.create(test=test, student=student, status='completed', score=80, completed_at=timezone.now())
+    
+    client = APIClient()
+    client.force_authenticate(user=teacher)
+    response = client.get(f'/api/v1/stats/tests/{test.id}/')
+    assert (response.status_code, response.data['submission_count']) == (200, 1)
+    assert TestStats.objects.get(test=test).submission_count == 1
+
+@pytest.fixture
+def clean_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.mark.django_db
+def test_cached_values_follow_the_namespace_version(clean_cache):
+    builds = []
+    
+    def build():
+        builds.append(1)
+        return {'value': len(builds)}
+    
+    assert versioned_cache.get_or_build('things', 1, 'detail', build) == {'value': 1}
+    assert versioned_cache.get_or_build('things', 1, 'detail', build) == {'value': 1}
+    assert versioned_cache.get_or_build('things', 2, 'detail', build) == {'value': 2}
+    
+    versioned_cache.bump_namespace('things', 1)
+    assert versioned_cache.get_or_build('things', 1, 'detail', build) == {'value': 3}
+
+
+@pytest.mark.django_db
+def test_async_lookups_share_the_versioned_entries(clean_cache):
+    builds = []
+    
+    async def abuild():
+        builds.append(1)
+        return {'value': len(builds)}
+    
+    assert async_to_sync(versioned_cache.aget_or_build)('things', 1, 'detail', abuild) == {'value': 1}
+    assert versioned_cache.get_or_build('things', 1, 'detail', lambda: pytest.fail('built twice')) == {'value': 1}
+    
+    versioned_cache.bump_namespace('things', 1)
+    assert async_to_sync(versioned_cache.aget_or_build)('things', 1, 'detail', abuild) == {'value': 2}
+    assert async_to_sync(versioned_cache.aget_or_build)('things', 1, 'detail', abuild) == {'value': 2}
+
+
+def test_entries_are_recomputed_before_they_expire(clean_cache, monkeypatch):
+    monkeypatch.setattr(versioned_cache.random, 'random', lambda: 0.5)
+    version = versioned_cache.namespace_version('things', 1)
+    key = versioned_cache.ENTRY_KEY.format(namespace='things', name='detail', scope=1, version=version)
+    # Built in 10 seconds, expiring in one: due for an early recompute.
+    cache.set(key, ('old', 10, time.time() + 1))
+    before = versioned_cache.cache_counters().get('early_recomputes', 0)
+    
+    assert versioned_cache.get_or_build('things', 1, 'detail', lambda: 'new') == 'new'
+    assert versioned_cache.cache_counters()['early_recomputes'] == before + 1
+    
+    # While another process holds the lock, the current value is served.
+    cache.set(key, ('old', 10, time.time() + 1))
+    cache.add(versioned_cache.LOCK_KEY.format(key=key), 1)
+    assert versioned_cache.get_or_build('things', 1, 'detail', lambda: 'new') == 'old'
+
+
+def test_concurrent_misses_wait_for_a_single_build(clean_cache, monkeypatch):
+    version = versioned_cache.namespace_version('things', 1)
+    key = versioned_cache.ENTRY_KEY.format(namespace='things', name='detail', scope=1, version=version)
+    cache.add(versioned_cache.LOCK_KEY.format(key=key), 1)
+    
+    def other_process_finishes(seconds):
+        cache.set(key, ('built elsewhere', 0, time.time() + 60))
+    
+    monkeypatch.setattr(versioned_cache.time, 'sleep', other_process_finishes)
+    assert versioned_cache.get_or_build('things', 1, 'detail', lambda: pytest.fail('built twice')) == 'built elsewhere'
+
+
+def test_unreachable_cache_falls_back_to_local_memory(clean_cache, monkeypatch):
+    def unreachable(*args, **kwargs):
+        raise ConnectionRefusedError
+    
+    for method in ('get', 'set', 'add', 'delete'):
+        monkeypatch.setattr(caches['default'], method, unreachable)
+    builds = []
+    
+    def build():
+        builds.append(1)
+        return 'value'
+    
+    assert versioned_cache.get_or_build('things', 1, 'detail', build) == 'value'
+    assert versioned_cache.get_or_build('things', 1, 'detail', build) == 'value'
+    assert len(builds) == 1
+    assert versioned_cache.cache_counters()['fallbacks'] > 0
+    caches['local'].clear()
+
+
+@pytest.mark.django_db
+def test_requests_are_measured_per_view(settings, client):
+    teacher = User.objects.create_user(email='teacher@example.com', password='testpass123', role='teacher')
+    api_client = APIClient()
+    api_client.force_authenticate(user=teacher)
+    api_client.get('/api/v1/tests/')
+    
+    assert client.get('/metrics').status_code == 403
+    settings.METRICS_TOKEN = 'scrape-token'
+    assert client.get('/metrics').status_code == 403
+    body = client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token').content.decode()
+    assert 'http_request_queries_count{method="GET",view="test-list"}' in body
+    assert 'http_request_duration_seconds_bucket{le="0.005",method="GET",status="200",view="test-list"}' in body
+    assert 'http_response_size_bytes_count{method="GET",view="test-list"}' in body
+
+
+def test_metrics_can_be_opened_to_internal_networks(settings, client):
+    settings.METRICS_ALLOWED_NETWORKS = ['10.0.0.0/8']
+    assert client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code == 200
+    assert client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code == 403
+
+
+@pytest.mark.django_db
+def test_slow_requests_are_logged_with_repeated_sql(settings, caplog):
+    teacher = User.objects.create_user(email='teacher@example.com', password='testpass123', role='teacher')
+    Test.objects.create(title='Exam', subject='Math', created_by=teacher)
+    settings.SLOW_REQUEST_SECONDS = 0
+    api_client = APIClient()
+    api_client.force_authenticate(user=teacher)
+    
+    with caplog.at_level('WARNING', logger='apps.slow_requests'):
+        api_client.get('/api/v1/tests/')
+    
+    assert 'Slow request GET /api/v1/tests/ (test-list)' in caplog.text
+    assert '1x SELECT' in caplog.text
+
+
+@pytest.mark.django_db
+def test_async_read_views_run_under_asgi(asgi_routes):
+    teacher = User.objects.create_user(email='teacher@example.com', password='testpass123', role='teacher')
+    student = User.objects.create_user(email='student@example.com', password='testpass123', role='student')
+    test = Test.objects.create(title='Exam', subject='Math', created_by=teacher, time_limit=30)
+    question = test.questions.create(text='2+2?', question_type='single_choice', points=1)
+    question.choices.create(text='4', is_correct=True)
+    client = AsyncClient()
+    
+    def request(method, path, user=None):
+        token = ClaimsTokenObtainPairSerializer.get_token(user).access_token if user else None
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        return async_to_sync(getattr(client, method))(path, headers=headers)
+    
+    start_url = f'/api/v1/tests/{test.id}/start/'
+    exam = request('get', start_url, student)
+    assert exam.status_code == 200
+    assert exam.json()['questions'][0]['choices'] == [{'id': question.choices.get().id, 'text': '4'}]
+    assert request('get', f'/api/v1/tests/{test.id}/questions/', teacher).json()[0]['text'] == '2+2?'
+    assert request('get', '/api/v1/users/me/', student).json()['email'] == 'student@example.com'
+    assert request('get', '/api/v1/stats/student/', student).json()['tests_taken'] == 0
+    # Other methods go to the DRF view.
+    assert request('post', start_url, student).status_code == 201
+    
+    unauthenticated = request('get', start_url)
+    assert unauthenticated.status_code == 401
+    assert unauthenticated['WWW-Authenticate'].startswith('Bearer')
+    assert request('get', start_url, teacher).status_code == 403
+    assert request('get', f'/api/v1/tests/{test.id + 1}/start/', student).status_code == 404
+
+
+@pytest.mark.parametrize('server_mode', ['wsgi', 'asgi'])
+def test_hot_reads_are_routed_by_server_mode(request, server_mode):
+    if server_mode == 'asgi':
+        request.getfixturevalue('asgi_routes')
+    paths = [
+        '/api/v1/tests/1/start/', '/api/v1/tests/1/questions/', '/api/v1/users/me/',
+        '/api/v1/stats/student/', '/api/v1/stats/tests/1/stream/',
+    ]
+    # WSGI serves them with the DRF views, without running async code in a sync worker.
+    assert [iscoroutinefunction(resolve(path).func) for path in paths] == [server_mode == 'asgi'] * len(paths)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('test_count', [1, 5, 25])
+def test_query_budget_fails_with_the_captured_sql(query_budget, test_count):
+    teacher = User.objects.create_user(email='teacher@example.com', password='testpass123', role='teacher')
+    Test.objects.bulk_create([Test(title=f'Exam {index}', subject='Math', created_by=teacher) for index in range(test_count)])
+    
+    with query_budget(1):
+        assert {test.created_by.email for test in Test.objects.select_related('created_by')} == {teacher.email}
+    
+    with pytest.raises(pytest.fail.Exception) as failure:
+        with query_budget(1):
+            [test.created_by.email for test in Test.objects.all()]
+    assert f'{test_count + 1} queries exceed the budget of 1:' in str(failure.value)
+    assert f'{test_count + 1}. SELECT "users_user"' in str(failure.value)
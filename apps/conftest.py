@@ -0,0 +1,62 @@
+import importlib
+from contextlib import contextmanager
+import pytest
+from django.db import connection
+from django.urls import clear_url_caches
+from django.test.utils import CaptureQueriesContext
+
+# URLconfs that route by SERVER_MODE.
+SERVER_MODE_URLCONFS = ('apps.users.urls', 'apps.tests.urls', 'apps.stats.urls')
+
+# Savepoints come from the transaction every test runs in, not from the view.
+TEST_TRANSACTION_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+def counted_queries(captured):
+    return [query['sql'] for query in captured if not query['sql'].startswith(TEST_TRANSACTION_STATEMENTS)]
+
+
+@contextmanager
+def max_queries(budget, using=connection):
+    """
+    Fail the test when the block runs more than `budget` SQL queries,
+    listing every query it ran. Yields the list of counted statements,
+    filled in when the block exits.
+    """
+    statements = []
+    with CaptureQueriesContext(using) as captured:
+        yield statements
+    statements.extend(counted_queries(captured.captured_queries))
+    if len(statements) > budget:
+        pytest.fail(
+            f'{len(statements)} queries exceed the budget of {budget}:\n'
+            + '\n'.join(f'{number}. {sql}' for number, sql in enumerate(statements, 1)),
+            pytrace=False,
+        )
+
+
+@pytest.fixture
+def query_budget():
+    """
+    `with query_budget(3): client.get(url)` fails with the captured SQL when
+    the request runs more than 3 queries. Also usable as a decorator:
+    `@query_budget(8)` on a helper.
+    """
+    return max_queries
+
+
+def route_for(settings, server_mode):
+    settings.SERVER_MODE = server_mode
+    # The root URLconf last: its include()s hold the resolved patterns.
+    for urlconf in SERVER_MODE_URLCONFS + (settings.ROOT_URLCONF,):
+        importlib.reload(importlib.import_module(urlconf))
+    clear_url_caches()
+
+
+@pytest.fixture
+def asgi_routes(settings):
+    """Route requests as under SERVER_MODE=asgi: the hot GETs go to the async views."""
+    server_mode = settings.SERVER_MODE
+    route_for(settings, 'asgi')
+    yield
+    route_for(settings, server_mode)
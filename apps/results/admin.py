@@ -7,6 +7,9 @@ class AnswerInline(TabularInline):
     extra = 0
     readonly_fields = ('question', 'selected_choices', 'text_answer', 'is_correct', 'points_earned')
     can_delete = False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('question').prefetch_related('selected_choices')
 
 @admin.register(TestSubmission)
 class TestSubmissionAdmin(ModelAdmin):
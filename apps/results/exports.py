@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+from itertools import groupby
+from operator import attrgetter
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from apps.tests.models import Choice
+from .models import TestSubmission, Answer
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+SUBMISSION_COLUMNS = (
+    'submission_id', 'student_id', 'student_email', 'status',
+    'started_at', 'completed_at', 'score',
+)
+ANSWER_COLUMNS = (
+    'question_id', 'selected_choice_ids', 'text_answer', 'is_correct', 'points_earned',
+)
+CSV_COLUMNS = SUBMISSION_COLUMNS + ANSWER_COLUMNS
+
+
+def iter_submission_answers(test_id, chunk_size=EXPORT_CHUNK_SIZE, using=None):
+    """
+    Yield (submission, answers) for every submission of a test, ordered by id.
+
+    Submissions and answers are read through two server-side cursors
+    (`.iterator(chunk_size=...)`) ordered by submission id and merged as they
+    arrive, so memory holds one chunk of each plus the answers of the current
+    submission, however large the test's results are. Selected choice ids are
+    prefetched once per chunk of answers. `using` picks the database alias,
+    e.g. the read replica.
+    """
+    submissions = (
+        TestSubmission.objects.using(using).filter(test_id=test_id)
+        .select_related('student')
+        .only('id', 'status', 'started_at', 'completed_at', 'score', 'student__id', 'student__email')
+        .order_by('id')
+        .iterator(chunk_size=chunk_size)
+    )
+    answers = (
+        Answer.objects.using(using).filter(submission__test_id=test_id)
+        .only('id', 'submission_id', 'question_id', 'text_answer', 'is_correct', 'points_earned')
+        .prefetch_related(Prefetch('selected_choices', queryset=Choice.objects.only('id')))
+        .order_by('submission_id', 'id')
+        .iterator(chunk_size=chunk_size)
+    )
+
+    answer_groups = groupby(answers, key=attrgetter('submission_id'))
+    current = next(answer_groups, None)
+    for submission in submissions:
+        # Answers of submissions created after the submission cursor opened are skipped.
+        while current is not None and current[0] < submission.id:
+            current = next(answer_groups, None)
+        submission_answers = []
+        if current is not None and current[0] == submission.id:
+            submission_answers = list(current[1])
+            current = next(answer_groups, None)
+        yield submission, submission_answers
+
+
+def submission_fields(submission):
+    return {
+        'submission_id': submission.id,
+        'student_id': submission.student.id,
+        'student_email': submission.student.email,
+        'status': submission.status,
+        'started_at': submission.started_at,
+        'completed_at': submission.completed_at,
+        'score': submission.score,
+    }
+
+
+def answer_fields(answer):
+    return {
+        'question_id': answer.question_id,
+        'selected_choice_ids': [choice.id for choice in answer.selected_choices.all()],
+        'text_answer': answer.text_answer,
+        'is_correct': answer.is_correct,
+        'points_earned': answer.points_earned,
+    }
+
+
+def iter_csv_results(test_id, chunk_size=EXPORT_CHUNK_SIZE, using=None):
+    """
+    Stream results as CSV, one row per answer. A submission without answers
+    gets a single row with empty answer columns; selected choice ids are
+    joined with `;`.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    for submission, answers in iter_submission_answers(test_id, chunk_size, using):
+        submission_row = list(submission_fields(submission).values())
+        for answer in answers:
+            fields = answer_fields(answer)
+            fields['selected_choice_ids'] = ';'.join(str(choice_id) for choice_id in fields['selected_choice_ids'])
+            writer.writerow(submission_row + list(fields.values()))
+        if not answers:
+            writer.writerow(submission_row + [''] * len(ANSWER_COLUMNS))
+        yield flush()
+
+
+def iter_ndjson_results(test_id, chunk_size=EXPORT_CHUNK_SIZE, using=None):
+    """Stream results as newline-delimited JSON, one submission with its answers per line."""
+    for submission, answers in iter_submission_answers(test_id, chunk_size, using):
+        data = submission_fields(submission)
+        data['answers'] = [answer_fields(answer) for answer in answers]
+        yield json.dumps(data, cls=DjangoJSONEncoder) + '\n'
+
+
+def iter_results(test_id, export_format='csv', chunk_size=EXPORT_CHUNK_SIZE, using=None):
+    if export_format == 'ndjson':
+        return iter_ndjson_results(test_id, chunk_size, using)
+    return iter_csv_results(test_id, chunk_size, using)
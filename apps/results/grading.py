@@ -0,0 +1,339 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
+from apps.tests.answer_key import get_answer_key
+from apps.tests.models import Choice
+from .models import TestSubmission, Answer
+from .signals import submission_graded, submissions_graded
+
+UPDATE_BATCH_SIZE = 5000
+
+
+def stored_decimal(model, field_name, value):
+    """Round a computed value the way its DecimalField stores it."""
+    field = model._meta.get_field(field_name)
+    return field.to_python(value).quantize(Decimal(1).scaleb(-field.decimal_places))
+
+
+def grade_answer(answer_key, question_id, selected_choice_ids, text_answer=''):
+    """Return (is_correct, points_earned, possible_points) for one answer without touching the DB."""
+    question_key = answer_key[question_id]
+    is_correct, points_earned = Answer.score_selection(
+        question_key.question_type, question_key.points, question_key.correct_choice_ids, selected_choice_ids,
+        text_answer, question_key.accepted_answers
+    )
+    return is_correct, points_earned, question_key.points
+
+
+def apply_grades(answer_key, answers, selected_ids_per_answer):
+    """Set `is_correct` and `points_earned` on unsaved or loaded Answers and return the submission score."""
+    total_points = 0
+    total_possible = 0
+
+    for answer, selected_choice_ids in zip(answers, selected_ids_per_answer):
+        is_correct, points_earned, possible_points = grade_answer(
+            answer_key, answer.question_id, selected_choice_ids, answer.text_answer
+        )
+
+        if points_earned is not None:
+            total_points += points_earned
+        total_possible += possible_points
+
+        answer.is_correct = is_correct
+        answer.points_earned = stored_decimal(Answer, 'points_earned', points_earned or 0)
+
+    if total_possible > 0:
+        score = (total_points / total_possible) * 100
+    else:
+        score = 0
+    return stored_decimal(TestSubmission, 'score', score)
+
+
+def build_answers(answers_data):
+    """Unsaved Answers and their de-duplicated selected choice ids from validated answer dicts."""
+    answers = []
+    selected_ids_per_answer = []
+    for answer_data in answers_data:
+        answers.append(Answer(
+            question_id=answer_data['question_id'],
+            text_answer=answer_data.get('text_answer', ''),
+        ))
+        selected_ids_per_answer.append(list(dict.fromkeys(answer_data.get('selected_choice_ids', []))))
+    return answers, selected_ids_per_answer
+
+
+def save_answers(submission, answers, selected_ids_per_answer):
+    """Insert a submission's answers and their selected choices with two bulk INSERTs."""
+    for answer in answers:
+        answer.submission = submission
+    Answer.objects.bulk_create(answers)
+
+    SelectedChoice = Answer.selected_choices.through
+    SelectedChoice.objects.bulk_create([
+        SelectedChoice(answer_id=answer.id, choice_id=choice_id)
+        for answer, selected_choice_ids in zip(answers, selected_ids_per_answer)
+        for choice_id in selected_choice_ids
+    ])
+
+
+def prefetched(manager, objects):
+    """A queryset of `manager` already holding `objects`, as prefetch_related() leaves it."""
+    queryset = manager.all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    return queryset
+
+
+def remember_answers(submission, answers, selected_ids_per_answer):
+    """
+    Fill the `answers__selected_choices` prefetch caches from the rows just
+    inserted, so serializing the new submission runs no queries.
+    """
+    for answer, selected_choice_ids in zip(answers, selected_ids_per_answer):
+        answer._prefetched_objects_cache = {'selected_choices': prefetched(answer.selected_choices, [
+            Choice(id=choice_id, question_id=answer.question_id) for choice_id in selected_choice_ids
+        ])}
+    submission._prefetched_objects_cache = {'answers': prefetched(submission.answers, answers)}
+
+
+def upsert_answers(submission, answers_data):
+    """
+    Insert or overwrite answers of an in-progress submission without grading
+    them: one INSERT ... ON CONFLICT (submission, question) for the answers,
+    then their selected choices are replaced.
+    """
+    answers, selected_ids_per_answer = build_answers(answers_data)
+    for answer in answers:
+        answer.submission = submission
+    Answer.objects.bulk_create(
+        answers,
+        update_conflicts=True,
+        unique_fields=['submission', 'question'],
+        update_fields=['text_answer'],
+    )
+
+    SelectedChoice = Answer.selected_choices.through
+    SelectedChoice.objects.filter(answer_id__in=[answer.id for answer in answers]).delete()
+    selected_choices = [
+        SelectedChoice(answer_id=answer.id, choice_id=choice_id)
+        for answer, selected_choice_ids in zip(answers, selected_ids_per_answer)
+        for choice_id in selected_choice_ids
+    ]
+    if selected_choices:
+        SelectedChoice.objects.bulk_create(selected_choices)
+    return answers
+
+
+def close_submission(submission):
+    """
+    Move an in-progress submission to `grading` with a conditional UPDATE;
+    returns False when it was already closed by another request.
+    """
+    completed_at = timezone.now()
+    closed = TestSubmission.objects.filter(pk=submission.pk, status='in_progress').update(
+        status='grading', completed_at=completed_at
+    )
+    if closed:
+        submission.status = 'grading'
+        submission.completed_at = completed_at
+    return bool(closed)
+
+
+def complete_session(session, answers_data):
+    """
+    Grade an in-progress submission in memory and close it as `completed`.
+
+    The answers sent with the final submit overwrite the autosaved ones of
+    the same questions. The caller must hold the session row locked, so no
+    autosave lands in between. Besides one read of the autosaved answers
+    this runs the same bulk statements as `create_graded_submission` and
+    one UPDATE of the session; overwritten and autosaved-only answers add
+    a few grouped UPDATEs. Sends `submission_graded` inside the same
+    transaction.
+    """
+    answers, selected_ids_per_answer = build_answers(answers_data)
+    saved = {}
+    for answer_id, question_id, text_answer, choice_id in Answer.objects.filter(submission=session).values_list(
+        'id', 'question_id', 'text_answer', 'selected_choices'
+    ):
+        saved_answer, saved_choice_ids = saved.setdefault(question_id, (
+            Answer(id=answer_id, submission=session, question_id=question_id, text_answer=text_answer), []
+        ))
+        if choice_id is not None:
+            saved_choice_ids.append(choice_id)
+
+    overwritten = []
+    for answer in answers:
+        answer.submission = session
+        if answer.question_id in saved:
+            answer.id = saved.pop(answer.question_id)[0].id
+            overwritten.append(answer)
+    kept = [saved_answer for saved_answer, _ in saved.values()]
+    all_answers = answers + kept
+    all_selected_ids = selected_ids_per_answer + [saved_choice_ids for _, saved_choice_ids in saved.values()]
+    score = apply_grades(get_answer_key(session.test_id), all_answers, all_selected_ids)
+    completed_at = timezone.now()
+
+    SelectedChoice = Answer.selected_choices.through
+    with transaction.atomic():
+        Answer.objects.bulk_create([answer for answer in answers if answer.id is None])
+        if overwritten:
+            SelectedChoice.objects.filter(answer_id__in=[answer.id for answer in overwritten]).delete()
+            update_grouped(Answer, overwritten, ('text_answer', 'is_correct', 'points_earned'))
+        update_grouped(Answer, kept, ('is_correct', 'points_earned'))
+        SelectedChoice.objects.bulk_create([
+            SelectedChoice(answer_id=answer.id, choice_id=choice_id)
+            for answer, selected_choice_ids in zip(answers, selected_ids_per_answer)
+            for choice_id in selected_choice_ids
+        ])
+        TestSubmission.objects.filter(pk=session.pk).update(status='completed', score=score, completed_at=completed_at)
+        session.status, session.score, session.completed_at = 'completed', score, completed_at
+        submission_graded.send(sender=TestSubmission, submission=session, answers=all_answers)
+
+    remember_answers(session, all_answers, all_selected_ids)
+    return session
+
+
+def create_graded_submission(test, student, answers_data, **submission_fields):
+    """
+    Grade a whole submission in memory and persist it with bulk statements.
+
+    `answers_data` is a list of dicts with `question_id`, `selected_choice_ids`
+    and `text_answer`. Grading reads the cached answer key, so regardless of
+    the number of answers this runs one INSERT for the submission, one bulk
+    INSERT for the answers and one bulk INSERT for the selected choices,
+    then sends `submission_graded` inside the same transaction.
+    """
+    answer_key = get_answer_key(test.id)
+    answers, selected_ids_per_answer = build_answers(answers_data)
+    score = apply_grades(answer_key, answers, selected_ids_per_answer)
+
+    with transaction.atomic():
+        submission = TestSubmission.objects.create(test=test, student=student, score=score, **submission_fields)
+        save_answers(submission, answers, selected_ids_per_answer)
+        submission_graded.send(sender=TestSubmission, submission=submission, answers=answers)
+
+    remember_answers(submission, answers, selected_ids_per_answer)
+    return submission
+
+
+def create_pending_submission(test, student, answers_data, **submission_fields):
+    """Persist a submission's raw answers with status `grading`, to be graded by `grade_submissions`."""
+    answers, selected_ids_per_answer = build_answers(answers_data)
+
+    with transaction.atomic():
+        submission = TestSubmission.objects.create(test=test, student=student, status='grading', **submission_fields)
+        save_answers(submission, answers, selected_ids_per_answer)
+
+    return submission
+
+
+def update_grouped(model, objects, fields, **values):
+    """
+    Write `fields` of many rows with one `UPDATE ... WHERE id IN (...)` per
+    distinct combination of values (and per UPDATE_BATCH_SIZE ids). Grades
+    take few distinct values, so this is much cheaper than bulk_update's
+    per-row CASE expressions.
+    """
+    groups = defaultdict(list)
+    for obj in objects:
+        groups[tuple(getattr(obj, field) for field in fields)].append(obj.pk)
+    for group_values, pks in groups.items():
+        for start in range(0, len(pks), UPDATE_BATCH_SIZE):
+            model.objects.filter(pk__in=pks[start:start + UPDATE_BATCH_SIZE]).update(
+                **dict(zip(fields, group_values)), **values
+            )
+
+
+def grade_submissions(submission_ids, from_status='grading', to_status='completed'):
+    """
+    Grade a batch of submissions in `from_status` and move them to `to_status`.
+
+    Safe to run more than once for the same ids: rows are locked with
+    SKIP LOCKED and only those still in `from_status` are touched, so a
+    retried or duplicated task neither grades twice nor blocks on another
+    worker. Runs a fixed number of queries per batch, then sends
+    `submissions_graded` once for the whole batch, so its receivers can also
+    work per batch. Returns the number of submissions graded.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        submissions = list(
+            TestSubmission.objects.select_for_update(skip_locked=True)
+            .filter(id__in=submission_ids, status=from_status)
+            .order_by('id')
+        )
+        if not submissions:
+            return 0
+
+        answers_per_submission = defaultdict(list)
+        answers = list(
+            Answer.objects.filter(submission__in=submissions)
+            .only('id', 'submission_id', 'question_id', 'text_answer')
+            .order_by('id')
+        )
+        for answer in answers:
+            answers_per_submission[answer.submission_id].append(answer)
+
+        selected_ids = defaultdict(list)
+        SelectedChoice = Answer.selected_choices.through
+        for answer_id, choice_id in SelectedChoice.objects.filter(answer__submission__in=submissions).values_list(
+            'answer_id', 'choice_id'
+        ):
+            selected_ids[answer_id].append(choice_id)
+
+        for submission in submissions:
+            submission_answers = answers_per_submission[submission.id]
+            submission.score = apply_grades(
+                get_answer_key(submission.test_id),
+                submission_answers,
+                [selected_ids[answer.id] for answer in submission_answers]
+            )
+            submission.status = to_status
+            if submission.completed_at is None:
+                submission.completed_at = min(now, submission.expires_at) if submission.expires_at else now
+
+        update_grouped(Answer, answers, ('is_correct', 'points_earned'))
+        update_grouped(TestSubmission, submissions, ('score',), status=to_status, completed_at=Coalesce(
+            'completed_at', Least('expires_at', Value(now)), Value(now)
+        ))
+
+        submissions_graded.send(sender=TestSubmission, graded=[
+            (submission, answers_per_submission[submission.id]) for submission in submissions
+        ])
+
+    return len(submissions)
+
+
+def time_out_submissions(submission_ids):
+    """Grade in-progress submissions that ran past their deadline and close them as `timed_out`."""
+    return grade_submissions(submission_ids, from_status='in_progress', to_status='timed_out')
+
+
+def sweep_expired_submissions(batch_size=None, now=None):
+    """
+    Find in-progress sessions past their deadline (plus grace) with a range
+    scan of the partial `submission_open_expiry_idx` index, then grade and
+    close them as `timed_out`, one transaction per batch. Returns the number
+    of submissions closed.
+    """
+    batch_size = batch_size or settings.TIMEOUT_SWEEP_BATCH_SIZE
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.SUBMISSION_GRACE_SECONDS)
+    expired = TestSubmission.objects.filter(status='in_progress', expires_at__lt=cutoff).order_by('expires_at')
+
+    closed = 0
+    while True:
+        submission_ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not submission_ids:
+            break
+        graded = time_out_submissions(submission_ids)
+        if not graded:
+            # Every row of the batch is being closed by another sweeper or request.
+            break
+        closed += graded
+    return closed
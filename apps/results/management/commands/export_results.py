@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from apps.tests.models import Test
+from apps.results.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, iter_results
+
+
+class Command(BaseCommand):
+    help = 'Stream every submission of a test with its answers as CSV or NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('test_id', type=int)
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', dest='export_format')
+        parser.add_argument('--output', '-o', help='Write to this file instead of stdout.')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Rows fetched per database round trip.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias to read from, e.g. replica.')
+
+    def handle(self, *args, **options):
+        if not Test.objects.using(options['database']).filter(pk=options['test_id']).exists():
+            raise CommandError(f'Test {options["test_id"]} does not exist.')
+
+        chunks = iter_results(options['test_id'], options['export_format'], options['chunk_size'], options['database'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f'Exported results of test {options["test_id"]} to {options["output"]}.'))
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.results.grading import sweep_expired_submissions
+
+
+class Command(BaseCommand):
+    help = 'Grade and close in-progress submissions past their deadline as timed_out.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.TIMEOUT_SWEEP_BATCH_SIZE,
+            help='Submissions graded per transaction.'
+        )
+
+    def handle(self, *args, **options):
+        closed = sweep_expired_submissions(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Closed {closed} expired submissions.'))
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.8 on 2026-10-18 02:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("results", "0001_initial"),
+        ("tests", "0002_keyset_pagination_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="testsubmission",
+            index=models.Index(
+                fields=["student", "id"], name="submission_student_id_idx"
+            ),
+        ),
+    ]
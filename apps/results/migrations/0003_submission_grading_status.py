@@ -0,0 +1,27 @@
+# Generated by Django 5.0.8 on 2026-10-18 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("results", "0002_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="testsubmission",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("in_progress", "In Progress"),
+                    ("grading", "Grading"),
+                    ("completed", "Completed"),
+                    ("timed_out", "Timed Out"),
+                ],
+                default="in_progress",
+                max_length=20,
+            ),
+        ),
+    ]
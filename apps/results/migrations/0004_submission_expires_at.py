@@ -0,0 +1,54 @@
+# Generated by Django 5.0.8 on 2026-10-18 03:14
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_open_session_deadlines(apps, schema_editor):
+    TestSubmission = apps.get_model("results", "TestSubmission")
+    sessions = (
+        TestSubmission.objects.filter(status="in_progress", test__time_limit__gt=0)
+        .select_related("test")
+        .only("id", "started_at", "test__time_limit")
+    )
+    batch = []
+    for submission in sessions.iterator(chunk_size=2000):
+        submission.expires_at = submission.started_at + timedelta(
+            minutes=submission.test.time_limit
+        )
+        batch.append(submission)
+        if len(batch) == 2000:
+            TestSubmission.objects.bulk_update(batch, ["expires_at"])
+            batch = []
+    if batch:
+        TestSubmission.objects.bulk_update(batch, ["expires_at"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("results", "0003_submission_grading_status"),
+        ("tests", "0003_question_accepted_answers"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="testsubmission",
+            name="expires_at",
+            field=models.DateTimeField(
+                blank=True, help_text="Deadline of an in-progress session", null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="testsubmission",
+            index=models.Index(
+                condition=models.Q(("status", "in_progress")),
+                fields=["expires_at"],
+                name="submission_open_expiry_idx",
+            ),
+        ),
+        migrations.RunPython(set_open_session_deadlines, migrations.RunPython.noop),
+    ]
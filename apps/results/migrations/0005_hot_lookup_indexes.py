@@ -0,0 +1,42 @@
+# Generated by Django 5.0.8 on 2026-10-18 03:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("results", "0004_submission_expires_at"),
+        ("tests", "0004_hot_lookup_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="answer",
+            index=models.Index(
+                fields=["question", "is_correct"], name="answer_question_correct_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="testsubmission",
+            index=models.Index(
+                fields=["test", "status"], name="submission_test_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="testsubmission",
+            index=models.Index(
+                fields=["student", "status"], name="submission_student_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="testsubmission",
+            index=models.Index(
+                condition=models.Q(("status", "grading")),
+                fields=["id"],
+                name="submission_grading_idx",
+            ),
+        ),
+    ]
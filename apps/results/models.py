@@ -1,10 +1,14 @@
+from datetime import timedelta
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from apps.tests.models import Test, Question, Choice
+from apps.tests.answer_key import normalize_text_answer
 
 class TestSubmission(models.Model):
     STATUS_CHOICES = (
         ('in_progress', 'In Progress'),
+        ('grading', 'Grading'),
         ('completed', 'Completed'),
         ('timed_out', 'Timed Out'),
     )
@@ -15,13 +19,34 @@ class TestSubmission(models.Model):
     completed_at = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
     score = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, help_text="Deadline of an in-progress session")
     
     class Meta:
         unique_together = ['test', 'student']
+        indexes = [
+            models.Index(fields=['student', 'id'], name='submission_student_id_idx'),
+            models.Index(fields=['test', 'status'], name='submission_test_status_idx'),
+            models.Index(fields=['student', 'status'], name='submission_student_status_idx'),
+            models.Index(
+                fields=['expires_at'], name='submission_open_expiry_idx',
+                condition=models.Q(status='in_progress')
+            ),
+            models.Index(
+                fields=['id'], name='submission_grading_idx',
+                condition=models.Q(status='grading')
+            ),
+        ]
     
     def __str__(self):
         return f"{self.student.email} - {self.test.title}"
     
+    def is_expired(self, now=None):
+        """True once the session is past its deadline plus SUBMISSION_GRACE_SECONDS."""
+        if self.expires_at is None:
+            return False
+        now = now or timezone.now()
+        return now > self.expires_at + timedelta(seconds=settings.SUBMISSION_GRACE_SECONDS)
+    
     @property
     def total_points(self):
         return self.test.questions.aggregate(total=models.Sum('points'))['total'] or 0
@@ -36,34 +61,74 @@ class Answer(models.Model):
     
     class Meta:
         unique_together = ['submission', 'question']
+        indexes = [
+            models.Index(fields=['question', 'is_correct'], name='answer_question_correct_idx'),
+        ]
     
     def __str__(self):
         return f"Answer for {self.question}"
     
-    def calculate_score(self):
-        if self.question.question_type == 'text':
-            return None
+    @property
+    def selected_choice_ids(self):
+        return [choice.id for choice in self.selected_choices.all()]
+    
+    @staticmethod
+    def score_selection(question_type, points, correct_choice_ids, selected_choice_ids,
+                        text_answer='', accepted_answers=frozenset()):
+        """
+        Return (is_correct, points_earned) for a set of selected choice IDs, or
+        for a text answer against normalized accepted answers. Text questions
+        without accepted answers are left ungraded: (None, None).
+        """
+        if question_type == 'text':
+            if not accepted_answers:
+                return None, None
+            is_correct = normalize_text_answer(text_answer) in accepted_answers
+            return is_correct, points if is_correct else 0
+        
+        selected = set(selected_choice_ids)
+        is_correct = None
+        points_earned = 0
         
-        if self.question.question_type == 'single_choice':
-            if self.selected_choices.count() != 1:
-                self.is_correct = False
-                self.points_earned = 0
+        if question_type == 'single_choice':
+            if len(selected) != 1:
+                is_correct = False
+                points_earned = 0
             else:
-                self.is_correct = self.selected_choices.first().is_correct
-                self.points_earned = self.question.points if self.is_correct else 0
+                is_correct = selected <= correct_choice_ids
+                points_earned = points if is_correct else 0
         
-        elif self.question.question_type == 'multiple_choice':
-            correct_choices = self.question.choices.filter(is_correct=True)
-            selected_correct = self.selected_choices.filter(is_correct=True).count()
-            selected_incorrect = self.selected_choices.filter(is_correct=False).count()
+        elif question_type == 'multiple_choice':
+            correct_count = len(correct_choice_ids)
+            selected_correct = len(selected & correct_choice_ids)
+            selected_incorrect = len(selected - correct_choice_ids)
             
-            if selected_incorrect == 0 and selected_correct == correct_choices.count():
-                self.is_correct = True
-                self.points_earned = self.question.points
+            if selected_incorrect == 0 and selected_correct == correct_count:
+                is_correct = True
+                points_earned = points
             else:
-                self.is_correct = False
-                ratio = selected_correct / correct_choices.count() if correct_choices.count() > 0 else 0
-                self.points_earned = self.question.points * ratio if selected_incorrect == 0 else 0
+                is_correct = False
+                ratio = selected_correct / correct_count if correct_count > 0 else 0
+                points_earned = points * ratio if selected_incorrect == 0 else 0
+        
+        return is_correct, points_earned
+    
+    def calculate_score(self):
+        if self.question.question_type == 'text':
+            accepted_answers = frozenset(normalize_text_answer(answer) for answer in self.question.accepted_answers)
+            self.is_correct, self.points_earned = self.score_selection(
+                'text', self.question.points, frozenset(), (), self.text_answer, accepted_answers
+            )
+            if self.is_correct is None:
+                return None
+            self.save()
+            return self.points_earned
+        
+        correct_choice_ids = set(self.question.choices.filter(is_correct=True).values_list('id', flat=True))
+        selected_choice_ids = self.selected_choices.values_list('id', flat=True)
+        self.is_correct, self.points_earned = self.score_selection(
+            self.question.question_type, self.question.points, correct_choice_ids, selected_choice_ids
+        )
         
         self.save()
         return self.points_earned
\ No newline at end of file
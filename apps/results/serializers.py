@@ -1,82 +1,154 @@
 from rest_framework import serializers
+from rest_framework.exceptions import NotFound
 from .models import TestSubmission, Answer
-from apps.tests.models import Question, Choice
+from .grading import complete_session, create_graded_submission, create_pending_submission, upsert_answers
+from .tasks import grade_or_queue, finish_submission
+from apps.tests.answer_key import get_answer_key
+from apps.tests.models import Test
+from django.conf import settings
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from django.utils import timezone
 
+def validate_answer(answer_key, answer, partial=False):
+    """
+    Check one answer against the test's answer key; returns a dict of errors.
+    `partial` accepts an empty answer, so autosave can clear a question.
+    """
+    question_key = answer_key.get(answer['question_id'])
+    selected_choice_ids = answer.get('selected_choice_ids', [])
+    text_answer = answer.get('text_answer', '')
+    
+    if question_key is None:
+        return {"question_id": "Question does not belong to this test."}
+    
+    if question_key.question_type == 'text' and not text_answer and not partial:
+        return {"text_answer": "Text answer is required for this question type."}
+    
+    if question_key.question_type in ['single_choice', 'multiple_choice'] and not selected_choice_ids and not partial:
+        return {"selected_choice_ids": "At least one choice must be selected."}
+    
+    if question_key.question_type == 'single_choice' and len(set(selected_choice_ids)) > 1:
+        return {"selected_choice_ids": "Only one choice can be selected for this question type."}
+    
+    if not question_key.choice_ids.issuperset(selected_choice_ids):
+        return {"selected_choice_ids": "Selected choice does not belong to the question."}
+    
+    return {}
+
 class AnswerSerializer(serializers.ModelSerializer):
-    question_id = serializers.PrimaryKeyRelatedField(
-        source='question', queryset=Question.objects.all()
-    )
-    selected_choice_ids = serializers.PrimaryKeyRelatedField(
-        source='selected_choices', queryset=Choice.objects.all(), many=True, required=False
+    question_id = serializers.IntegerField()
+    selected_choice_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False
     )
     
     class Meta:
         model = Answer
         fields = ('id', 'question_id', 'selected_choice_ids', 'text_answer')
+
+class AnswerSaveSerializer(AnswerSerializer):
+    """One autosaved answer of the in-progress submission passed in the context."""
     
     def validate(self, attrs):
-        question = attrs.get('question')
-        selected_choices = attrs.get('selected_choices', [])
-        text_answer = attrs.get('text_answer', '')
-        
-        if question.question_type == 'text' and not text_answer:
-            raise serializers.ValidationError({"text_answer": "Text answer is required for this question type."})
-        
-        if question.question_type in ['single_choice', 'multiple_choice'] and not selected_choices:
-            raise serializers.ValidationError({"selected_choice_ids": "At least one choice must be selected."})
-        
-        if question.question_type == 'single_choice' and len(selected_choices) > 1:
-            raise serializers.ValidationError({"selected_choice_ids": "Only one choice can be selected for this question type."})
-        
-        for choice in selected_choices:
-            if choice.question.id != question.id:
-                raise serializers.ValidationError({"selected_choice_ids": "Selected choice does not belong to the question."})
-        
+        errors = validate_answer(get_answer_key(self.context['submission'].test_id), attrs, partial=True)
+        if errors:
+            raise serializers.ValidationError(errors)
         return attrs
 
+class SubmittedTestField(serializers.PrimaryKeyRelatedField):
+    """The test being submitted; an unknown id is a 404, not a validation error."""
+    
+    def to_internal_value(self, data):
+        try:
+            return super().to_internal_value(data)
+        except serializers.ValidationError as error:
+            if error.get_codes() == ['does_not_exist']:
+                raise NotFound
+            raise
+
 class SubmissionCreateSerializer(serializers.ModelSerializer):
+    test = SubmittedTestField(queryset=Test.objects.all())
     answers = AnswerSerializer(many=True)
     
     class Meta:
         model = TestSubmission
         fields = ('id', 'test', 'answers')
     
+    def validate(self, attrs):
+        answer_key = get_answer_key(attrs['test'].id)
+        
+        errors = [validate_answer(answer_key, answer) for answer in attrs['answers']]
+        
+        seen_question_ids = set()
+        for index, answer in enumerate(attrs['answers']):
+            if answer['question_id'] in seen_question_ids and not errors[index]:
+                errors[index] = {"question_id": "Question is answered more than once."}
+            seen_question_ids.add(answer['question_id'])
+        
+        if any(errors):
+            raise serializers.ValidationError({"answers": errors})
+        
+        return attrs
+    
     def create(self, validated_data):
         answers_data = validated_data.pop('answers')
         student = self.context['request'].user
         
-        submission = TestSubmission.objects.create(
+        if 'session' in validated_data:
+            # Passed by the view, which already looked the submission up.
+            session = validated_data.pop('session')
+        else:
+            session = TestSubmission.objects.filter(
+                test=validated_data['test'], student=student, status='in_progress'
+            ).first()
+        if session is None and validated_data['test'].time_limit:
+            # The deadline runs from the session opened by POST /tests/{id}/start/;
+            # without one a timed test could be submitted at any time.
+            raise serializers.ValidationError(
+                {"detail": "Start this test before submitting it; it has a time limit."}
+            )
+        if session is not None and settings.GRADING_MODE == 'sync' and not session.is_expired():
+            # Graded in memory like a direct submit; the view holds the session locked.
+            return complete_session(session, answers_data)
+        if session is not None:
+            # Answers sent with the final submit overwrite the autosaved ones,
+            # unless they arrive after the deadline.
+            with transaction.atomic():
+                if not session.is_expired():
+                    upsert_answers(session, answers_data)
+                finish_submission(session)
+            session.refresh_from_db(fields=['status', 'score', 'completed_at'])
+            prefetch_related_objects([session], 'answers__selected_choices')
+            return session
+        
+        if settings.GRADING_MODE == 'async':
+            submission = create_pending_submission(
+                student=student,
+                answers_data=answers_data,
+                completed_at=timezone.now(),
+                **validated_data
+            )
+            grade_or_queue([submission.id])
+            return submission
+        
+        return create_graded_submission(
             student=student,
+            answers_data=answers_data,
             status='completed',
             completed_at=timezone.now(),
             **validated_data
         )
-        
-        total_points = 0
-        total_possible = 0
-        
-        for answer_data in answers_data:
-            selected_choices = answer_data.pop('selected_choices', [])
-            answer = Answer.objects.create(submission=submission, **answer_data)
-            answer.selected_choices.set(selected_choices)
-            
-            points = answer.calculate_score()
-            if points is not None:
-                total_points += points
-            
-            total_possible += answer.question.points
-        
-        if total_possible > 0:
-            submission.score = (total_points / total_possible) * 100
-        else:
-            submission.score = 0
-        
-        submission.save()
-        return submission
+
+class SubmissionSessionSerializer(serializers.ModelSerializer):
+    answers = AnswerSerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = TestSubmission
+        fields = ('id', 'test', 'started_at', 'expires_at', 'status', 'answers')
+        read_only_fields = fields
 
 class SubmissionDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = TestSubmission
         fields = ('id', 'test', 'started_at', 'completed_at', 'status', 'score')
-        read_only_fields = fields
\ No newline at end of file
+        read_only_fields = fields
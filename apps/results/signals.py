@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# Sent inside the grading transaction with `submission` and its graded `answers`.
+submission_graded = Signal()
+
+# Sent once per grading batch with `graded`, a list of (submission, answers) pairs.
+submissions_graded = Signal()
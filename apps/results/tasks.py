@@ -0,0 +1,73 @@
+from functools import partial
+from celery import shared_task
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from .grading import grade_submissions, close_submission, time_out_submissions, sweep_expired_submissions as sweep
+from .models import TestSubmission
+
+
+@shared_task(
+    bind=True,
+    acks_late=True,
+    autoretry_for=(DatabaseError,),
+    retry_backoff=True,
+    retry_backoff_max=300,
+    max_retries=5,
+)
+def grade_submission_batch(self, submission_ids):
+    """Grade submissions in `grading` status; retries are idempotent, see `grade_submissions`."""
+    return grade_submissions(submission_ids)
+
+
+@shared_task
+def grade_pending_submissions():
+    """
+    Periodic safety net: queue every submission still waiting in `grading`
+    (a lost message, a worker that died past its retries) in batches of
+    GRADING_BATCH_SIZE.
+    """
+    pending_ids = TestSubmission.objects.filter(status='grading').order_by('id').values_list('id', flat=True)
+    batch = []
+    queued = 0
+    for submission_id in pending_ids.iterator(chunk_size=settings.GRADING_BATCH_SIZE):
+        batch.append(submission_id)
+        if len(batch) == settings.GRADING_BATCH_SIZE:
+            grade_submission_batch.delay(batch)
+            queued += len(batch)
+            batch = []
+    if batch:
+        grade_submission_batch.delay(batch)
+        queued += len(batch)
+    return queued
+
+
+@shared_task(acks_late=True, autoretry_for=(DatabaseError,), retry_backoff=True, max_retries=3)
+def sweep_expired_submissions():
+    """Periodic: grade and close sessions past their deadline as `timed_out`."""
+    return sweep()
+
+
+def grade_or_queue(submission_ids):
+    """
+    Grade submissions in `grading` status now, or with GRADING_MODE=async
+    queue them for the worker once the current transaction commits.
+    """
+    if settings.GRADING_MODE == 'async':
+        transaction.on_commit(partial(grade_submission_batch.delay, list(submission_ids)))
+        return 0
+    return grade_submissions(submission_ids)
+
+
+def finish_submission(submission):
+    """
+    Close an in-progress submission. Past its deadline it is graded right
+    away as `timed_out`; otherwise it is graded or queued like any submit.
+    Returns False when the submission was already closed.
+    """
+    if submission.is_expired():
+        return bool(time_out_submissions([submission.id]))
+    with transaction.atomic():
+        if not close_submission(submission):
+            return False
+        grade_or_queue([submission.id])
+    return True
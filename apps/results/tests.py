@@ -1,10 +1,29 @@
+import csv
+import io
+import json
 import pytest
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from decimal import Decimal
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
 from apps.tests.models import Test, Question, Choice
 from .models import TestSubmission, Answer
+from .exports import iter_results
+from .grading import grade_submissions, sweep_expired_submissions
+from .tasks import grade_pending_submissions
+from apps.stats.aggregates import rebuild_test_stats
+from apps.common import asyncviews
+from apps.users.serializers import ClaimsTokenObtainPairSerializer
+from config.celery import app as celery_app
 
 User = get_user_model()
 
@@ -67,7 +86,7 @@ def test_submit_test(api_client, setup_test_with_questions):
     test = data['test']
     questions = data['questions']
     
-    api_client.force_authenticate(user=student)
+    open_session(api_client, student, test)
     url = reverse('submission-list')
     
     # Get all choices for the questions
@@ -132,4 +151,537 @@ def test_cannot_submit_twice(api_client, setup_test_with_questions):
     
     response = api_client.post(url, payload, format='json')
     assert response.status_code == status.HTTP_400_BAD_REQUEST
-    assert 'already completed' in response.data['detail']
\ No newline at end of file
+    assert 'already completed' in response.data['detail']
+
+@pytest.mark.django_db
+def test_bulk_grading_matches_calculate_score(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    student = data['student']
+    test = data['test']
+    questions = data['questions']
+    
+    open_session(api_client, student, test)
+    url = reverse('submission-list')
+    
+    wrong_q1_choice = Choice.objects.filter(question=questions[0], is_correct=False).first()
+    partial_q2_choices = list(
+        Choice.objects.filter(question=questions[1], is_correct=True).values_list('id', flat=True)[:2]
+    )
+    
+    payload = {
+        'test': test.id,
+        'answers': [
+            {
+                'question_id': questions[0].id,
+                'selected_choice_ids': [wrong_q1_choice.id]
+            },
+            {
+                'question_id': questions[1].id,
+                'selected_choice_ids': partial_q2_choices
+            }
+        ]
+    }
+    
+    response = api_client.post(url, payload, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    
+    submission = TestSubmission.objects.get(test=test, student=student)
+    graded = {answer.question_id: (answer.is_correct, answer.points_earned) for answer in submission.answers.all()}
+    assert graded[questions[0].id] == (False, 0)
+    assert graded[questions[1].id][0] is False
+    assert float(submission.score) == pytest.approx(100 * (10 * 2 / 3) / 15, abs=0.01)
+    
+    for answer in submission.answers.all():
+        answer.calculate_score()
+        answer.refresh_from_db()
+        assert (answer.is_correct, answer.points_earned) == graded[answer.question_id]
+
+
+def create_quiz(question_count, time_limit=0):
+    """A test of single-choice questions and the all-correct answers to it."""
+    test = Test.objects.create(
+        title=f'Quiz with {question_count} questions',
+        subject='Mathematics',
+        created_by=User.objects.filter(role='teacher').first(),
+        time_limit=time_limit
+    )
+    answers = []
+    for index in range(question_count):
+        question = Question.objects.create(
+            test=test, text=f'Question {index}', question_type='single_choice', points=1
+        )
+        Choice.objects.create(question=question, text='wrong', is_correct=False)
+        correct = Choice.objects.create(question=question, text='right', is_correct=True)
+        answers.append({'question_id': question.id, 'selected_choice_ids': [correct.id]})
+    return test, answers
+
+def submit_all_correct(api_client, student, question_count):
+    test, answers = create_quiz(question_count)
+    api_client.force_authenticate(user=student)
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.post(reverse('submission-list'), {'test': test.id, 'answers': answers}, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    return len(queries)
+
+@pytest.mark.django_db
+def test_submit_query_count_is_constant(api_client, setup_test_with_questions):
+    student = setup_test_with_questions['student']
+    other_student = User.objects.create_user(
+        email='other@example.com',
+        password='testpass123',
+        role='student'
+    )
+    
+    assert submit_all_correct(api_client, student, 2) == submit_all_correct(api_client, other_student, 40)
+
+# Completing an open session grades in memory too, so it shares the budget.
+SUBMIT_QUERY_BUDGET = 8
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('question_count', [1, 10, 50])
+@pytest.mark.parametrize('time_limit', [0, 30])
+def test_submit_stays_within_query_budget(api_client, setup_test_with_questions, query_budget, question_count, time_limit):
+    test, answers = create_quiz(question_count, time_limit)
+    url = reverse('submission-list')
+    start_url = reverse('test-start', kwargs={'pk': test.id})
+    other_student = User.objects.create_user(email='other@example.com', password='testpass123', role='student')
+    # Mid-exam: the answer key is cached and the stats are materialized.
+    rebuild_test_stats(test.id)
+    for student in (setup_test_with_questions['student'], other_student):
+        api_client.force_authenticate(user=student)
+        if time_limit:
+            # A timed test is submitted from the session opened at its start.
+            api_client.post(start_url)
+    api_client.force_authenticate(user=setup_test_with_questions['student'])
+    api_client.post(url, {'test': test.id, 'answers': answers}, format='json')
+    
+    api_client.force_authenticate(user=other_student)
+    with query_budget(SUBMIT_QUERY_BUDGET):
+        response = api_client.post(url, {'test': test.id, 'answers': answers}, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert len(response.data['answers']) == question_count
+
+@pytest.mark.django_db
+def test_cannot_answer_question_from_another_test(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    other_test = Test.objects.create(title='History Quiz', subject='History', created_by=data['teacher'])
+    foreign_question = Question.objects.create(
+        test=other_test, text='Year?', question_type='single_choice', points=1
+    )
+    foreign_choice = Choice.objects.create(question=foreign_question, text='1492', is_correct=True)
+    
+    api_client.force_authenticate(user=data['student'])
+    payload = {
+        'test': data['test'].id,
+        'answers': [
+            {
+                'question_id': foreign_question.id,
+                'selected_choice_ids': [foreign_choice.id]
+            }
+        ]
+    }
+    
+    response = api_client.post(reverse('submission-list'), payload, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not TestSubmission.objects.filter(student=data['student']).exists()
+
+@pytest.mark.django_db
+def test_submitting_an_unknown_test_is_not_found(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    api_client.force_authenticate(user=data['student'])
+    
+    response = api_client.post(reverse('submission-list'), {'test': data['test'].id + 1000, 'answers': []}, format='json')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert not TestSubmission.objects.exists()
+
+def submit_for(api_client, student, test, answers):
+    open_session(api_client, student, test)
+    response = api_client.post(reverse('submission-list'), {'test': test.id, 'answers': answers}, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.data['id']
+
+@pytest.fixture
+def submitted_results(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    q1, q2 = data['questions']
+    q1_correct = q1.choices.get(is_correct=True)
+    q2_choices = list(q2.choices.filter(is_correct=True).values_list('id', flat=True))
+    
+    submit_for(api_client, data['student'], data['test'], [
+        {'question_id': q1.id, 'selected_choice_ids': [q1_correct.id]},
+        {'question_id': q2.id, 'selected_choice_ids': q2_choices},
+    ])
+    other_student = User.objects.create_user(email='other@example.com', password='testpass123', role='student')
+    submit_for(api_client, other_student, data['test'], [
+        {'question_id': q1.id, 'selected_choice_ids': [q1_correct.id]},
+    ])
+    TestSubmission.objects.create(test=data['test'], student=User.objects.create_user(
+        email='late@example.com', password='testpass123', role='student'
+    ))
+    return data
+
+@pytest.mark.django_db
+def test_export_results_ndjson(api_client, submitted_results):
+    data = submitted_results
+    api_client.force_authenticate(user=data['teacher'])
+    url = reverse('test-results-export', args=[data['test'].id])
+    
+    response = api_client.get(url, {'export_format': 'ndjson'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.streaming
+    assert response['Content-Type'] == 'application/x-ndjson'
+    
+    lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+    assert [line['student_email'] for line in lines] == ['student@example.com', 'other@example.com', 'late@example.com']
+    assert [len(line['answers']) for line in lines] == [2, 1, 0]
+    assert lines[0]['score'] == '100.00'
+    assert lines[0]['answers'][1]['selected_choice_ids'] == sorted(
+        data['questions'][1].choices.filter(is_correct=True).values_list('id', flat=True)
+    )
+
+@pytest.mark.django_db
+def test_export_results_csv_streams_one_row_per_answer(api_client, submitted_results):
+    data = submitted_results
+    api_client.force_authenticate(user=data['teacher'])
+    url = reverse('test-results-export', args=[data['test'].id])
+    
+    response = api_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+    assert len(rows) == 4
+    assert [row['student_email'] for row in rows] == [
+        'student@example.com', 'student@example.com', 'other@example.com', 'late@example.com'
+    ]
+    assert rows[-1]['question_id'] == ''
+    
+    api_client.force_authenticate(user=data['student'])
+    assert api_client.get(url).status_code == status.HTTP_403_FORBIDDEN
+
+@pytest.mark.django_db
+def test_export_results_streams_under_asgi(api_client, submitted_results, monkeypatch):
+    data = submitted_results
+    url = reverse('test-results-export', args=[data['test'].id])
+    token = ClaimsTokenObtainPairSerializer.get_token(data['teacher']).access_token
+    api_client.force_authenticate(user=data['teacher'])
+    expected = b''.join(api_client.get(url).streaming_content)
+    monkeypatch.setattr(asyncviews, 'STREAM_BATCH_BYTES', 1)
+    
+    async def export():
+        response = await AsyncClient().get(url, headers={'Authorization': f'Bearer {token}'})
+        return response, [chunk async for chunk in response.streaming_content]
+    
+    response, chunks = async_to_sync(export)()
+    # An async iterator, which Django's ASGI handler sends as it goes.
+    assert response.is_async
+    assert len(chunks) > 1
+    assert b''.join(chunks) == expected
+
+@pytest.mark.django_db
+def test_export_results_query_count_does_not_grow_with_answers(submitted_results):
+    test = submitted_results['test']
+    with CaptureQueriesContext(connection) as queries:
+        output = ''.join(iter_results(test.id, 'ndjson', chunk_size=1))
+    assert output.count('\n') == 3
+    # One query per chunk of submissions and one per chunk of answers plus its prefetch.
+    assert len(queries) <= 3 * 2 + 3 * 2 + 2
+
+@pytest.mark.django_db
+def test_export_results_command(submitted_results, tmp_path):
+    test = submitted_results['test']
+    output = io.StringIO()
+    call_command('export_results', test.id, '--format', 'ndjson', stdout=output)
+    assert len(output.getvalue().splitlines()) == 3
+    
+    path = tmp_path / 'results.csv'
+    call_command('export_results', test.id, '--output', str(path), stderr=io.StringIO())
+    assert len(path.read_text().splitlines()) == 5
+    
+    with pytest.raises(CommandError):
+        call_command('export_results', test.id + 100)
+
+@pytest.fixture
+def async_grading(settings):
+    settings.GRADING_MODE = 'async'
+    # Settings are read with the CELERY_ namespace, so override the namespaced key.
+    always_eager = celery_app.conf.task_always_eager
+    celery_app.conf.update(CELERY_TASK_ALWAYS_EAGER=True)
+    yield
+    celery_app.conf.update(CELERY_TASK_ALWAYS_EAGER=always_eager)
+
+def correct_answers(questions):
+    q1, q2 = questions
+    return [
+        {'question_id': q1.id, 'selected_choice_ids': [q1.choices.get(is_correct=True).id]},
+        {'question_id': q2.id, 'selected_choice_ids': list(q2.choices.filter(is_correct=True).values_list('id', flat=True))},
+    ]
+
+@pytest.mark.django_db
+def test_async_submit_returns_202_and_worker_completes_it(
+    api_client, setup_test_with_questions, async_grading, django_capture_on_commit_callbacks
+):
+    data = setup_test_with_questions
+    open_session(api_client, data['student'], data['test'])
+    payload = {'test': data['test'].id, 'answers': correct_answers(data['questions'])}
+    
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post(reverse('submission-list'), payload, format='json')
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.data['status'] == 'grading'
+    
+    poll = api_client.get(response['Location'])
+    assert poll.status_code == status.HTTP_200_OK
+    assert poll.data['status'] == 'completed'
+    assert poll.data['score'] == '100.00'
+    assert 'Retry-After' not in poll
+    
+    response = api_client.post(reverse('submission-list'), payload, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+@pytest.mark.django_db
+def test_grading_is_idempotent_and_pending_submissions_are_swept(api_client, setup_test_with_questions, async_grading):
+    data = setup_test_with_questions
+    open_session(api_client, data['student'], data['test'])
+    payload = {'test': data['test'].id, 'answers': correct_answers(data['questions'])}
+    
+    # Without running on_commit callbacks the task is never queued, as if the message were lost.
+    response = api_client.post(reverse('submission-list'), payload, format='json')
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    poll = api_client.get(reverse('submission-grading-status', args=[response.data['id']]))
+    assert poll.data['status'] == 'grading'
+    assert poll['Retry-After'] == '2'
+    
+    assert grade_pending_submissions.delay().get() == 1
+    submission = TestSubmission.objects.get(pk=response.data['id'])
+    assert (submission.status, submission.score) == ('completed', Decimal('100.00'))
+    assert list(submission.answers.values_list('is_correct', flat=True)) == [True, True]
+    
+    assert grade_submissions([submission.id]) == 0
+    assert grade_pending_submissions.delay().get() == 0
+
+@pytest.mark.django_db
+def test_text_answers_are_graded_against_accepted_answers(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    text_question = Question.objects.create(
+        test=data['test'], text='Capital of France?', question_type='text', points=5,
+        accepted_answers=['Paris', 'Paris, France']
+    )
+    q1 = data['questions'][0]
+    open_session(api_client, data['student'], data['test'])
+    payload = {
+        'test': data['test'].id,
+        'answers': [
+            {'question_id': q1.id, 'selected_choice_ids': [q1.choices.get(is_correct=True).id]},
+            {'question_id': text_question.id, 'text_answer': '  PARIS '},
+        ]
+    }
+    
+    response = api_client.post(reverse('submission-list'), payload, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    submission = TestSubmission.objects.get(pk=response.data['id'])
+    answer = submission.answers.get(question=text_question)
+    assert (answer.is_correct, answer.points_earned) == (True, Decimal('5.00'))
+    assert submission.score == Decimal('100.00')
+    
+    answer.text_answer = 'Lyon'
+    assert answer.calculate_score() == 0
+    assert answer.is_correct is False
+
+@pytest.mark.django_db
+def test_exam_session_autosave_and_final_submit(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    q1, q2 = data['questions']
+    q2_correct = list(q2.choices.filter(is_correct=True).values_list('id', flat=True))
+    api_client.force_authenticate(user=data['student'])
+    start_url = reverse('test-start', kwargs={'pk': data['test'].id})
+    
+    response = api_client.post(start_url)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert (response.data['status'], response.data['answers']) == ('in_progress', [])
+    submission_id = response.data['id']
+    answers_url = reverse('submission-save-answer', args=[submission_id])
+    
+    response = api_client.patch(answers_url, {'question_id': q2.id, 'selected_choice_ids': q2_correct[:1]}, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    answer_id = response.data['id']
+    
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.patch(answers_url, {'question_id': q2.id, 'selected_choice_ids': q2_correct}, format='json')
+    assert response.data['id'] == answer_id
+    # Lock the submission, upsert the answer, replace its selected choices.
+    statements = [query['sql'] for query in queries.captured_queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+    assert len(statements) == 4
+    
+    api_client.patch(answers_url, {'question_id': q1.id, 'selected_choice_ids': [q1.choices.get(is_correct=True).id]}, format='json')
+    assert Answer.objects.get(pk=answer_id).is_correct is None
+    
+    # Resuming after a crash returns the saved answers instead of a new session.
+    response = api_client.post(start_url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['id'] == submission_id
+    assert {answer['question_id']: sorted(answer['selected_choice_ids']) for answer in response.data['answers']}[q2.id] == sorted(q2_correct)
+    
+    response = api_client.post(reverse('submission-submit', args=[submission_id]))
+    assert response.status_code == status.HTTP_200_OK
+    assert (response.data['status'], response.data['score']) == ('completed', '100.00')
+    
+    assert api_client.patch(answers_url, {'question_id': q1.id, 'selected_choice_ids': []}, format='json').status_code == status.HTTP_400_BAD_REQUEST
+    assert api_client.post(reverse('submission-submit', args=[submission_id])).status_code == status.HTTP_400_BAD_REQUEST
+    assert api_client.post(start_url).status_code == status.HTTP_400_BAD_REQUEST
+
+@pytest.mark.django_db
+def test_full_submit_fills_the_open_session(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    q1, q2 = data['questions']
+    api_client.force_authenticate(user=data['student'])
+    submission_id = api_client.post(reverse('test-start', kwargs={'pk': data['test'].id})).data['id']
+    api_client.patch(
+        reverse('submission-save-answer', args=[submission_id]),
+        {'question_id': q1.id, 'selected_choice_ids': [q1.choices.filter(is_correct=False).first().id]},
+        format='json'
+    )
+    
+    response = api_client.post(
+        reverse('submission-list'),
+        {'test': data['test'].id, 'answers': correct_answers(data['questions'])},
+        format='json'
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['id'] == submission_id
+    submission = TestSubmission.objects.get(pk=submission_id)
+    assert (submission.status, submission.score) == ('completed', Decimal('100.00'))
+    assert submission.answers.count() == 2
+
+@pytest.mark.django_db
+def test_final_submit_merges_its_answers_over_the_autosaved_ones(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    q1, q2 = data['questions']
+    q1_correct, q2_answer = correct_answers(data['questions'])
+    submission_id = open_session(api_client, data['student'], data['test'])['id']
+    answers_url = reverse('submission-save-answer', args=[submission_id])
+    api_client.patch(answers_url, q1_correct, format='json')
+    api_client.patch(answers_url, {'question_id': q2.id, 'selected_choice_ids': [q2.choices.get(text='4').id]}, format='json')
+    
+    response = api_client.post(reverse('submission-list'), {'test': data['test'].id, 'answers': [q2_answer]}, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert (response.data['id'], len(response.data['answers'])) == (submission_id, 2)
+    submission = TestSubmission.objects.get(pk=submission_id)
+    assert (submission.status, submission.score) == ('completed', Decimal('100.00'))
+    answers = {answer.question_id: answer for answer in submission.answers.all()}
+    assert [answers[q1.id].is_correct, answers[q2.id].is_correct] == [True, True]
+    assert sorted(answers[q2.id].selected_choice_ids) == sorted(q2_answer['selected_choice_ids'])
+
+@pytest.mark.django_db
+def test_autosave_rejects_foreign_choices(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    q1, q2 = data['questions']
+    api_client.force_authenticate(user=data['student'])
+    submission_id = api_client.post(reverse('test-start', kwargs={'pk': data['test'].id})).data['id']
+    
+    response = api_client.patch(
+        reverse('submission-save-answer', args=[submission_id]),
+        {'question_id': q1.id, 'selected_choice_ids': [q2.choices.first().id]},
+        format='json'
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not Answer.objects.filter(submission_id=submission_id).exists()
+
+def open_session(api_client, student, test):
+    api_client.force_authenticate(user=student)
+    response = api_client.post(reverse('test-start', kwargs={'pk': test.id}))
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.data
+
+@pytest.mark.django_db
+def test_session_deadline_is_enforced(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    q1, q2 = data['questions']
+    session = open_session(api_client, data['student'], data['test'])
+    assert session['expires_at'] is not None
+    answers_url = reverse('submission-save-answer', args=[session['id']])
+    api_client.patch(answers_url, {'question_id': q1.id, 'selected_choice_ids': [q1.choices.get(is_correct=True).id]}, format='json')
+    
+    TestSubmission.objects.filter(pk=session['id']).update(expires_at=timezone.now() - timedelta(minutes=5))
+    response = api_client.patch(answers_url, {'question_id': q2.id, 'selected_choice_ids': [q2.choices.first().id]}, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    
+    submission = TestSubmission.objects.get(pk=session['id'])
+    assert submission.status == 'timed_out'
+    # Only the answer saved before the deadline counts.
+    assert submission.score == Decimal('100.00')
+    assert submission.answers.count() == 1
+    assert submission.completed_at == submission.expires_at
+
+@pytest.mark.django_db
+def test_timed_test_cannot_be_submitted_without_a_session(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    api_client.force_authenticate(user=data['student'])
+    payload = {'test': data['test'].id, 'answers': correct_answers(data['questions'])}
+    
+    # Skipping POST /tests/{id}/start/ would skip the deadline too.
+    response = api_client.post(reverse('submission-list'), payload, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not TestSubmission.objects.exists()
+    
+    session = open_session(api_client, data['student'], data['test'])
+    response = api_client.post(reverse('submission-list'), payload, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['id'] == session['id']
+    assert TestSubmission.objects.get(pk=session['id']).status == 'completed'
+
+@pytest.mark.django_db
+def test_untimed_test_can_be_submitted_without_a_session(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    Test.objects.filter(pk=data['test'].id).update(time_limit=0)
+    api_client.force_authenticate(user=data['student'])
+    payload = {'test': data['test'].id, 'answers': correct_answers(data['questions'])}
+    
+    response = api_client.post(reverse('submission-list'), payload, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    submission = TestSubmission.objects.get(pk=response.data['id'])
+    assert (submission.status, submission.expires_at) == ('completed', None)
+
+@pytest.mark.django_db
+def test_late_submit_is_closed_as_timed_out(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    session = open_session(api_client, data['student'], data['test'])
+    TestSubmission.objects.filter(pk=session['id']).update(expires_at=timezone.now() - timedelta(minutes=5))
+    
+    response = api_client.post(
+        reverse('submission-list'),
+        {'test': data['test'].id, 'answers': correct_answers(data['questions'])},
+        format='json'
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    submission = TestSubmission.objects.get(pk=session['id'])
+    assert (submission.status, submission.score) == ('timed_out', Decimal('0.00'))
+    assert not submission.answers.exists()
+    
+    assert api_client.post(reverse('submission-submit', args=[session['id']])).status_code == status.HTTP_400_BAD_REQUEST
+
+@pytest.mark.django_db
+def test_sweeper_closes_expired_sessions_in_batches(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    q1 = data['questions'][0]
+    correct = q1.choices.get(is_correct=True).id
+    expired_ids = []
+    for index in range(5):
+        student = User.objects.create_user(email=f'student{index}@example.com', password='testpass123', role='student')
+        session = open_session(api_client, student, data['test'])
+        api_client.patch(
+            reverse('submission-save-answer', args=[session['id']]),
+            {'question_id': q1.id, 'selected_choice_ids': [correct]},
+            format='json'
+        )
+        expired_ids.append(session['id'])
+    active = open_session(api_client, data['student'], data['test'])
+    TestSubmission.objects.filter(pk__in=expired_ids).update(expires_at=timezone.now() - timedelta(minutes=1))
+    
+    output = io.StringIO()
+    call_command('sweep_timeouts', '--batch-size', '2', stdout=output)
+    assert 'Closed 5 expired submissions.' in output.getvalue()
+    
+    statuses = dict(TestSubmission.objects.values_list('id', 'status'))
+    assert all(statuses[submission_id] == 'timed_out' for submission_id in expired_ids)
+    assert statuses[active['id']] == 'in_progress'
+    assert set(TestSubmission.objects.filter(pk__in=expired_ids).values_list('score', flat=True)) == {Decimal('100.00')}
+    assert sweep_expired_submissions() == 0
@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TestSubmissionViewSet
+from .views import TestSubmissionViewSet, TestResultsExportView
 
 router = DefaultRouter()
 router.register(r'submissions', TestSubmissionViewSet, basename='submission')
 
 urlpatterns = [
+    path('results/tests/<int:test_id>/export/', TestResultsExportView.as_view(), name='test-results-export'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,13 +1,24 @@
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from .models import TestSubmission, Answer
-from .serializers import SubmissionCreateSerializer, SubmissionDetailSerializer
+from .serializers import SubmissionCreateSerializer, SubmissionDetailSerializer, AnswerSaveSerializer
+from .grading import upsert_answers, time_out_submissions
+from .tasks import finish_submission
+from .exports import EXPORT_FORMATS, iter_results
 from apps.tests.models import Test
-from apps.common.permissions import IsStudent
+from apps.common.permissions import IsStudent, IsTeacher, IsAdmin
+from apps.common.mixins import ReplicaReadMixin
+from apps.common.db import read_database
+from apps.common.asyncviews import streaming_response
 
 class TestSubmissionViewSet(viewsets.ModelViewSet):
     permission_classes = [IsStudent]
+    cursor_ordering = ('id',)
     
     def get_queryset(self):
         return TestSubmission.objects.filter(student=self.request.user)
@@ -18,24 +29,116 @@ class TestSubmissionViewSet(viewsets.ModelViewSet):
         return SubmissionDetailSerializer
     
     def create(self, request, *args, **kwargs):
-        test_id = request.data.get('test')
-        test = get_object_or_404(Test, pk=test_id)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        with transaction.atomic():
+            # A student has at most one submission per test: either the open
+            # session, which this submit completes, or a finished one. The
+            # session stays locked against autosaves until it is graded.
+            existing_submission = TestSubmission.objects.select_for_update().filter(
+                test=serializer.validated_data['test'],
+                student=request.user
+            ).first()
+            
+            if existing_submission and existing_submission.status != 'in_progress':
+                return Response(
+                    {"detail": "You have already completed this test."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            serializer.save(session=existing_submission)
+        
+        submission = serializer.instance
+        if submission.status == 'grading':
+            return self.accepted_for_grading(request, submission)
         
-        existing_submission = TestSubmission.objects.filter(
-            test=test,
-            student=request.user,
-            status='completed'
-        ).first()
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+    
+    def accepted_for_grading(self, request, submission):
+        status_url = request.build_absolute_uri(
+            reverse('submission-grading-status', args=[submission.id])
+        )
+        return Response(
+            SubmissionDetailSerializer(submission).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': status_url}
+        )
+    
+    @action(detail=True, methods=['patch'], url_path='answers')
+    def save_answer(self, request, pk=None):
+        """
+        Autosave one answer of an in-progress submission opened by
+        `POST /tests/{id}/start/`. The answer row is upserted and its selected
+        choices replaced; nothing is graded until the final submit.
+        """
+        with transaction.atomic():
+            submission = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            if submission.status != 'in_progress':
+                return Response(
+                    {"detail": "This submission is no longer in progress."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if submission.is_expired():
+                time_out_submissions([submission.id])
+                return Response(
+                    {"detail": "The time limit for this test has expired."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            serializer = AnswerSaveSerializer(data=request.data, context={'submission': submission})
+            serializer.is_valid(raise_exception=True)
+            answer, = upsert_answers(submission, [serializer.validated_data])
         
-        if existing_submission:
+        return Response({'id': answer.id, **serializer.validated_data})
+    
+    @action(detail=True, methods=['post'])
+    def submit(self, request, pk=None):
+        """
+        Finish an in-progress submission and grade the answers saved so far;
+        after the deadline it is closed as `timed_out` instead.
+        """
+        submission = self.get_object()
+        if not finish_submission(submission):
             return Response(
-                {"detail": "You have already completed this test."},
+                {"detail": "This submission is no longer in progress."},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+        submission.refresh_from_db(fields=['status', 'score', 'completed_at'])
+        if submission.status == 'grading':
+            return self.accepted_for_grading(request, submission)
+        return Response(SubmissionDetailSerializer(submission).data)
+    
+    @action(detail=True, methods=['get'], url_path='status')
+    def grading_status(self, request, pk=None):
+        """Poll a submission accepted for asynchronous grading until its status is `completed`."""
+        submission = self.get_object()
+        response = Response(SubmissionDetailSerializer(submission).data)
+        if submission.status == 'grading':
+            response['Retry-After'] = '2'
+        return response
+
+class TestResultsExportView(ReplicaReadMixin, APIView):
+    """Stream every submission of a test with its answers as CSV or, with ?export_format=ndjson, NDJSON."""
+    permission_classes = [IsTeacher | IsAdmin]
+    content_types = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+    
+    def get(self, request, test_id):
+        test = get_object_or_404(Test, pk=test_id)
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"detail": f"export_format must be one of: {', '.join(EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
\ No newline at end of file
+        response = streaming_response(
+            request,
+            # The rows are read after the view returns, so pin the database now.
+            iter_results(test.id, export_format, using=read_database()),
+            content_type=self.content_types[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="test-{test.id}-results.{export_format}"'
+        return response
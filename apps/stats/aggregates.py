@@ -0,0 +1,331 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import NotSupportedError, transaction
+from django.db.models import (
+    Case, Count, DecimalField, F, Func, IntegerField, JSONField, Max, Min, Q, Sum, Value, When
+)
+from django.db.models.functions import Coalesce, Greatest, Least
+from apps.tests.models import Test, Question
+from apps.results.models import TestSubmission
+from apps.common.db import use_replica
+from .models import TestStats, QuestionStats, HISTOGRAM_BUCKETS, BUCKET_WIDTH, histogram_bucket
+
+COUNTED_STATUSES = ('completed', 'timed_out')
+PERCENTILES = (25, 50, 90)
+
+TEST_STATS_FIELDS = (
+    'submission_count', 'score_sum', 'score_sum_of_squares', 'min_score', 'max_score', 'score_histogram',
+)
+QUESTION_STATS_FIELDS = ('answer_count', 'correct_count', 'incorrect_count', 'points_sum')
+
+
+class AddToArrayItems(Func):
+    """Add `increments[i]` to item i of a JSON array column, within the UPDATE statement."""
+    output_field = JSONField()
+    
+    def __init__(self, expression, increments):
+        super().__init__(expression)
+        self.increments = [int(increment) for increment in increments]
+    
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f'AddToArrayItems is not implemented for {connection.vendor}.')
+    
+    def as_postgresql(self, compiler, connection, **extra_context):
+        items = ', '.join(
+            f'(%(expressions)s->>{index})::integer + {increment}' for index, increment in enumerate(self.increments)
+        )
+        return super().as_sql(compiler, connection, template=f'jsonb_build_array({items})', **extra_context)
+    
+    def as_sqlite(self, compiler, connection, **extra_context):
+        items = ', '.join(
+            f"json_extract(%(expressions)s, '$[{index}]') + {increment}" for index, increment in enumerate(self.increments)
+        )
+        return super().as_sql(compiler, connection, template=f'json_array({items})', **extra_context)
+
+
+def histogram_aggregates():
+    """Conditional counts that build the score histogram within the submission aggregate."""
+    aggregates = {}
+    for bucket in range(HISTOGRAM_BUCKETS):
+        in_bucket = Q(score__gte=bucket * BUCKET_WIDTH)
+        if bucket < HISTOGRAM_BUCKETS - 1:
+            in_bucket &= Q(score__lt=(bucket + 1) * BUCKET_WIDTH)
+        aggregates[f'bucket_{bucket}'] = Count('id', filter=in_bucket)
+    return aggregates
+
+
+def compute_live_stats(test_id):
+    """
+    Aggregate the graded submissions of a test straight from TestSubmission
+    and Answer in two queries, whatever the number of questions.
+    
+    Returns the TestStats field values and a list of per-question dicts
+    (`id`, `text` and the QuestionStats fields) in question order.
+    """
+    totals = TestSubmission.objects.filter(test_id=test_id, status__in=COUNTED_STATUSES).aggregate(
+        submission_count=Count('id'),
+        score_sum=Sum('score'),
+        score_sum_of_squares=Sum(F('score') * F('score')),
+        min_score=Min('score'),
+        max_score=Max('score'),
+        **histogram_aggregates()
+    )
+    totals['score_sum'] = totals['score_sum'] or 0
+    totals['score_sum_of_squares'] = totals['score_sum_of_squares'] or 0
+    totals['score_histogram'] = [totals.pop(f'bucket_{bucket}') for bucket in range(HISTOGRAM_BUCKETS)]
+    
+    graded = Q(answer__submission__status__in=COUNTED_STATUSES)
+    questions = list(Question.objects.filter(test_id=test_id).values('id', 'text').annotate(
+        answer_count=Count('answer', filter=graded),
+        correct_count=Count('answer', filter=graded & Q(answer__is_correct=True)),
+        incorrect_count=Count('answer', filter=graded & Q(answer__is_correct=False)),
+        points_sum=Coalesce(Sum('answer__points_earned', filter=graded), Value(Decimal(0)), output_field=DecimalField()),
+    ))
+    
+    return totals, questions
+
+
+def estimate_percentile(histogram, percentile, min_score, max_score):
+    """
+    Estimate a score percentile by linear interpolation inside the histogram
+    buckets. The estimate can be off by up to a bucket's width (BUCKET_WIDTH
+    points) from the exact percentile of the scores.
+    """
+    count = sum(histogram)
+    if not count:
+        return None
+    rank = Decimal(percentile) / 100 * count
+    seen = 0
+    for bucket, bucket_count in enumerate(histogram):
+        if bucket_count and seen + bucket_count >= rank:
+            lower = bucket * BUCKET_WIDTH
+            estimate = lower + (rank - seen) / bucket_count * BUCKET_WIDTH
+            return min(max(estimate, Decimal(min_score)), Decimal(max_score)).quantize(Decimal('0.01'))
+        seen += bucket_count
+    return Decimal(max_score)
+
+
+def build_stats_payload(test, totals, questions):
+    """Shape the response of TestStatsView from either the materialized or the live totals."""
+    count = totals['submission_count']
+    if not count:
+        return {
+            'test_id': test.id,
+            'test_title': test.title,
+            'submission_count': 0,
+            'message': 'No submissions yet'
+        }
+    
+    avg_score = Decimal(totals['score_sum']) / count
+    variance = max(Decimal(totals['score_sum_of_squares']) / count - avg_score * avg_score, Decimal(0))
+    histogram = totals['score_histogram']
+    
+    question_stats = []
+    for question in questions:
+        answer_count = question['answer_count']
+        question_stats.append({
+            'question_id': question['id'],
+            'question_text': question['text'],
+            'correct_count': question['correct_count'],
+            'incorrect_count': question['incorrect_count'],
+            'correct_percentage': (question['correct_count'] / answer_count) * 100 if answer_count else 0,
+            'avg_points_earned': Decimal(question['points_sum']) / answer_count if answer_count else None,
+        })
+    
+    return {
+        'test_id': test.id,
+        'test_title': test.title,
+        'submission_count': count,
+        'avg_score': avg_score,
+        'max_score': totals['max_score'],
+        'min_score': totals['min_score'],
+        'std_dev': variance.sqrt(),
+        # Estimated from the histogram, so that materialized stats can serve them.
+        'approximate_percentiles': {
+            f'p{percentile}': estimate_percentile(histogram, percentile, totals['min_score'], totals['max_score'])
+            for percentile in PERCENTILES
+        },
+        'score_histogram': [
+            {
+                'min_score': bucket * BUCKET_WIDTH,
+                'max_score': (bucket + 1) * BUCKET_WIDTH,
+                'count': bucket_count,
+            }
+            for bucket, bucket_count in enumerate(histogram)
+        ],
+        'question_stats': question_stats
+    }
+
+
+def rebuild_test_stats(test_id):
+    """
+    Replace the materialized stats of a test with freshly computed values.
+    Reads come from the primary even inside `use_replica()`: totals taken
+    from a lagging replica would miss submissions that record_submission
+    skipped while there was no stats row, for good.
+    """
+    with use_replica(False), transaction.atomic():
+        # Serializes with record_submission so no graded submission is counted
+        # twice or lost: it increments the stats row, or locks the test while
+        # there is no row, until its grading transaction commits.
+        Test.objects.select_for_update().only('id').get(pk=test_id)
+        list(TestStats.objects.select_for_update().filter(test_id=test_id).values_list('pk'))
+        totals, questions = compute_live_stats(test_id)
+        
+        stats, _ = TestStats.objects.update_or_create(test_id=test_id, defaults=totals)
+        QuestionStats.objects.filter(test_id=test_id).delete()
+        QuestionStats.objects.bulk_create([
+            QuestionStats(
+                question_id=question['id'],
+                test_id=test_id,
+                **{field: question[field] for field in QUESTION_STATS_FIELDS}
+            )
+            for question in questions
+        ])
+    return stats
+
+
+def verify_test_stats(test_id):
+    """Compare the materialized stats of a test with live data; returns a list of differences."""
+    totals, questions = compute_live_stats(test_id)
+    stats = TestStats.objects.filter(test_id=test_id).first()
+    if stats is None:
+        return ['test stats are not materialized']
+    
+    differences = []
+    for field in TEST_STATS_FIELDS:
+        stored, live = getattr(stats, field), totals[field]
+        if not _same_value(stored, live, TestStats._meta.get_field(field)):
+            differences.append(f'{field}: stored {stored}, live {live}')
+    
+    stored_questions = {
+        question_stats.question_id: question_stats
+        for question_stats in QuestionStats.objects.filter(test_id=test_id)
+    }
+    for question in questions:
+        question_stats = stored_questions.get(question['id'])
+        for field in QUESTION_STATS_FIELDS:
+            stored = getattr(question_stats, field) if question_stats else 0
+            if not _same_value(stored, question[field], QuestionStats._meta.get_field(field)):
+                differences.append(f"question {question['id']} {field}: stored {stored}, live {question[field]}")
+    
+    return differences
+
+
+def _same_value(stored, live, field):
+    if stored is None or live is None:
+        return stored == live
+    if isinstance(field, DecimalField):
+        quantum = Decimal(1).scaleb(-field.decimal_places)
+        return Decimal(stored).quantize(quantum) == Decimal(live).quantize(quantum)
+    return stored == live
+
+
+def record_submission(submission, answers):
+    """
+    Fold one freshly graded submission into the materialized stats; returns
+    whether it was recorded. See `record_submissions`.
+    """
+    return submission.test_id in record_submissions([(submission, answers)])
+
+
+def record_submissions(graded):
+    """
+    Fold freshly graded (submission, answers) pairs into the materialized stats.
+    
+    Must run inside the grading transaction. The deltas of each test are
+    summed in Python first, then applied with one UPDATE of its TestStats row
+    and one of its QuestionStats rows, however many submissions the batch
+    holds. The counters are incremented by UPDATE statements, so concurrent
+    submits of the same test only wait for each other's row updates, not for
+    a lock taken up front. Tests without a TestStats row are skipped; the
+    next read rebuilds them from live data, which then already includes
+    these submissions.
+    
+    Returns the ids of the tests whose stats recorded their submissions.
+    """
+    graded_per_test = defaultdict(list)
+    for submission, answers in graded:
+        if submission.status in COUNTED_STATUSES:
+            graded_per_test[submission.test_id].append((submission, answers))
+    
+    return {
+        test_id for test_id, test_graded in graded_per_test.items()
+        if _record_test_submissions(test_id, test_graded)
+    }
+
+
+def _record_test_submissions(test_id, graded):
+    scores = [Decimal(submission.score) for submission, _ in graded]
+    histogram = [0] * HISTOGRAM_BUCKETS
+    for score in scores:
+        histogram[histogram_bucket(score)] += 1
+    
+    lowest = Value(min(scores), output_field=DecimalField(max_digits=5, decimal_places=2))
+    highest = Value(max(scores), output_field=DecimalField(max_digits=5, decimal_places=2))
+    increments = {
+        'submission_count': F('submission_count') + len(scores),
+        'score_sum': F('score_sum') + Value(sum(scores), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        'score_sum_of_squares': F('score_sum_of_squares') + Value(
+            sum(score * score for score in scores), output_field=DecimalField(max_digits=20, decimal_places=4)
+        ),
+        # LEAST/GREATEST return NULL for a NULL argument on SQLite.
+        'min_score': Coalesce(Least('min_score', lowest), lowest),
+        'max_score': Coalesce(Greatest('max_score', highest), highest),
+        'score_histogram': AddToArrayItems('score_histogram', histogram),
+    }
+    stats = TestStats.objects.filter(test_id=test_id)
+    if not stats.update(**increments):
+        # A rebuild may be inserting the row: wait for it, then count these
+        # submissions if the row was committed without them.
+        Test.objects.select_for_update().only('id').get(pk=test_id)
+        if not stats.update(**increments):
+            return False
+    
+    # Per question: answer, correct and incorrect counts and points earned.
+    deltas = {}
+    for _, answers in graded:
+        for answer in answers:
+            delta = deltas.setdefault(answer.question_id, [0, 0, 0, Decimal(0)])
+            delta[0] += 1
+            delta[1] += answer.is_correct is True
+            delta[2] += answer.is_correct is False
+            delta[3] += Decimal(answer.points_earned or 0)
+    
+    def per_question(index, default, output_field):
+        return Case(
+            *[
+                When(question_id=question_id, then=Value(delta[index]))
+                for question_id, delta in deltas.items() if delta[index]
+            ],
+            default=Value(default),
+            output_field=output_field,
+        )
+    
+    question_increments = {
+        'answer_count': F('answer_count') + per_question(0, 0, IntegerField()),
+        'correct_count': F('correct_count') + per_question(1, 0, IntegerField()),
+        'incorrect_count': F('incorrect_count') + per_question(2, 0, IntegerField()),
+        'points_sum': F('points_sum') + per_question(3, Decimal(0), DecimalField(max_digits=14, decimal_places=2)),
+    }
+    question_ids = list(deltas)
+    updated = QuestionStats.objects.filter(question_id__in=question_ids).update(**question_increments)
+    if updated < len(question_ids):
+        # Questions added after the stats were built have no row yet. Other
+        # submits of the test wait on the TestStats row updated above, so
+        # the rows missing now are missing for these submissions only; a
+        # rebuild may still insert them, hence ignore_conflicts.
+        missing_ids = set(question_ids).difference(
+            QuestionStats.objects.filter(question_id__in=question_ids).values_list('question_id', flat=True)
+        )
+        QuestionStats.objects.bulk_create(
+            [QuestionStats(question_id=question_id, test_id=test_id) for question_id in missing_ids],
+            ignore_conflicts=True,
+        )
+        QuestionStats.objects.filter(question_id__in=missing_ids).update(**question_increments)
+    return True
+
+
+def invalidate_test_stats(test_id):
+    """Drop the materialized stats of a test so the next read rebuilds them."""
+    TestStats.objects.filter(test_id=test_id).delete()
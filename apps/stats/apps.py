@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class StatsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.stats'
\ No newline at end of file
+    name = 'apps.stats'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
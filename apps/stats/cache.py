@@ -0,0 +1,32 @@
+from django.conf import settings
+from apps.common.cache import namespace_version, bump_namespace, get_or_build, aget_or_build
+from apps.tests.cache import get_test_version
+
+TEST_NAMESPACE = 'stats'
+STUDENT_NAMESPACE = 'student_stats'
+
+
+def bump_test_stats(test_id):
+    bump_namespace(TEST_NAMESPACE, test_id)
+
+
+def bump_student_stats(student_id):
+    bump_namespace(STUDENT_NAMESPACE, student_id)
+
+
+def get_test_stats_payload(test_id, build):
+    """
+    Return the cached TestStatsView payload. It is keyed by both the stats
+    and the test version, so grading a submission and editing the test (its
+    title, its questions) both invalidate it.
+    """
+    version = f'{namespace_version(TEST_NAMESPACE, test_id)}-{get_test_version(test_id)}'
+    return get_or_build(TEST_NAMESPACE, test_id, 'payload', build, timeout=settings.STATS_CACHE_TIMEOUT, version=version)
+
+
+def get_student_stats_payload(student_id, build):
+    return get_or_build(STUDENT_NAMESPACE, student_id, 'payload', build, timeout=settings.STATS_CACHE_TIMEOUT)
+
+
+async def aget_student_stats_payload(student_id, build):
+    return await aget_or_build(STUDENT_NAMESPACE, student_id, 'payload', build, timeout=settings.STATS_CACHE_TIMEOUT)
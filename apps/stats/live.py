@@ -0,0 +1,131 @@
+import asyncio
+from collections import defaultdict
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from apps.common.pubsub import get_broker
+from .models import TestStats
+
+# SSE comment sent while no submission is graded, so proxies keep the stream open.
+KEEPALIVE_SECONDS = 15
+# Browsers' EventSource reconnects after this many milliseconds once a stream ends.
+RECONNECT_MILLISECONDS = 3000
+
+
+def stats_channel(test_id):
+    return f'test-stats:{test_id}'
+
+
+def publish_graded_submissions(graded, recorded_test_ids=()):
+    """
+    Announce graded (submission, answers) pairs to their tests' stats streams
+    once the grading transaction commits, with one message per test. When a
+    test's stats `recorded` them and a stream listens, the message carries
+    their totals as of the commit; otherwise the totals are not read.
+    """
+    graded_per_test = defaultdict(list)
+    for submission, answers in graded:
+        graded_per_test[submission.test_id].append((submission, answers))
+
+    def publish():
+        broker = get_broker()
+        for test_id, test_graded in graded_per_test.items():
+            channel = stats_channel(test_id)
+            totals = TestStats.objects.filter(test_id=test_id).values(
+                'submission_count', 'score_sum'
+            ).first() if test_id in recorded_test_ids and broker.has_subscribers(channel) else None
+            broker.publish(channel, {
+                'new_submissions': len(test_graded),
+                'score_total': sum(Decimal(submission.score) for submission, _ in test_graded),
+                'submission_count': totals['submission_count'] if totals else None,
+                'score_sum': totals['score_sum'] if totals else None,
+                'answers': [
+                    [answer.question_id, answer.is_correct] for _, answers in test_graded for answer in answers
+                ],
+            })
+
+    transaction.on_commit(publish)
+
+
+def sse_event(event, data):
+    return b'event: ' + event.encode() + b'\ndata: ' + JSONRenderer().render(data) + b'\n\n'
+
+
+def snapshot_event(snapshot):
+    """The first event of a stream, with the browser's reconnect delay."""
+    return f'retry: {RECONNECT_MILLISECONDS}\n'.encode() + sse_event('snapshot', snapshot)
+
+
+class StatsTally:
+    """Running totals of a test's stats stream, starting from the snapshot sent on connect."""
+
+    def __init__(self, snapshot):
+        self.submission_count = self.snapshot_count = snapshot['submission_count']
+        self.score_sum = Decimal(snapshot.get('avg_score') or 0) * self.submission_count
+
+    def update(self, messages):
+        """Fold the messages of one interval in; returns the `update` event's data."""
+        # Graded after subscribing but counted in the snapshot already.
+        messages = [
+            message for message in messages
+            if message['submission_count'] is None or message['submission_count'] > self.snapshot_count
+        ]
+        questions = {}
+        for message in messages:
+            if message['submission_count'] is None:
+                self.submission_count += message['new_submissions']
+                self.score_sum += Decimal(message['score_total'])
+            else:
+                self.submission_count = message['submission_count']
+                self.score_sum = Decimal(message['score_sum'])
+            for question_id, is_correct in message['answers']:
+                delta = questions.setdefault(question_id, {
+                    'question_id': question_id, 'answer_count': 0, 'correct_count': 0, 'incorrect_count': 0,
+                })
+                delta['answer_count'] += 1
+                delta['correct_count'] += is_correct is True
+                delta['incorrect_count'] += is_correct is False
+
+        return {
+            'new_submissions': sum(message['new_submissions'] for message in messages),
+            'submission_count': self.submission_count,
+            'avg_score': self.score_sum / self.submission_count if self.submission_count else None,
+            'question_deltas': list(questions.values()),
+        }
+
+
+async def stats_events(test_id, load_snapshot):
+    """
+    Yield the SSE stream of a test: the stats payload `load_snapshot()`
+    returns, then at most one `update` event per STATS_STREAM_INTERVAL
+    seconds that sums up the submissions graded since the previous one.
+    The snapshot is read once subscribed, so no submission graded in
+    between goes missing. Ends after STATS_STREAM_SECONDS; the browser then
+    reconnects and gets a fresh snapshot.
+    """
+    loop = asyncio.get_running_loop()
+    interval = settings.STATS_STREAM_INTERVAL
+    closes_at = loop.time() + settings.STATS_STREAM_SECONDS
+
+    async with get_broker().subscribe(stats_channel(test_id)) as queue:
+        snapshot = await load_snapshot()
+        tally = StatsTally(snapshot)
+        yield snapshot_event(snapshot)
+        sent_at = loop.time()
+        while loop.time() < closes_at:
+            try:
+                message = await asyncio.wait_for(
+                    queue.get(), timeout=min(KEEPALIVE_SECONDS, closes_at - loop.time())
+                )
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+
+            # Hold the update back until an interval has passed since the last one.
+            await asyncio.sleep(max(sent_at + interval - loop.time(), 0))
+            messages = [message]
+            while not queue.empty():
+                messages.append(queue.get_nowait())
+            yield sse_event('update', tally.update(messages))
+            sent_at = loop.time()
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.tests.models import Test
+from apps.stats.aggregates import rebuild_test_stats, verify_test_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized test statistics from submissions, or verify them against live data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, action='append', dest='test_ids', help='Only this test id (repeatable).')
+        parser.add_argument('--verify', action='store_true', help='Compare stored stats with live data without writing.')
+
+    def handle(self, *args, **options):
+        tests = Test.objects.order_by('id')
+        if options['test_ids']:
+            tests = tests.filter(id__in=options['test_ids'])
+        test_ids = list(tests.values_list('id', flat=True))
+
+        if not options['verify']:
+            for test_id in test_ids:
+                stats = rebuild_test_stats(test_id)
+                self.stdout.write(f'Rebuilt test {test_id}: {stats.submission_count} submissions')
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {len(test_ids)} tests.'))
+            return
+
+        drifted = 0
+        for test_id in test_ids:
+            differences = verify_test_stats(test_id)
+            if differences:
+                drifted += 1
+                for difference in differences:
+                    self.stdout.write(self.style.WARNING(f'Test {test_id}: {difference}'))
+
+        if drifted:
+            raise CommandError(f'{drifted} of {len(test_ids)} tests have stale stats; run rebuild_stats to fix them.')
+        self.stdout.write(self.style.SUCCESS(f'Stats for {len(test_ids)} tests match live data.'))
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.8 on 2026-10-18 02:53
+
+from django.db import migrations, models
+
+
+def drop_stats_without_histogram(apps, schema_editor):
+    # Rows materialized before the histogram existed are rebuilt from live data on next read.
+    apps.get_model("stats", "TestStats").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stats", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="teststats",
+            name="score_histogram",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(drop_stats_without_histogram, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+from decimal import Decimal
+from django.db import models
+from apps.tests.models import Test, Question
+
+HISTOGRAM_BUCKETS = 10
+BUCKET_WIDTH = Decimal(100) / HISTOGRAM_BUCKETS
+
+
+def histogram_bucket(score):
+    """Index of the histogram bucket a score falls into; 100 belongs to the last bucket."""
+    return min(int(Decimal(score) // BUCKET_WIDTH), HISTOGRAM_BUCKETS - 1)
+
+class TestStats(models.Model):
+    test = models.OneToOneField(Test, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    submission_count = models.PositiveIntegerField(default=0)
+    score_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    score_sum_of_squares = models.DecimalField(max_digits=20, decimal_places=4, default=0)
+    min_score = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    max_score = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    score_histogram = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'test stats'
+    
+    def __str__(self):
+        return f"Stats for {self.test}"
+    
+    @property
+    def avg_score(self):
+        if not self.submission_count:
+            return None
+        return self.score_sum / self.submission_count
+
+class QuestionStats(models.Model):
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='question_stats')
+    answer_count = models.PositiveIntegerField(default=0)
+    correct_count = models.PositiveIntegerField(default=0)
+    incorrect_count = models.PositiveIntegerField(default=0)
+    points_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name_plural = 'question stats'
+    
+    def __str__(self):
+        return f"Stats for {self.question}"
+    
+    @property
+    def correct_percentage(self):
+        if not self.answer_count:
+            return 0
+        return (self.correct_count / self.answer_count) * 100
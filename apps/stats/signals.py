@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from apps.results.models import TestSubmission
+from apps.results.signals import submission_graded, submissions_graded
+from .aggregates import record_submissions, invalidate_test_stats, COUNTED_STATUSES
+from .cache import bump_test_stats, bump_student_stats
+from .live import publish_graded_submissions
+
+
+@receiver(submission_graded)
+def update_materialized_stats(sender, submission, answers, **kwargs):
+    update_stats_of_graded([(submission, answers)])
+
+
+@receiver(submissions_graded)
+def update_materialized_stats_in_batch(sender, graded, **kwargs):
+    update_stats_of_graded(graded)
+
+
+def update_stats_of_graded(graded):
+    recorded_test_ids = record_submissions(graded)
+    for test_id in {submission.test_id for submission, _ in graded}:
+        bump_test_stats(test_id)
+    for student_id in {submission.student_id for submission, _ in graded}:
+        bump_student_stats(student_id)
+    counted = [(submission, answers) for submission, answers in graded if submission.status in COUNTED_STATUSES]
+    if counted:
+        publish_graded_submissions(counted, recorded_test_ids)
+
+
+@receiver(post_delete, sender=TestSubmission)
+def submission_deleted(sender, instance, **kwargs):
+    invalidate_test_stats(instance.test_id)
+    bump_test_stats(instance.test_id)
+    bump_student_stats(instance.student_id)
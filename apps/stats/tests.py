@@ -0,0 +1,405 @@
+import asyncio
+import json
+import pytest
+import statistics
+from asgiref.sync import async_to_sync, sync_to_async
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management import call_command, CommandError
+from django.urls import reverse
+from django.utils import timezone
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+from django.test import AsyncClient
+from django.contrib.auth import get_user_model
+from apps.tests.models import Test, Question, Choice
+from apps.results.models import TestSubmission
+from apps.results.grading import sweep_expired_submissions
+from .models import TestStats, QuestionStats
+from .aggregates import rebuild_test_stats, verify_test_stats
+from . import views as stats_views
+from .views import stats_snapshot
+from apps.common.cache import cache_counters
+from apps.common.pubsub import get_broker
+from apps.users.serializers import ClaimsTokenObtainPairSerializer
+
+User = get_user_model()
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+@pytest.fixture
+def setup_test_with_questions():
+    teacher = User.objects.create_user(
+        email='teacher@example.com',
+        password='testpass123',
+        role='teacher'
+    )
+    
+    test = Test.objects.create(
+        title='Math Quiz',
+        subject='Mathematics',
+        created_by=teacher,
+        time_limit=30
+    )
+    
+    q1 = Question.objects.create(test=test, text='What is 2+2?', question_type='single_choice', points=5)
+    Choice.objects.create(question=q1, text='3', is_correct=False)
+    Choice.objects.create(question=q1, text='4', is_correct=True)
+    
+    q2 = Question.objects.create(test=test, text='Select all prime numbers', question_type='multiple_choice', points=5)
+    Choice.objects.create(question=q2, text='2', is_correct=True)
+    Choice.objects.create(question=q2, text='3', is_correct=True)
+    Choice.objects.create(question=q2, text='4', is_correct=False)
+    
+    return {'test': test, 'teacher': teacher, 'questions': [q1, q2]}
+
+@pytest.fixture
+def submit(api_client):
+    def _submit(test, email, answers):
+        student = User.objects.create_user(email=email, password='testpass123', role='student')
+        api_client.force_authenticate(user=student)
+        api_client.post(reverse('test-start', kwargs={'pk': test.id}))
+        payload = {
+            'test': test.id,
+            'answers': [
+                {
+                    'question_id': question.id,
+                    'selected_choice_ids': list(choices.values_list('id', flat=True))
+                }
+                for question, choices in answers
+            ]
+        }
+        response = api_client.post(reverse('submission-list'), payload, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        return response
+    return _submit
+
+@pytest.mark.django_db
+def test_stats_are_materialized_and_updated_incrementally(api_client, setup_test_with_questions, submit):
+    data = setup_test_with_questions
+    test = data['test']
+    q1, q2 = data['questions']
+    url = reverse('test-stats', kwargs={'test_id': test.id})
+    
+    submit(test, 'first@example.com', [
+        (q1, q1.choices.filter(is_correct=True)),
+        (q2, q2.choices.filter(is_correct=True)),
+    ])
+    
+    api_client.force_authenticate(user=data['teacher'])
+    response = api_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['submission_count'] == 1
+    assert TestStats.objects.filter(test=test).exists()
+    
+    with CaptureQueriesContext(connection) as queries:
+        submit(test, 'second@example.com', [
+            (q1, q1.choices.filter(is_correct=False)),
+            (q2, q2.choices.filter(text='2')),
+        ])
+    # The totals are incremented in place, without reading (and locking) the row first.
+    stats_queries = [query['sql'] for query in queries if '"stats_teststats"' in query['sql']]
+    assert len(stats_queries) == 1 and stats_queries[0].startswith('UPDATE')
+    
+    stats = TestStats.objects.get(test=test)
+    assert stats.submission_count == 2
+    assert stats.min_score == Decimal('25.00')
+    assert stats.max_score == Decimal('100.00')
+    assert stats.score_histogram == [0, 0, 1, 0, 0, 0, 0, 0, 0, 1]
+    assert QuestionStats.objects.get(question=q1).incorrect_count == 1
+    assert QuestionStats.objects.get(question=q2).points_sum == Decimal('7.50')
+    assert verify_test_stats(test.id) == []
+    
+    api_client.force_authenticate(user=data['teacher'])
+    response = api_client.get(url)
+    assert response.data['submission_count'] == 2
+    assert response.data['avg_score'] == Decimal('62.5')
+    assert response.data['question_stats'][0]['correct_percentage'] == 50
+
+@pytest.mark.django_db
+def test_missing_question_stats_rows_are_created_once(api_client, setup_test_with_questions, submit, monkeypatch):
+    data = setup_test_with_questions
+    test = data['test']
+    q1, q2 = data['questions']
+    submit(test, 'first@example.com', [(q1, q1.choices.filter(is_correct=True))])
+    api_client.force_authenticate(user=data['teacher'])
+    api_client.get(reverse('test-stats', kwargs={'test_id': test.id}))
+    QuestionStats.objects.filter(question=q2).delete()
+    
+    bulk_create = QuestionStats.objects.bulk_create
+    def racing_bulk_create(rows, **kwargs):
+        # Another transaction inserts the row first.
+        bulk_create([QuestionStats(question=q2, test=test)])
+        return bulk_create(rows, **kwargs)
+    monkeypatch.setattr(QuestionStats.objects, 'bulk_create', racing_bulk_create)
+    
+    submit(test, 'second@example.com', [
+        (q1, q1.choices.filter(is_correct=False)),
+        (q2, q2.choices.filter(is_correct=True)),
+    ])
+    assert QuestionStats.objects.get(question=q2).correct_count == 1
+    assert QuestionStats.objects.get(question=q1).answer_count == 2
+
+@pytest.mark.django_db
+def test_swept_sessions_are_recorded_once_per_batch(api_client, setup_test_with_questions, submit):
+    data = setup_test_with_questions
+    test = data['test']
+    q1, q2 = data['questions']
+    submit(test, 'first@example.com', [(q1, q1.choices.filter(is_correct=True))])
+    api_client.force_authenticate(user=data['teacher'])
+    api_client.get(reverse('test-stats', kwargs={'test_id': test.id}))
+    
+    for index in range(6):
+        student = User.objects.create_user(email=f'session{index}@example.com', password='testpass123', role='student')
+        api_client.force_authenticate(user=student)
+        session = api_client.post(reverse('test-start', kwargs={'pk': test.id})).data
+        api_client.patch(reverse('submission-save-answer', args=[session['id']]), {
+            'question_id': q1.id, 'selected_choice_ids': [q1.choices.filter(is_correct=index % 2 == 0).first().id]
+        }, format='json')
+        if index % 3:
+            api_client.patch(reverse('submission-save-answer', args=[session['id']]), {
+                'question_id': q2.id, 'selected_choice_ids': list(q2.choices.filter(is_correct=True).values_list('id', flat=True))
+            }, format='json')
+    TestSubmission.objects.filter(status='in_progress').update(expires_at=timezone.now() - timedelta(hours=1))
+    
+    with CaptureQueriesContext(connection) as queries:
+        assert sweep_expired_submissions(batch_size=10) == 6
+    stats_updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE "stats_')]
+    # One UPDATE of the test's stats and one of its question stats for the whole batch.
+    assert len(stats_updates) == 2
+    assert verify_test_stats(test.id) == []
+    assert TestStats.objects.get(test=test).submission_count == 7
+
+@pytest.mark.django_db
+def test_rebuild_stats_command_repairs_drift(setup_test_with_questions, submit):
+    data = setup_test_with_questions
+    test = data['test']
+    q1, _ = data['questions']
+    
+    call_command('rebuild_stats')
+    submit(test, 'first@example.com', [(q1, q1.choices.filter(is_correct=True))])
+    call_command('rebuild_stats', '--verify')
+    
+    TestStats.objects.filter(test=test).update(submission_count=5)
+    with pytest.raises(CommandError, match='stale stats'):
+        call_command('rebuild_stats', '--verify')
+    
+    call_command('rebuild_stats', '--test', str(test.id))
+    assert TestStats.objects.get(test=test).submission_count == TestSubmission.objects.filter(test=test).count()
+
+@pytest.mark.django_db
+def test_live_and_materialized_stats_agree(api_client, setup_test_with_questions, submit):
+    data = setup_test_with_questions
+    test = data['test']
+    q1, q2 = data['questions']
+    
+    submit(test, 'first@example.com', [(q1, q1.choices.filter(is_correct=True)), (q2, q2.choices.filter(is_correct=True))])
+    submit(test, 'second@example.com', [(q1, q1.choices.filter(is_correct=False)), (q2, q2.choices.filter(text='2'))])
+    submit(test, 'third@example.com', [(q1, q1.choices.filter(is_correct=True)), (q2, q2.choices.filter(text='4'))])
+    
+    api_client.force_authenticate(user=data['teacher'])
+    url = reverse('test-stats', kwargs={'test_id': test.id})
+    live = api_client.get(url, {'live': 'true'}).data
+    materialized = api_client.get(url).data
+    
+    assert live == materialized
+    assert [bucket['count'] for bucket in live['score_histogram']] == [0, 0, 1, 0, 0, 1, 0, 0, 0, 1]
+    # Scores are 100, 25 and 50: the exact median is 50, the estimate is
+    # interpolated inside the 50-60 bucket.
+    assert live['approximate_percentiles']['p50'] == Decimal('55.00')
+    assert float(live['std_dev']) == pytest.approx(statistics.pstdev([100, 25, 50]))
+    assert live['question_stats'][1]['avg_points_earned'] == Decimal('2.5')
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('live', ['true', 'false'])
+def test_stats_query_count_does_not_grow_with_questions(api_client, setup_test_with_questions, live):
+    data = setup_test_with_questions
+    test = data['test']
+    api_client.force_authenticate(user=data['teacher'])
+    url = reverse('test-stats', kwargs={'test_id': test.id})
+    api_client.get(url)
+    
+    # Measure the rebuild, not a cached response.
+    cache.clear()
+    with CaptureQueriesContext(connection) as before:
+        api_client.get(url, {'live': live})
+    
+    for index in range(20):
+        Question.objects.create(test=test, text=f'Extra {index}', question_type='text', points=1)
+    
+    cache.clear()
+    with CaptureQueriesContext(connection) as after:
+        api_client.get(url, {'live': live})
+    
+    assert len(before) == len(after) == 3
+
+STATS_QUERY_BUDGET = 3
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('question_count', [2, 20, 100])
+def test_stats_stay_within_query_budget(api_client, setup_test_with_questions, submit, query_budget, question_count):
+    data = setup_test_with_questions
+    test = data['test']
+    q1, q2 = data['questions']
+    Question.objects.bulk_create([
+        Question(test=test, text=f'Extra {index}', question_type='text', points=1)
+        for index in range(question_count - 2)
+    ])
+    submit(test, 'first@example.com', [(q1, q1.choices.filter(is_correct=True)), (q2, q2.choices.filter(text='2'))])
+    api_client.force_authenticate(user=data['teacher'])
+    url = reverse('test-stats', kwargs={'test_id': test.id})
+    # The first read materializes the stats.
+    api_client.get(url)
+    
+    for live in ('true', 'false'):
+        cache.clear()
+        with query_budget(STATS_QUERY_BUDGET):
+            response = api_client.get(url, {'live': live})
+        assert len(response.data['question_stats']) == question_count
+
+@pytest.mark.django_db
+def test_stats_are_cached_until_a_submission_is_graded(api_client, setup_test_with_questions, submit):
+    data = setup_test_with_questions
+    test = data['test']
+    q1, q2 = data['questions']
+    api_client.force_authenticate(user=data['teacher'])
+    url = reverse('test-stats', kwargs={'test_id': test.id})
+    assert api_client.get(url).data['submission_count'] == 0
+    
+    with CaptureQueriesContext(connection) as cached:
+        api_client.get(url)
+    assert len(cached) == 0
+    
+    submit(test, 'first@example.com', [(q1, q1.choices.filter(is_correct=True))])
+    api_client.force_authenticate(user=data['teacher'])
+    assert api_client.get(url).data['submission_count'] == 1
+    assert cache_counters()['hits'] >= 1
+
+def parse_events(chunk):
+    """The (event, data) pairs in a chunk of a text/event-stream body."""
+    events = []
+    for block in chunk.decode().strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':'))
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+@pytest.mark.django_db
+def test_stats_stream_pushes_coalesced_updates(setup_test_with_questions, submit, settings, django_capture_on_commit_callbacks, asgi_routes):
+    settings.STATS_STREAM_INTERVAL = 0.2
+    data = setup_test_with_questions
+    test = data['test']
+    q1, q2 = data['questions']
+    token = ClaimsTokenObtainPairSerializer.get_token(data['teacher']).access_token
+    url = reverse('test-stats-stream', kwargs={'test_id': test.id})
+    
+    def grade_two_submissions():
+        with django_capture_on_commit_callbacks(execute=True):
+            submit(test, 'first@example.com', [
+                (q1, q1.choices.filter(is_correct=True)),
+                (q2, q2.choices.filter(is_correct=True)),
+            ])
+            submit(test, 'second@example.com', [
+                (q1, q1.choices.filter(is_correct=True)),
+                (q2, q2.choices.filter(is_correct=False)),
+            ])
+    
+    async def stream():
+        response = await AsyncClient().get(url, headers={'Authorization': f'Bearer {token}'})
+        chunks = response.streaming_content
+        snapshot = await anext(chunks)
+        await sync_to_async(grade_two_submissions)()
+        update = await anext(chunks)
+        await chunks.aclose()
+        return response, parse_events(snapshot), parse_events(update)
+    
+    response, snapshot, update = async_to_sync(stream)()
+    assert response['Content-Type'] == 'text/event-stream'
+    assert snapshot == [('snapshot', {
+        'test_id': test.id, 'test_title': 'Math Quiz', 'submission_count': 0, 'message': 'No submissions yet'
+    })]
+    # Both submissions arrive within one interval and make a single event.
+    assert update == [('update', {
+        'new_submissions': 2,
+        'submission_count': 2,
+        'avg_score': 75.0,
+        'question_deltas': [
+            {'question_id': q1.id, 'answer_count': 2, 'correct_count': 2, 'incorrect_count': 0},
+            {'question_id': q2.id, 'answer_count': 2, 'correct_count': 1, 'incorrect_count': 1},
+        ],
+    })]
+
+@pytest.mark.django_db
+def test_stats_stream_subscribes_before_reading_the_snapshot(
+    setup_test_with_questions, submit, monkeypatch, django_capture_on_commit_callbacks, asgi_routes
+):
+    data = setup_test_with_questions
+    test = data['test']
+    q1, _ = data['questions']
+    token = ClaimsTokenObtainPairSerializer.get_token(data['teacher']).access_token
+    url = reverse('test-stats-stream', kwargs={'test_id': test.id})
+    
+    def snapshot_then_grade(test_id):
+        # A submission graded right after the snapshot was read.
+        snapshot = stats_snapshot(test_id)
+        with django_capture_on_commit_callbacks(execute=True):
+            submit(test, 'first@example.com', [(q1, q1.choices.filter(is_correct=True))])
+        return snapshot
+    
+    monkeypatch.setattr(stats_views, 'stats_snapshot', snapshot_then_grade)
+    
+    async def stream():
+        response = await AsyncClient().get(url, headers={'Authorization': f'Bearer {token}'})
+        chunks = response.streaming_content
+        snapshot = await anext(chunks)
+        update = await asyncio.wait_for(anext(chunks), timeout=5)
+        await chunks.aclose()
+        return parse_events(snapshot), parse_events(update)
+    
+    snapshot, update = async_to_sync(stream)()
+    assert snapshot[0][1]['submission_count'] == 0
+    assert update[0][0] == 'update'
+    assert (update[0][1]['new_submissions'], update[0][1]['submission_count']) == (1, 1)
+    
+    assert async_to_sync(AsyncClient().get)(
+        reverse('test-stats-stream', kwargs={'test_id': test.id + 1}), headers={'Authorization': f'Bearer {token}'}
+    ).status_code == status.HTTP_404_NOT_FOUND
+
+@pytest.mark.django_db
+def test_graded_submissions_are_published_without_reading_totals_nobody_listens_for(
+    setup_test_with_questions, submit, monkeypatch, django_capture_on_commit_callbacks
+):
+    data = setup_test_with_questions
+    test = data['test']
+    q1, _ = data['questions']
+    rebuild_test_stats(test.id)
+    published = []
+    monkeypatch.setattr(get_broker(), 'publish', lambda channel, message: published.append(message))
+    
+    with django_capture_on_commit_callbacks() as callbacks:
+        submit(test, 'first@example.com', [(q1, q1.choices.filter(is_correct=True))])
+    with CaptureQueriesContext(connection) as queries:
+        for callback in callbacks:
+            callback()
+    
+    assert not [query for query in queries.captured_queries if 'stats_teststats' in query['sql']]
+    assert [(message['new_submissions'], message['submission_count']) for message in published] == [(1, None)]
+
+@pytest.mark.django_db
+def test_stats_stream_sends_only_the_snapshot_under_wsgi(api_client, setup_test_with_questions):
+    data = setup_test_with_questions
+    url = reverse('test-stats-stream', kwargs={'test_id': data['test'].id})
+    api_client.force_authenticate(user=data['teacher'])
+    
+    response = api_client.get(url)
+    body = b''.join(response.streaming_content)
+    assert body.startswith(b'retry: 3000\n')
+    assert parse_events(body) == [('snapshot', api_client.get(reverse('test-stats', kwargs={'test_id': data['test'].id})).json())]
+    
+    student = User.objects.create_user(email='student@example.com', password='testpass123', role='student')
+    api_client.force_authenticate(user=student)
+    assert api_client.get(url).status_code == status.HTTP_403_FORBIDDEN
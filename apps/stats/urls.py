@@ -1,7 +1,15 @@
+from django.conf import settings
 from django.urls import path
-from .views import TestStatsView, StudentStatsView
+from .views import TestStatsView, TestStatsStreamView, StudentStatsView, test_stats_stream, student_stats
+
+if settings.SERVER_MODE == 'asgi':
+    # Async GETs; the DRF views serve OPTIONS.
+    stream_view, student_view = test_stats_stream, student_stats
+else:
+    stream_view, student_view = TestStatsStreamView.as_view(), StudentStatsView.as_view()
 
 urlpatterns = [
     path('stats/tests/<int:test_id>/', TestStatsView.as_view(), name='test-stats'),
-    path('stats/student/', StudentStatsView.as_view(), name='student-stats'),
+    path('stats/tests/<int:test_id>/stream/', stream_view, name='test-stats-stream'),
+    path('stats/student/', student_view, name='student-stats'),
 ]
\ No newline at end of file
@@ -1,65 +1,83 @@
+from functools import partial
+from asgiref.sync import sync_to_async
 from rest_framework import generics, permissions
 from rest_framework.response import Response
-from django.db.models import Avg, Count, Max, Min
+from django.db.models import Avg, Count
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from apps.tests.models import Test
-from apps.results.models import TestSubmission, Answer
+from apps.results.models import TestSubmission
 from apps.common.permissions import IsTeacher, IsAdmin
+from apps.common.mixins import ReplicaReadMixin
+from apps.common.db import use_replica, areads_pinned_to_primary
+from apps.common.asyncviews import async_read_view, json_response
+from .models import TestStats, QuestionStats
+from .cache import get_test_stats_payload, get_student_stats_payload, aget_student_stats_payload
+from .live import stats_events, snapshot_event
+from .aggregates import (
+    rebuild_test_stats, compute_live_stats, build_stats_payload,
+    TEST_STATS_FIELDS, QUESTION_STATS_FIELDS, COUNTED_STATUSES
+)
 
-class TestStatsView(generics.RetrieveAPIView):
+class TestStatsView(ReplicaReadMixin, generics.RetrieveAPIView):
     permission_classes = [IsTeacher | IsAdmin]
     
     def get(self, request, test_id):
-        test = Test.objects.get(pk=test_id)
+        if request.query_params.get('live') in ('1', 'true'):
+            test = get_object_or_404(Test, pk=test_id)
+            totals, questions = compute_live_stats(test.id)
+            return Response(build_stats_payload(test, totals, questions))
         
-        submissions = TestSubmission.objects.filter(test=test, status='completed')
-        submission_count = submissions.count()
-        
-        if submission_count == 0:
-            return Response({
-                'test_id': test_id,
-                'test_title': test.title,
-                'submission_count': 0,
-                'message': 'No submissions yet'
-            })
-        
-        avg_score = submissions.aggregate(avg_score=Avg('score'))['avg_score']
-        max_score = submissions.aggregate(max_score=Max('score'))['max_score']
-        min_score = submissions.aggregate(min_score=Min('score'))['min_score']
-        
-        question_stats = []
-        for question in test.questions.all():
-            answers = Answer.objects.filter(
-                submission__in=submissions,
-                question=question
-            )
-            
-            correct_count = answers.filter(is_correct=True).count()
-            incorrect_count = answers.filter(is_correct=False).count()
-            
-            if answers.count() > 0:
-                correct_percentage = (correct_count / answers.count()) * 100
-            else:
-                correct_percentage = 0
-            
-            question_stats.append({
-                'question_id': question.id,
-                'question_text': question.text,
-                'correct_count': correct_count,
-                'incorrect_count': incorrect_count,
-                'correct_percentage': correct_percentage
-            })
-        
-        return Response({
-            'test_id': test_id,
-            'test_title': test.title,
-            'submission_count': submission_count,
-            'avg_score': avg_score,
-            'max_score': max_score,
-            'min_score': min_score,
-            'question_stats': question_stats
+        return Response(get_test_stats_payload(test_id, partial(materialized_payload, test_id)))
+
+def materialized_payload(test_id):
+    test = get_object_or_404(Test, pk=test_id)
+    stats = TestStats.objects.filter(test=test).first()
+    if stats is None:
+        # Rebuilt on the primary; read the new rows back from there too.
+        with use_replica(False):
+            return stats_payload(test, rebuild_test_stats(test.id))
+    return stats_payload(test, stats)
+
+def stats_payload(test, stats):
+    totals = {field: getattr(stats, field) for field in TEST_STATS_FIELDS}
+    questions = []
+    for question in test.questions.select_related('stats'):
+        counts = getattr(question, 'stats', None) or QuestionStats(question=question, test=test)
+        questions.append({
+            'id': question.id,
+            'text': question.text,
+            **{field: getattr(counts, field) for field in QUESTION_STATS_FIELDS}
         })
+    
+    return build_stats_payload(test, totals, questions)
+
+class TestStatsStreamView(generics.GenericAPIView):
+    """
+    Server-Sent Events with a test's stats: a `snapshot` event with the
+    TestStatsView payload, then `update` events with the new submission
+    count, running average and per-question answer counts since the last
+    update. Under SERVER_MODE=asgi GET is served by `test_stats_stream`;
+    a sync worker can't hold the stream open, so this view sends the
+    snapshot and lets the browser reconnect, which amounts to polling the
+    cached stats.
+    """
+    permission_classes = [IsTeacher | IsAdmin]
+    
+    def get(self, request, test_id):
+        return event_stream_response([snapshot_event(stats_snapshot(test_id))])
 
-class StudentStatsView(generics.RetrieveAPIView):
+def stats_snapshot(test_id):
+    return get_test_stats_payload(test_id, partial(materialized_payload, test_id))
+
+def event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the events.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+class StudentStatsView(ReplicaReadMixin, generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
@@ -70,27 +88,64 @@ class StudentStatsView(generics.RetrieveAPIView):
                 'message': 'Stats only available for students'
             })
         
-        submissions = TestSubmission.objects.filter(
-            student=user,
-            status='completed'
-        )
-        
-        tests_taken = submissions.count()
-        avg_score = submissions.aggregate(avg_score=Avg('score'))['avg_score']
-        
-        test_results = []
-        for submission in submissions:
-            test_results.append({
+        return Response(get_student_stats_payload(user.id, partial(student_payload, user)))
+
+@async_read_view(StudentStatsView.as_view(), [permissions.IsAuthenticated])
+async def student_stats(request):
+    """Async GET of `StudentStatsView`, routed under SERVER_MODE=asgi; reads from the replica like it."""
+    user = request.user
+    if user.role != 'student':
+        return json_response({
+            'message': 'Stats only available for students'
+        })
+    
+    pinned = await areads_pinned_to_primary(user)
+    with use_replica(not pinned):
+        return json_response(await aget_student_stats_payload(user.id, partial(astudent_payload, user)))
+
+def graded_submissions(user):
+    return TestSubmission.objects.filter(
+        student_id=user.id,
+        status__in=COUNTED_STATUSES
+    ).select_related('test')
+
+def student_payload(user):
+    """The stats of the student's graded submissions."""
+    submissions = graded_submissions(user)
+    return student_stats_payload(
+        user, submissions.aggregate(tests_taken=Count('id'), avg_score=Avg('score')), list(submissions)
+    )
+
+async def astudent_payload(user):
+    """`student_payload` on the async ORM."""
+    submissions = graded_submissions(user)
+    return student_stats_payload(
+        user,
+        await submissions.aaggregate(tests_taken=Count('id'), avg_score=Avg('score')),
+        [submission async for submission in submissions]
+    )
+
+def student_stats_payload(user, totals, submissions):
+    return {
+        'student_id': user.id,
+        'student_email': user.email,
+        'tests_taken': totals['tests_taken'],
+        'avg_score': totals['avg_score'],
+        'test_results': [
+            {
                 'test_id': submission.test.id,
                 'test_title': submission.test.title,
                 'score': submission.score,
                 'completed_at': submission.completed_at
-            })
-        
-        return Response({
-            'student_id': user.id,
-            'student_email': user.email,
-            'tests_taken': tests_taken,
-            'avg_score': avg_score,
-            'test_results': test_results
-        })
\ No newline at end of file
+            }
+            for submission in submissions
+        ]
+    }
+
+@async_read_view(TestStatsStreamView.as_view(), [IsTeacher | IsAdmin])
+async def test_stats_stream(request, test_id):
+    """Stream a test's stats as SSE; see TestStatsStreamView."""
+    # The snapshot is read once the stream has subscribed; answer 404 now.
+    if not await Test.objects.filter(pk=test_id).aexists():
+        raise Http404
+    return event_stream_response(stats_events(test_id, partial(sync_to_async(stats_snapshot), test_id)))
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import NamedTuple
+from apps.common.cache import get_or_build
+from .models import Question, Choice
+from .cache import NAMESPACE, get_test_version
+
+ANSWER_KEY_TIMEOUT = 60 * 60 * 24
+LOCAL_CACHE_SIZE = 256
+
+_local_cache = OrderedDict()
+_local_lock = Lock()
+
+
+def normalize_text_answer(text):
+    """Compare text answers ignoring case and runs of whitespace."""
+    return ' '.join(str(text).split()).casefold()
+
+
+class QuestionKey(NamedTuple):
+    question_type: str
+    points: int
+    correct_choice_ids: frozenset
+    choice_ids: frozenset
+    accepted_answers: frozenset = frozenset()
+
+
+class AnswerKey:
+    """Immutable grading data for one version of a test: question id -> QuestionKey."""
+    
+    __slots__ = ('test_id', 'version', '_questions')
+    
+    def __init__(self, test_id, version, questions):
+        self.test_id = test_id
+        self.version = version
+        self._questions = dict(questions)
+    
+    def __getitem__(self, question_id):
+        return self._questions[question_id]
+    
+    def __contains__(self, question_id):
+        return question_id in self._questions
+    
+    def __iter__(self):
+        return iter(self._questions)
+    
+    def __len__(self):
+        return len(self._questions)
+    
+    def get(self, question_id, default=None):
+        return self._questions.get(question_id, default)
+    
+    def __getstate__(self):
+        return self.test_id, self.version, self._questions
+    
+    def __setstate__(self, state):
+        self.test_id, self.version, self._questions = state
+
+
+def build_answer_key(test_id, version=None):
+    """Build an AnswerKey from the database in two queries."""
+    questions = {}
+    accepted_answers = {}
+    for question_id, question_type, points, accepted in Question.objects.filter(test_id=test_id).values_list(
+        'id', 'question_type', 'points', 'accepted_answers'
+    ):
+        questions[question_id] = (question_type, points, set(), set())
+        accepted_answers[question_id] = frozenset(normalize_text_answer(answer) for answer in accepted or ())
+    
+    choices = Choice.objects.filter(question__test_id=test_id).values_list('question_id', 'id', 'is_correct')
+    for question_id, choice_id, is_correct in choices:
+        questions[question_id][3].add(choice_id)
+        if is_correct:
+            questions[question_id][2].add(choice_id)
+    
+    return AnswerKey(test_id, version, {
+        question_id: QuestionKey(
+            question_type, points, frozenset(correct_ids), frozenset(choice_ids), accepted_answers[question_id]
+        )
+        for question_id, (question_type, points, correct_ids, choice_ids) in questions.items()
+    })
+
+
+def get_answer_key(test_id):
+    """
+    Return the AnswerKey for a test.
+    
+    Lookups go to the in-process cache first, then to the configured cache
+    backend, and only rebuild from the database when the test's content
+    version has changed since the key was stored.
+    """
+    version = get_test_version(test_id)
+    
+    with _local_lock:
+        answer_key = _local_cache.get(test_id)
+        if answer_key is not None and answer_key.version == version:
+            _local_cache.move_to_end(test_id)
+            return answer_key
+    
+    answer_key = get_or_build(
+        NAMESPACE, test_id, 'answer_key', lambda: build_answer_key(test_id, version),
+        timeout=ANSWER_KEY_TIMEOUT, version=version
+    )
+    
+    with _local_lock:
+        _local_cache[test_id] = answer_key
+        _local_cache.move_to_end(test_id)
+        while len(_local_cache) > LOCAL_CACHE_SIZE:
+            _local_cache.popitem(last=False)
+    
+    return answer_key
+
+
+def forget_answer_key(test_id):
+    with _local_lock:
+        _local_cache.pop(test_id, None)
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class TestsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.tests'
\ No newline at end of file
+    name = 'apps.tests'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,318 @@
+import codecs
+import csv
+import io
+import json
+import re
+from itertools import groupby, islice
+from django.db import transaction
+from .models import Test, Question, Choice
+from .cache import bump_test_version
+
+CHUNK_SIZE = 64 * 1024
+IMPORT_BATCH_SIZE = 100
+# Largest JSON test object accepted, in characters.
+MAX_TEST_SIZE = 10 * 1024 * 1024
+# What the JSON parser looks for to find the end of a test object.
+STRUCTURAL_CHARACTERS = re.compile(r'["{}\[\]]')
+STRING_SPECIAL_CHARACTERS = re.compile(r'["\\]')
+
+TEST_FIELDS = ('title', 'description', 'subject', 'time_limit', 'is_active')
+QUESTION_FIELDS = ('text', 'question_type', 'points', 'order', 'accepted_answers')
+CHOICE_FIELDS = ('text', 'is_correct')
+
+CSV_COLUMNS = (
+    'test_key', 'test_title', 'test_description', 'test_subject', 'test_time_limit', 'test_is_active',
+    'question_text', 'question_type', 'question_points', 'question_order', 'question_accepted_answers',
+    'choice_text', 'choice_is_correct',
+)
+# Banks exported before text questions had accepted answers lack these.
+OPTIONAL_CSV_COLUMNS = ('question_accepted_answers',)
+
+
+class BankFormatError(ValueError):
+    """The uploaded test bank is not well-formed JSON or CSV."""
+
+
+class InvalidTestError(BankFormatError):
+    """A test in the bank failed TestSerializer validation."""
+
+    def __init__(self, index, errors):
+        super().__init__(f'Test {index} is invalid.')
+        self.index = index
+        self.errors = errors
+
+
+def iter_text(stream, chunk_size=CHUNK_SIZE):
+    """Decode a binary stream as UTF-8 chunk by chunk."""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def iter_json_tests(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yield test dicts from a JSON array (or a single JSON object) read in
+    chunks, so only one test is held in memory at a time.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter_text(stream, chunk_size)
+    buffer = ''
+    position = 0
+    in_array = None
+
+    def fill():
+        nonlocal buffer, position
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    def skip(characters):
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in characters:
+                position += 1
+            if position < len(buffer) or not fill():
+                return
+
+    def object_end():
+        """
+        Find where the object at `position` ends, reading more chunks as
+        needed. Each chunk is scanned once, with the nesting state carried
+        over, and joined to the buffer once the end is found.
+        """
+        nonlocal buffer, position
+        depth = 0
+        in_string = False
+        pieces = []
+        size = 0
+        text, index = buffer, position
+        while True:
+            while index < len(text):
+                if in_string:
+                    match = STRING_SPECIAL_CHARACTERS.search(text, index)
+                    if match is None:
+                        index = len(text)
+                    elif match.group() == '\\':
+                        # Skip the escaped character, which may be a quote.
+                        index = match.end() + 1
+                    else:
+                        in_string = False
+                        index = match.end()
+                    continue
+                match = STRUCTURAL_CHARACTERS.search(text, index)
+                if match is None:
+                    index = len(text)
+                    continue
+                index = match.end()
+                if match.group() == '"':
+                    in_string = True
+                elif match.group() in '{[':
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0 and not pieces:
+                        return index
+                    if depth == 0:
+                        buffer = ''.join(pieces) + text
+                        position = 0
+                        return size + index
+
+            pieces.append(text if pieces else text[position:])
+            size += len(pieces[-1])
+            if size > MAX_TEST_SIZE:
+                raise BankFormatError(f'A test is larger than {MAX_TEST_SIZE} characters.')
+            # An escape at the end of a chunk skips the next chunk's first character.
+            index -= len(text)
+            text = next(chunks, None)
+            if text is None:
+                raise BankFormatError('Invalid JSON: Unexpected end of input.')
+
+    skip(' \t\r\n')
+    if position >= len(buffer):
+        return
+    if buffer[position] == '[':
+        in_array = True
+        position += 1
+    elif buffer[position] == '{':
+        in_array = False
+    else:
+        raise BankFormatError('Expected a JSON array of tests or a single test object.')
+
+    while True:
+        skip(' \t\r\n,' if in_array else ' \t\r\n')
+        if position >= len(buffer):
+            if in_array:
+                raise BankFormatError('Unexpected end of JSON array.')
+            return
+        if in_array and buffer[position] == ']':
+            return
+
+        if buffer[position] != '{':
+            raise BankFormatError('Each test must be a JSON object.')
+        end = object_end()
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as error:
+            raise BankFormatError(f'Invalid JSON: {error.msg}.')
+        position = end
+        yield value
+        if not in_array:
+            return
+
+
+def iter_lines(stream, chunk_size=CHUNK_SIZE):
+    """Split a decoded stream into lines, keeping line endings for the csv module."""
+    pending = ''
+    for text in iter_text(stream, chunk_size):
+        lines = (pending + text).splitlines(keepends=True)
+        pending = lines.pop() if lines and not lines[-1].endswith(('\n', '\r')) else ''
+        yield from lines
+    if pending:
+        yield pending
+
+
+def iter_csv_tests(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yield test dicts from CSV with one row per choice (a single row with
+    empty choice columns for text questions). Consecutive rows with the same
+    `test_key` form one test; within it, rows sharing the question columns
+    form one question. A key may not reappear once its test has ended.
+    """
+    reader = csv.DictReader(iter_lines(stream, chunk_size))
+    missing = set(CSV_COLUMNS) - set(OPTIONAL_CSV_COLUMNS) - set(reader.fieldnames or ())
+    if missing:
+        raise BankFormatError(f'Missing CSV columns: {", ".join(sorted(missing))}.')
+
+    def question_columns(row):
+        return tuple(row.get(column) or '' for column in CSV_COLUMNS[6:11])
+
+    seen_keys = set()
+    for key, test_rows in groupby(reader, lambda row: row['test_key']):
+        if key in seen_keys:
+            raise BankFormatError(f'The rows of test {key!r} are not consecutive.')
+        seen_keys.add(key)
+        # One test's rows, like the JSON parser holds one test object.
+        test_rows = list(test_rows)
+        title, description, subject, time_limit, is_active = (test_rows[0][column] for column in CSV_COLUMNS[1:6])
+        test = {'title': title, 'description': description, 'subject': subject, 'questions': []}
+        if time_limit:
+            test['time_limit'] = time_limit
+        if is_active:
+            test['is_active'] = is_active
+        for (text, question_type, points, order, accepted_answers), question_rows in groupby(test_rows, question_columns):
+            if not text:
+                continue
+            question = {'text': text, 'question_type': question_type, 'choices': []}
+            if points:
+                question['points'] = points
+            if order:
+                question['order'] = order
+            if accepted_answers:
+                # A JSON array, like the field in the JSON format.
+                try:
+                    question['accepted_answers'] = json.loads(accepted_answers)
+                except ValueError:
+                    raise BankFormatError(f'question_accepted_answers of {text!r} is not a JSON array.')
+            for row in question_rows:
+                if row['choice_text']:
+                    question['choices'].append({
+                        'text': row['choice_text'],
+                        'is_correct': row['choice_is_correct'] or False,
+                    })
+            test['questions'].append(question)
+        yield test
+
+
+def import_tests(validated_tests, created_by, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Insert validated test data (TestSerializer.validated_data dicts) in
+    batches: three bulk INSERTs per batch of tests, all in one transaction.
+    Returns the ids of the created tests.
+    """
+    test_ids = []
+    validated_tests = iter(validated_tests)
+    with transaction.atomic():
+        while True:
+            batch = list(islice(validated_tests, batch_size))
+            if not batch:
+                break
+
+            tests = Test.objects.bulk_create([
+                Test(created_by=created_by, **{field: data[field] for field in TEST_FIELDS if field in data})
+                for data in batch
+            ])
+            question_rows = [
+                (test, question_data)
+                for test, data in zip(tests, batch)
+                for question_data in data.get('questions', [])
+            ]
+            questions = Question.objects.bulk_create([
+                Question(test=test, **{field: question_data[field] for field in QUESTION_FIELDS if field in question_data})
+                for test, question_data in question_rows
+            ])
+            Choice.objects.bulk_create([
+                Choice(question=question, **{field: choice_data[field] for field in CHOICE_FIELDS if field in choice_data})
+                for question, (_, question_data) in zip(questions, question_rows)
+                for choice_data in question_data.get('choices', [])
+            ])
+
+            for test in tests:
+                bump_test_version(test.id)
+                test_ids.append(test.id)
+    return test_ids
+
+
+def export_questions(test):
+    return test.questions.order_by('order', 'id').prefetch_related('choices').iterator(chunk_size=500)
+
+
+def iter_json_export(test):
+    """Stream a test as a one-element JSON array that the importer accepts back."""
+    header = {field: getattr(test, field) for field in TEST_FIELDS}
+    yield '[' + json.dumps(header)[:-1] + ', "questions": ['
+    for index, question in enumerate(export_questions(test)):
+        data = {field: getattr(question, field) for field in QUESTION_FIELDS}
+        data['choices'] = [
+            {field: getattr(choice, field) for field in CHOICE_FIELDS}
+            for choice in question.choices.all()
+        ]
+        yield (', ' if index else '') + json.dumps(data)
+    yield ']}]'
+
+
+def iter_csv_export(test):
+    """Stream a test in the importer's CSV layout, one row per choice."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    test_columns = [test.id, test.title, test.description, test.subject, test.time_limit, test.is_active]
+    for question in export_questions(test):
+        question_columns = [
+            question.text, question.question_type, question.points, question.order,
+            json.dumps(question.accepted_answers) if question.accepted_answers else '',
+        ]
+        choices = list(question.choices.all())
+        for choice in choices:
+            writer.writerow(test_columns + question_columns + [choice.text, choice.is_correct])
+        if not choices:
+            writer.writerow(test_columns + question_columns + ['', ''])
+        yield flush()
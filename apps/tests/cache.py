@@ -0,0 +1,52 @@
+from apps.common.cache import namespace_version, anamespace_version, bump_namespace, get_or_build, aget_or_build
+
+NAMESPACE = 'tests'
+EXAM_PAYLOAD_TIMEOUT = 60 * 60
+DETAIL_TIMEOUT = 60 * 60
+
+
+def get_test_version(test_id):
+    """Return the content version of a test, creating one on first use."""
+    return namespace_version(NAMESPACE, test_id)
+
+
+async def aget_test_version(test_id):
+    return await anamespace_version(NAMESPACE, test_id)
+
+
+def bump_test_version(test_id):
+    """
+    Invalidate everything cached for a test (exam document, detail, question
+    list, answer key) after it, its questions or its choices change.
+    """
+    bump_namespace(NAMESPACE, test_id)
+
+
+def exam_etag(test_id, version):
+    return f'"exam-{test_id}-{version}"'
+
+
+def get_exam_payload(test_id, version, render):
+    """
+    Return the cached `(is_active, body)` pair for the student-facing exam
+    document of a test, calling `render()` to build it on a miss.
+    """
+    return get_or_build(NAMESPACE, test_id, 'exam_payload', render, timeout=EXAM_PAYLOAD_TIMEOUT, version=version)
+
+
+async def aget_exam_payload(test_id, version, render):
+    return await aget_or_build(NAMESPACE, test_id, 'exam_payload', render, timeout=EXAM_PAYLOAD_TIMEOUT, version=version)
+
+
+def get_test_detail(test_id, render):
+    """Return the cached serialized test detail (with questions and choices)."""
+    return get_or_build(NAMESPACE, test_id, 'detail', render, timeout=DETAIL_TIMEOUT)
+
+
+def get_question_list(test_id, render):
+    """Return the cached serialized questions of a test."""
+    return get_or_build(NAMESPACE, test_id, 'questions', render, timeout=DETAIL_TIMEOUT)
+
+
+async def aget_question_list(test_id, render):
+    return await aget_or_build(NAMESPACE, test_id, 'questions', render, timeout=DETAIL_TIMEOUT)
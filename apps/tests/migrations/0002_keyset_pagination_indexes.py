@@ -0,0 +1,27 @@
+# Generated by Django 5.0.8 on 2026-10-18 02:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tests", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(
+                fields=["test", "order", "id"], name="question_test_order_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="test",
+            index=models.Index(
+                fields=["created_at", "id"], name="test_created_at_id_idx"
+            ),
+        ),
+    ]
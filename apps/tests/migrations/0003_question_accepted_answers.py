@@ -0,0 +1,22 @@
+# Generated by Django 5.0.8 on 2026-10-18 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tests", "0002_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="question",
+            name="accepted_answers",
+            field=models.JSONField(
+                blank=True,
+                default=list,
+                help_text="Accepted answers for text questions, compared ignoring case and extra whitespace",
+            ),
+        ),
+    ]
@@ -11,6 +11,15 @@ class Test(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='test_created_at_id_idx'),
+            models.Index(
+                fields=['created_at', 'id'], name='test_active_created_idx',
+                condition=models.Q(is_active=True)
+            ),
+        ]
+    
     def __str__(self):
         return self.title
 
@@ -26,9 +35,16 @@ class Question(models.Model):
     question_type = models.CharField(max_length=20, choices=QUESTION_TYPES)
     points = models.PositiveIntegerField(default=1)
     order = models.PositiveIntegerField(default=0)
+    accepted_answers = models.JSONField(
+        default=list, blank=True,
+        help_text="Accepted answers for text questions, compared ignoring case and extra whitespace"
+    )
     
     class Meta:
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['test', 'order', 'id'], name='question_test_order_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.text[:50]}..."
@@ -1,7 +1,12 @@
 from rest_framework import serializers
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from .models import Test, Question, Choice
+from .cache import bump_test_version
 
 class ChoiceSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    
     class Meta:
         model = Choice
         fields = ('id', 'text', 'is_correct')
@@ -9,32 +14,85 @@ class ChoiceSerializer(serializers.ModelSerializer):
             'is_correct': {'write_only': True}
         }
 
+def build_choices(question, choices_data):
+    """Unsaved Choice rows for `question`; submitted ids are ignored for new choices."""
+    return [
+        Choice(question=question, **{name: value for name, value in choice_data.items() if name != 'id'})
+        for choice_data in choices_data
+    ]
+
 class QuestionSerializer(serializers.ModelSerializer):
     choices = ChoiceSerializer(many=True, required=False)
+    accepted_answers = serializers.ListField(
+        child=serializers.CharField(max_length=255), required=False, write_only=True
+    )
     
     class Meta:
         model = Question
-        fields = ('id', 'text', 'question_type', 'points', 'order', 'choices')
+        fields = ('id', 'text', 'question_type', 'points', 'order', 'choices', 'accepted_answers')
+    
+    def validate(self, attrs):
+        question_type = attrs.get('question_type', getattr(self.instance, 'question_type', None))
+        if question_type != 'text' and attrs.get('accepted_answers'):
+            raise serializers.ValidationError({"accepted_answers": "Only text questions have accepted answers."})
+        
+        choices = attrs.get('choices')
+        if choices is None or question_type == 'text':
+            return attrs
+        
+        correct_count = sum(1 for choice in choices if choice.get('is_correct'))
+        if not choices:
+            raise serializers.ValidationError({"choices": "Choice questions need at least one choice."})
+        if question_type == 'single_choice' and correct_count != 1:
+            raise serializers.ValidationError({"choices": "Single choice questions need exactly one correct choice."})
+        if question_type == 'multiple_choice' and correct_count == 0:
+            raise serializers.ValidationError({"choices": "Multiple choice questions need at least one correct choice."})
+        return attrs
     
     def create(self, validated_data):
         choices_data = validated_data.pop('choices', [])
-        question = Question.objects.create(**validated_data)
         
-        for choice_data in choices_data:
-            Choice.objects.create(question=question, **choice_data)
+        with transaction.atomic():
+            question = Question.objects.create(**validated_data)
+            Choice.objects.bulk_create(build_choices(question, choices_data))
+            bump_test_version(question.test_id)
         
         return question
     
     def update(self, instance, validated_data):
-        choices_data = validated_data.pop('choices', [])
-        instance = super().update(instance, validated_data)
+        choices_data = validated_data.pop('choices', None)
         
-        if choices_data:
-            instance.choices.all().delete()
-            for choice_data in choices_data:
-                Choice.objects.create(question=instance, **choice_data)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if choices_data is not None:
+                self.sync_choices(instance, choices_data)
+                bump_test_version(instance.test_id)
         
         return instance
+    
+    def sync_choices(self, question, choices_data):
+        """Diff submitted choices by id: update changed ones, insert new ones, delete missing ones."""
+        existing = {choice.id: choice for choice in question.choices.all()}
+        changed, new = [], []
+        
+        for choice_data in choices_data:
+            choice = existing.pop(choice_data.get('id'), None)
+            if choice is None:
+                new.append(choice_data)
+                continue
+            
+            fields = {name: value for name, value in choice_data.items() if name != 'id'}
+            if any(getattr(choice, name) != value for name, value in fields.items()):
+                for name, value in fields.items():
+                    setattr(choice, name, value)
+                changed.append(choice)
+        
+        if existing:
+            Choice.objects.filter(id__in=existing).delete()
+        if changed:
+            Choice.objects.bulk_update(changed, ['text', 'is_correct'])
+        if new:
+            Choice.objects.bulk_create(build_choices(question, new))
 
 class TestSerializer(serializers.ModelSerializer):
     questions = QuestionSerializer(many=True, required=False)
@@ -47,35 +105,38 @@ class TestSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         questions_data = validated_data.pop('questions', [])
-        test = Test.objects.create(**validated_data)
         
-        for question_data in questions_data:
-            choices_data = question_data.pop('choices', [])
-            question = Question.objects.create(test=test, **question_data)
+        with transaction.atomic():
+            test = Test.objects.create(**validated_data)
             
-            for choice_data in choices_data:
-                Choice.objects.create(question=question, **choice_data)
+            questions = Question.objects.bulk_create([
+                Question(test=test, **{name: value for name, value in question_data.items() if name != 'choices'})
+                for question_data in questions_data
+            ])
+            Choice.objects.bulk_create([
+                choice
+                for question, question_data in zip(questions, questions_data)
+                for choice in build_choices(question, question_data.get('choices', []))
+            ])
+            bump_test_version(test.id)
         
+        prefetch_related_objects([test], 'questions__choices')
         return test
 
 class TestListSerializer(serializers.ModelSerializer):
-    question_count = serializers.SerializerMethodField()
+    question_count = serializers.IntegerField(read_only=True)
+    total_points = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Test
         fields = ('id', 'title', 'subject', 'time_limit', 'is_active', 
-                  'created_at', 'question_count')
-    
-    def get_question_count(self, obj):
-        return obj.questions.count()
+                  'created_at', 'question_count', 'total_points')
 
 class StudentTestSerializer(serializers.ModelSerializer):
-    question_count = serializers.SerializerMethodField()
+    question_count = serializers.IntegerField(read_only=True)
+    total_points = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Test
         fields = ('id', 'title', 'description', 'subject', 'time_limit', 
-                  'created_at', 'question_count')
-    
-    def get_question_count(self, obj):
-        return obj.questions.count()
\ No newline at end of file
+                  'created_at', 'question_count', 'total_points')
\ No newline at end of file
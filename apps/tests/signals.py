@@ -0,0 +1,30 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Test, Question, Choice
+from .cache import bump_test_version
+from .answer_key import forget_answer_key
+
+
+def invalidate_test(test_id):
+    bump_test_version(test_id)
+    forget_answer_key(test_id)
+
+
+@receiver([post_save, post_delete], sender=Test)
+def test_changed(sender, instance, **kwargs):
+    invalidate_test(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    invalidate_test(instance.test_id)
+
+
+@receiver([post_save, post_delete], sender=Choice)
+def choice_changed(sender, instance, **kwargs):
+    try:
+        test_id = instance.question.test_id
+    except Question.DoesNotExist:
+        # The question is being deleted in the same cascade and invalidates the test itself.
+        return
+    invalidate_test(test_id)
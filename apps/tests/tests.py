@@ -1,9 +1,17 @@
+import base64
+import io
+import json
 import pytest
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from .models import Test, Question, Choice
+from .answer_key import get_answer_key
+from . import bank
+from .bank import BankFormatError, iter_json_tests, iter_csv_tests
 
 User = get_user_model()
 
@@ -92,5 +100,298 @@ def test_student_can_view_tests(api_client, create_test):
     
     response = api_client.get(url)
     assert response.status_code == status.HTTP_200_OK
-    assert len(response.data) == 1
-    assert response.data[0]['title'] == test.title
\ No newline at end of file
+    assert response.data['count'] == 1
+    assert response.data['results'][0]['title'] == test.title
+
+@pytest.mark.django_db
+def test_answer_key_is_cached_and_invalidated(create_test, django_assert_num_queries):
+    test, _ = create_test()
+    question = Question.objects.create(test=test, text='Pick 4', question_type='single_choice', points=3)
+    wrong = Choice.objects.create(question=question, text='3', is_correct=False)
+    right = Choice.objects.create(question=question, text='4', is_correct=True)
+    
+    answer_key = get_answer_key(test.id)
+    assert answer_key[question.id].points == 3
+    assert answer_key[question.id].correct_choice_ids == frozenset({right.id})
+    assert answer_key[question.id].choice_ids == frozenset({wrong.id, right.id})
+    
+    with django_assert_num_queries(0):
+        assert get_answer_key(test.id) is answer_key
+    
+    wrong.is_correct = True
+    wrong.save()
+    
+    assert get_answer_key(test.id)[question.id].correct_choice_ids == frozenset({wrong.id, right.id})
+
+@pytest.mark.django_db
+def test_detail_and_questions_are_cached_until_the_test_changes(api_client, create_test, django_assert_num_queries):
+    test, teacher = create_test()
+    question = Question.objects.create(test=test, text='Pick 4', question_type='single_choice', points=3)
+    Choice.objects.create(question=question, text='4', is_correct=True)
+    api_client.force_authenticate(user=teacher)
+    detail_url = reverse('test-detail', kwargs={'pk': test.id})
+    questions_url = f'/api/v1/tests/{test.id}/questions/'
+    
+    assert api_client.get(detail_url).data['questions'][0]['text'] == 'Pick 4'
+    assert api_client.get(questions_url).data[0]['text'] == 'Pick 4'
+    with django_assert_num_queries(0):
+        api_client.get(detail_url)
+        api_client.get(questions_url)
+    
+    question.text = 'Pick four'
+    question.save()
+    assert api_client.get(detail_url).data['questions'][0]['text'] == 'Pick four'
+    assert api_client.get(questions_url).data[0]['text'] == 'Pick four'
+    assert api_client.get(reverse('test-detail', kwargs={'pk': test.id + 1})).status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_student_tests_annotates_counts_in_constant_queries(api_client, create_test):
+    first, teacher = create_test(title='First')
+    for points in (2, 3):
+        Question.objects.create(test=first, text='Q', question_type='text', points=points)
+    student = User.objects.create_user(email='student@example.com', password='testpass123', role='student')
+    api_client.force_authenticate(user=student)
+    url = reverse('test-student-tests')
+    
+    with CaptureQueriesContext(connection) as few_tests:
+        response = api_client.get(url)
+    assert response.data['results'][0]['question_count'] == 2
+    assert response.data['results'][0]['total_points'] == 5
+    
+    for index in range(5):
+        Test.objects.create(title=f'Extra {index}', subject='Math', created_by=teacher)
+    with CaptureQueriesContext(connection) as many_tests:
+        response = api_client.get(url)
+    assert response.data['count'] == 6
+    assert len(few_tests) == len(many_tests)
+
+@pytest.mark.django_db
+def test_student_tests_cursor_mode(api_client, create_test):
+    _, teacher = create_test(title='Test 0')
+    for index in range(1, 12):
+        Test.objects.create(title=f'Test {index}', subject='Math', created_by=teacher)
+    student = User.objects.create_user(email='student@example.com', password='testpass123', role='student')
+    api_client.force_authenticate(user=student)
+    
+    response = api_client.get(reverse('test-student-tests'), {'pagination': 'cursor'})
+    assert 'count' not in response.data
+    assert len(response.data['results']) == 10
+    
+    response = api_client.get(response.data['next'])
+    assert len(response.data['results']) == 2
+    assert response.data['next'] is None
+    
+    # Well-formed cursors with values that don't fit the ordering fields.
+    for values in [['yesterday', 1], ['2024-01-01T00:00:00+00:00', 'abc'], [None, 1], [[1], 1]]:
+        cursor = base64.urlsafe_b64encode(json.dumps({'p': values}).encode()).decode()
+        response = api_client.get(reverse('test-student-tests'), {'cursor': cursor})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_start_serves_cached_payload_with_etag(api_client, create_test, django_assert_num_queries):
+    test, _ = create_test()
+    question = Question.objects.create(test=test, text='2+2?', question_type='single_choice', points=1)
+    choice = Choice.objects.create(question=question, text='4', is_correct=True)
+    student = User.objects.create_user(email='student@example.com', password='testpass123', role='student')
+    api_client.force_authenticate(user=student)
+    url = reverse('test-start', kwargs={'pk': test.id})
+    
+    response = api_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    payload = response.json()
+    assert payload['questions'][0]['choices'] == [{'id': choice.id, 'text': '4'}]
+    etag = response['ETag']
+    
+    with django_assert_num_queries(0):
+        cached = api_client.get(url)
+        not_modified = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert cached.content == response.content
+    assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+    
+    choice.text = 'four'
+    choice.save()
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response['ETag'] != etag
+    assert response.json()['questions'][0]['choices'][0]['text'] == 'four'
+    
+    test.is_active = False
+    test.save()
+    assert api_client.get(url).status_code == status.HTTP_400_BAD_REQUEST
+
+START_QUERY_BUDGET = 3
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('question_count', [1, 10, 50])
+def test_start_stays_within_query_budget(api_client, create_test, query_budget, question_count):
+    test, _ = create_test()
+    for index in range(question_count):
+        question = Question.objects.create(test=test, text=f'Question {index}', question_type='single_choice', points=1)
+        Choice.objects.bulk_create([Choice(question=question, text=text, is_correct=text == 'a') for text in 'abcd'])
+    student = User.objects.create_user(email='student@example.com', password='testpass123', role='student')
+    api_client.force_authenticate(user=student)
+    url = reverse('test-start', kwargs={'pk': test.id})
+    
+    # The uncached exam document, then opening the session.
+    with query_budget(START_QUERY_BUDGET):
+        response = api_client.get(url)
+    assert len(response.json()['questions']) == question_count
+    with query_budget(START_QUERY_BUDGET):
+        response = api_client.post(url)
+    assert response.status_code == status.HTTP_201_CREATED
+
+@pytest.mark.django_db
+def test_update_question_diffs_choices_by_id(api_client, create_test):
+    test, teacher = create_test()
+    question = Question.objects.create(test=test, text='Primes?', question_type='multiple_choice', points=2)
+    kept = Choice.objects.create(question=question, text='2', is_correct=True)
+    renamed = Choice.objects.create(question=question, text='3', is_correct=False)
+    removed = Choice.objects.create(question=question, text='4', is_correct=False)
+    api_client.force_authenticate(user=teacher)
+    url = reverse('test-questions-detail', kwargs={'test_pk': test.id, 'pk': question.id})
+    
+    payload = {
+        'choices': [
+            {'id': kept.id, 'text': '2', 'is_correct': True},
+            {'id': renamed.id, 'text': 'three', 'is_correct': True},
+            {'text': '5', 'is_correct': True},
+        ]
+    }
+    response = api_client.patch(url, payload, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    
+    choices = {choice.text: choice for choice in question.choices.all()}
+    assert set(choices) == {'2', 'three', '5'}
+    assert choices['2'].id == kept.id
+    assert choices['three'].id == renamed.id and choices['three'].is_correct
+    assert not Choice.objects.filter(id=removed.id).exists()
+    assert [choice['text'] for choice in response.data['choices']] == ['2', 'three', '5']
+
+@pytest.mark.django_db
+def test_create_test_with_nested_questions_in_constant_queries(api_client, create_user):
+    teacher = create_user()
+    api_client.force_authenticate(user=teacher)
+    
+    def create(question_count):
+        payload = {
+            'title': f'{question_count} questions',
+            'subject': 'Mathematics',
+            'questions': [
+                {
+                    'text': f'Question {index}',
+                    'question_type': 'single_choice',
+                    'order': index,
+                    'choices': [{'text': 'yes', 'is_correct': True}, {'text': 'no', 'is_correct': False}]
+                }
+                for index in range(question_count)
+            ]
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.post(reverse('test-list'), payload, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        return response, len(queries)
+    
+    small, small_queries = create(2)
+    large, large_queries = create(60)
+    
+    assert small_queries == large_queries
+    assert Choice.objects.filter(question__test_id=large.data['id']).count() == 120
+    assert len(large.data['questions']) == 60
+
+
+BANK = [
+    {
+        'title': 'Algebra',
+        'subject': 'Mathematics',
+        'time_limit': 45,
+        'questions': [
+            {
+                'text': 'x + 1 = 3, x = ?',
+                'question_type': 'single_choice',
+                'points': 2,
+                'choices': [{'text': '2', 'is_correct': True}, {'text': '3', 'is_correct': False}]
+            },
+            {
+                'text': 'Explain "variable", briefly',
+                'question_type': 'text',
+                'order': 1,
+                'accepted_answers': ['a named value', 'x, "y" or z'],
+            }
+        ]
+    },
+    {'title': 'Empty', 'subject': 'History', 'questions': []}
+]
+
+def test_json_bank_parser_handles_chunk_boundaries():
+    body = json.dumps(BANK, indent=2).encode('utf-8')
+    assert list(iter_json_tests(io.BytesIO(body), chunk_size=7)) == BANK
+    
+    tricky = [{'title': 'a "quoted" } title\\', 'questions': [{'text': '[{\\"}]'}]}, {'title': ''}]
+    for chunk_size in (1, 2, 3, 5):
+        assert list(iter_json_tests(io.BytesIO(json.dumps(tricky).encode()), chunk_size=chunk_size)) == tricky
+
+def test_json_bank_parser_rejects_oversized_tests(monkeypatch):
+    monkeypatch.setattr(bank, 'MAX_TEST_SIZE', 100)
+    body = json.dumps([BANK[1], {'title': 'Big', 'description': 'x' * 200}]).encode()
+    tests = iter_json_tests(io.BytesIO(body), chunk_size=16)
+    assert next(tests) == BANK[1]
+    with pytest.raises(BankFormatError, match='larger than 100 characters'):
+        next(tests)
+
+def test_csv_bank_groups_tests_by_key():
+    header = ','.join(bank.CSV_COLUMNS)
+    row = '{key},Quiz,,Math,,,What?,text,1,,,,'
+    body = '\n'.join([header, row.format(key=1), row.format(key=2)]).encode()
+    # Identical test columns, but two keys: two tests.
+    assert [len(test['questions']) for test in iter_csv_tests(io.BytesIO(body))] == [1, 1]
+    
+    body = '\n'.join([header, row.format(key=1), row.format(key=2), row.format(key=1)]).encode()
+    with pytest.raises(BankFormatError, match="rows of test '1' are not consecutive"):
+        list(iter_csv_tests(io.BytesIO(body)))
+
+@pytest.mark.django_db
+def test_import_and_export_test_bank(api_client, create_user):
+    teacher = create_user()
+    api_client.force_authenticate(user=teacher)
+    url = reverse('test-import-tests')
+    
+    response = api_client.generic('POST', url, json.dumps(BANK), content_type='application/json')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['created'] == 2
+    algebra = Test.objects.get(id=response.data['test_ids'][0])
+    assert algebra.created_by == teacher
+    assert algebra.questions.count() == 2
+    assert Choice.objects.filter(question__test=algebra, is_correct=True).count() == 1
+    
+    for export_format, content_type in [('json', 'application/json'), ('csv', 'text/csv')]:
+        export = api_client.get(reverse('test-export', kwargs={'pk': algebra.id}), {'export_format': export_format})
+        assert export.status_code == status.HTTP_200_OK
+        body = b''.join(export.streaming_content)
+        
+        response = api_client.generic('POST', url, body, content_type=content_type)
+        assert response.status_code == status.HTTP_201_CREATED
+        copy = Test.objects.get(id=response.data['test_ids'][0])
+        # Including the accepted answers text questions are graded against.
+        assert list(copy.questions.values_list('text', 'question_type', 'points', 'accepted_answers')) == list(
+            algebra.questions.values_list('text', 'question_type', 'points', 'accepted_answers')
+        )
+        assert list(Choice.objects.filter(question__test=copy).values_list('text', 'is_correct')) == list(
+            Choice.objects.filter(question__test=algebra).values_list('text', 'is_correct')
+        )
+
+@pytest.mark.django_db
+def test_import_rejects_invalid_bank_atomically(api_client, create_user):
+    teacher = create_user()
+    api_client.force_authenticate(user=teacher)
+    invalid = BANK + [{
+        'title': 'Broken',
+        'subject': 'Mathematics',
+        'questions': [{'text': 'Pick one', 'question_type': 'single_choice', 'choices': [{'text': 'a'}]}]
+    }]
+    
+    response = api_client.generic('POST', reverse('test-import-tests'), json.dumps(invalid), content_type='application/json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.data['index'] == 2
+    assert not Test.objects.exists()
@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested import routers
-from .views import TestViewSet, QuestionViewSet
+from .views import TestViewSet, QuestionViewSet, start_exam, question_list
 
 router = DefaultRouter()
 router.register(r'tests', TestViewSet)
@@ -12,4 +13,11 @@ test_router.register(r'questions', QuestionViewSet, basename='test-questions')
 urlpatterns = [
     path('', include(router.urls)),
     path('', include(test_router.urls)),
-]
\ No newline at end of file
+]
+
+if settings.SERVER_MODE == 'asgi':
+    # Async GET handlers; the DRF views behind them serve the other methods.
+    urlpatterns = [
+        path('tests/<int:pk>/start/', start_exam, name='test-start'),
+        path('tests/<int:test_pk>/questions/', question_list, name='test-questions-list'),
+    ] + urlpatterns
\ No newline at end of file
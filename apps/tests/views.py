@@ -1,16 +1,54 @@
+import io
+from datetime import timedelta
+from functools import partial
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from django.http import Http404, HttpResponse, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.db.models import Count, Sum, prefetch_related_objects
+from django.db.models.functions import Coalesce
 from .models import Test, Question
 from .serializers import (
     TestSerializer, TestListSerializer, QuestionSerializer,
     StudentTestSerializer
 )
+from .cache import (
+    get_test_version, aget_test_version, get_exam_payload, aget_exam_payload, exam_etag, get_test_detail,
+    get_question_list, aget_question_list
+)
+from .bank import (
+    BankFormatError, InvalidTestError, iter_json_tests, iter_csv_tests, import_tests,
+    iter_json_export, iter_csv_export
+)
 from apps.common.permissions import IsTeacher, IsStudent, IsAdmin
+from apps.common.mixins import ReplicaReadMixin
+from apps.common.asyncviews import async_read_view, json_response, streaming_response
+from apps.results.models import TestSubmission
+from apps.results.grading import time_out_submissions
+from apps.results.serializers import SubmissionSessionSerializer
+
+def with_question_totals(queryset):
+    return queryset.annotate(
+        question_count=Count('questions'),
+        total_points=Coalesce(Sum('questions__points'), 0)
+    )
+
+def test_questions(test_id):
+    return Question.objects.filter(test_id=test_id).prefetch_related('choices').order_by('order', 'id')
 
-class TestViewSet(viewsets.ModelViewSet):
+class TestViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Test.objects.all()
+    replica_actions = ('list', 'student_tests')
+    cursor_ordering = ('-created_at', '-id')
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'student_tests', 'start']:
+            queryset = with_question_totals(queryset).order_by(*self.cursor_ordering)
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -20,7 +58,7 @@ class TestViewSet(viewsets.ModelViewSet):
         return TestSerializer
     
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'import_tests', 'export']:
             permission_classes = [IsTeacher | IsAdmin]
         elif self.action in ['student_tests', 'start']:
             permission_classes = [IsStudent]
@@ -31,44 +69,225 @@ class TestViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
     
+    def retrieve(self, request, pk=None):
+        """Serve the test with its questions from the cache, rebuilt when the test's version changes."""
+        try:
+            test_id = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
+        return Response(get_test_detail(test_id, self.render_detail))
+    
+    def render_detail(self):
+        test = self.get_object()
+        prefetch_related_objects([test], 'questions__choices')
+        return self.get_serializer(test).data
+    
     @action(detail=False, methods=['get'])
     def student_tests(self, request):
-        tests = Test.objects.filter(is_active=True)
+        tests = self.get_queryset().filter(is_active=True)
+        page = self.paginate_queryset(tests)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        
         serializer = self.get_serializer(tests, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_tests(self, request):
+        """
+        Import a test bank from the request body without buffering it: a JSON
+        array of tests (the TestSerializer format) or, with a text/csv body,
+        the CSV layout produced by the export action.
+        """
+        stream = request.stream or io.BytesIO()
+        if request.content_type.startswith('text/csv'):
+            tests = iter_csv_tests(stream)
+        else:
+            tests = iter_json_tests(stream)
+        
+        def validated_tests():
+            for index, data in enumerate(tests):
+                serializer = TestSerializer(data=data)
+                if not serializer.is_valid():
+                    raise InvalidTestError(index, serializer.errors)
+                yield serializer.validated_data
+        
+        try:
+            test_ids = import_tests(validated_tests(), created_by=request.user)
+        except InvalidTestError as error:
+            return Response(
+                {"detail": str(error), "index": error.index, "errors": error.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except BankFormatError as error:
+            return Response({"detail": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({'created': len(test_ids), 'test_ids': test_ids}, status=status.HTTP_201_CREATED)
+    
     @action(detail=True, methods=['get'])
-    def questions(self, request, pk=None):
+    def export(self, request, pk=None):
+        """Stream a test with its questions and choices as JSON or, with ?export_format=csv, CSV."""
         test = self.get_object()
-        questions = test.questions.all()
-        serializer = QuestionSerializer(questions, many=True)
-        return Response(serializer.data)
+        if request.query_params.get('export_format') == 'csv':
+            response = streaming_response(request, iter_csv_export(test), content_type='text/csv')
+            extension = 'csv'
+        else:
+            response = streaming_response(request, iter_json_export(test), content_type='application/json')
+            extension = 'json'
+        response['Content-Disposition'] = f'attachment; filename="test-{test.id}.{extension}"'
+        return response
     
-    @action(detail=True, methods=['get'])
+    @action(detail=True, methods=['get', 'post'])
     def start(self, request, pk=None):
-        test = self.get_object()
+        """
+        GET returns the exam document (cached, with an ETag); POST opens or
+        resumes the student's server-side session and returns the answers
+        autosaved so far.
+        """
+        if request.method == 'POST':
+            return self.open_session(request, pk)
+        
+        try:
+            test_id = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
+        return exam_response(request, test_id)
+    
+    def open_session(self, request, pk):
+        test = get_object_or_404(Test.objects.only('id', 'is_active', 'time_limit'), pk=pk)
         if not test.is_active:
             return Response(
                 {"detail": "This test is not active."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-            
-        serializer = self.get_serializer(test)
-        data = serializer.data
         
-        questions = test.questions.all().prefetch_related('choices')
-        questions_data = QuestionSerializer(questions, many=True).data
-        data['questions'] = questions_data
+        expires_at = timezone.now() + timedelta(minutes=test.time_limit) if test.time_limit else None
+        submission, created = TestSubmission.objects.get_or_create(
+            test=test, student=request.user, defaults={'expires_at': expires_at}
+        )
+        if submission.status == 'in_progress' and submission.is_expired():
+            time_out_submissions([submission.id])
+            return Response(
+                {"detail": "The time limit for this test has expired."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if submission.status != 'in_progress':
+            return Response(
+                {"detail": "You have already completed this test."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        return Response(data)
+        if created:
+            # A new session has no answers yet; skip the prefetch queries.
+            submission._prefetched_objects_cache = {'answers': submission.answers.none()}
+        else:
+            prefetch_related_objects([submission], 'answers__selected_choices')
+        return Response(
+            SubmissionSessionSerializer(submission).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+
+def exam_response(request, test_id):
+    """
+    The cached exam document with its ETag, or a 304 when the client's copy
+    is current. Serves GET `/tests/{id}/start/` under WSGI.
+    """
+    version = get_test_version(test_id)
+    etag = exam_etag(test_id, version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return exam_document_response(etag, *get_exam_payload(test_id, version, partial(render_exam, test_id)))
+
+async def aexam_response(request, test_id):
+    """`exam_response` on the async cache API and ORM, for `start_exam`."""
+    version = await aget_test_version(test_id)
+    etag = exam_etag(test_id, version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return exam_document_response(etag, *await aget_exam_payload(test_id, version, partial(arender_exam, test_id)))
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+def exam_document_response(etag, is_active, body):
+    if not is_active:
+        return json_response({"detail": "This test is not active."}, status=status.HTTP_400_BAD_REQUEST)
+    
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def etag_matches(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    candidates = [candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')]
+    return etag in candidates
 
 class QuestionViewSet(viewsets.ModelViewSet):
+    """Questions of one test; also serves `GET /tests/{id}/questions/` to any authenticated user."""
     serializer_class = QuestionSerializer
-    permission_classes = [IsTeacher | IsAdmin]
+    # A test's questions are listed in full, like the former TestViewSet.questions action.
+    pagination_class = None
     
     def get_queryset(self):
-        return Question.objects.filter(test_id=self.kwargs['test_pk'])
+        return test_questions(self.kwargs['test_pk'])
+    
+    def list(self, request, *args, **kwargs):
+        try:
+            test_id = int(self.kwargs['test_pk'])
+        except (TypeError, ValueError):
+            raise Http404
+        return Response(get_question_list(test_id, partial(render_questions, test_id)))
+    
+    def get_permissions(self):
+        if self.action in ['list', 'retrieve']:
+            permission_classes = [permissions.IsAuthenticated]
+        else:
+            permission_classes = [IsTeacher | IsAdmin]
+        return [permission() for permission in permission_classes]
     
     def perform_create(self, serializer):
         test = get_object_or_404(Test, pk=self.kwargs['test_pk'])
-        serializer.save(test=test)
\ No newline at end of file
+        serializer.save(test=test)
+
+@async_read_view(TestViewSet.as_view({'get': 'start', 'post': 'start'}), [IsStudent])
+async def start_exam(request, pk):
+    """Async GET of `TestViewSet.start`, routed under SERVER_MODE=asgi."""
+    return await aexam_response(request, pk)
+
+def render_exam(test_id):
+    test = with_question_totals(Test.objects.filter(pk=test_id)).first()
+    if test is None:
+        raise Http404
+    if not test.is_active:
+        return False, b''
+    return True, exam_document(test, list(test_questions(test_id)))
+
+async def arender_exam(test_id):
+    test = await with_question_totals(Test.objects.filter(pk=test_id)).afirst()
+    if test is None:
+        raise Http404
+    if not test.is_active:
+        return False, b''
+    return True, exam_document(test, [question async for question in test_questions(test_id)])
+
+def exam_document(test, questions):
+    """Render the student-facing exam document (without is_correct) to JSON bytes."""
+    data = StudentTestSerializer(test).data
+    data['questions'] = QuestionSerializer(questions, many=True).data
+    return JSONRenderer().render(data)
+
+@async_read_view(QuestionViewSet.as_view({'get': 'list', 'post': 'create'}), [permissions.IsAuthenticated])
+async def question_list(request, test_pk):
+    """Async GET of `QuestionViewSet.list`, routed under SERVER_MODE=asgi."""
+    return json_response(await aget_question_list(test_pk, partial(arender_questions, test_pk)))
+
+def render_questions(test_id):
+    return QuestionSerializer(list(test_questions(test_id)), many=True).data
+
+async def arender_questions(test_id):
+    return QuestionSerializer([question async for question in test_questions(test_id)], many=True).data
@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, router
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from apps.common.cache import CACHE_ERRORS, cache_call
+
+User = get_user_model()
+
+AUTH_VERSION_KEY = 'users:auth_version:{user_id}'
+
+# Claim -> User field loaded on the token user; every other field is
+# deferred and loaded from the database only if a view reads it.
+TOKEN_USER_CLAIMS = {
+    'user_id': 'id',
+    'email': 'email',
+    'role': 'role',
+    'auth_version': 'auth_version',
+}
+
+
+def token_claims(user):
+    return {claim: getattr(user, field) for claim, field in TOKEN_USER_CLAIMS.items() if claim != 'user_id'}
+
+
+def auth_version_timeout():
+    return int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+
+def remember_auth_version(user):
+    """
+    Cache the auth_version the user's new tokens carry, so that checking
+    them needs no query while the entry lives.
+    """
+    cache_call('add', AUTH_VERSION_KEY.format(user_id=user.pk), user.auth_version, timeout=auth_version_timeout())
+
+
+def revoke_tokens(user):
+    """
+    Reject access tokens issued before the user's current auth_version.
+    Refresh tokens are checked against the database, so the entry only has
+    to outlive the access tokens already handed out.
+    """
+    cache_call('set', AUTH_VERSION_KEY.format(user_id=user.pk), user.auth_version, timeout=auth_version_timeout())
+
+
+def is_revoked(user_id, auth_version):
+    """
+    Compare a token's auth_version with the user's current one. The cached
+    version is trusted only when the shared cache answers: on a miss
+    (expired or evicted) or while it is down, when a revocation may have
+    gone to another process's local cache, the primary is asked instead.
+    """
+    key = AUTH_VERSION_KEY.format(user_id=user_id)
+    try:
+        current = caches['default'].get(key)
+        reachable = True
+    except CACHE_ERRORS:
+        current, reachable = None, False
+    if current is None:
+        current = User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).values_list('auth_version', flat=True).first()
+        if current is None:
+            # Deleted since the token was issued.
+            return True
+        if reachable:
+            # `add`, so a revocation stored meanwhile is not overwritten.
+            cache_call('add', key, current, timeout=auth_version_timeout())
+    return current != auth_version
+
+
+class TokenUserAuthentication(JWTAuthentication):
+    """
+    Authenticate from the claims of the access token alone. The user is a
+    `User` instance built from the token (id, email, role, auth_version)
+    without a query, so it still works as a ForeignKey value. Tokens of a
+    user whose role, password or active flag changed since are rejected
+    through the cached auth_version, or the database when it is not
+    cached. Tokens without these claims fall back to a database lookup.
+    
+    The user holds the claims as of the token's issue, not the current
+    row: views that save the user must load it from the database first.
+    """
+    
+    def get_user(self, validated_token):
+        if any(claim not in validated_token for claim in TOKEN_USER_CLAIMS):
+            return super().get_user(validated_token)
+        
+        if is_revoked(validated_token['user_id'], validated_token['auth_version']):
+            raise AuthenticationFailed('Token has been revoked.', code='token_revoked')
+        
+        return User.from_db(
+            router.db_for_read(User),
+            list(TOKEN_USER_CLAIMS.values()),
+            [validated_token[claim] for claim in TOKEN_USER_CLAIMS],
+        )
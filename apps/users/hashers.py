@@ -0,0 +1,94 @@
+import random
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: lock the slot files with msvcrt instead.
+    fcntl = None
+    import msvcrt
+
+# How often a hash waiting for a free slot checks again.
+SLOT_POLL_INTERVAL = 0.005
+
+
+class TunedHasherMixin:
+    """Take the cost parameters from PASSWORD_HASHER_OPTIONS[options_key]."""
+    options_key = None
+    
+    def __init__(self):
+        for name, value in settings.PASSWORD_HASHER_OPTIONS.get(self.options_key, {}).items():
+            setattr(self, name, value)
+
+
+class TunedScryptPasswordHasher(TunedHasherMixin, ScryptPasswordHasher):
+    options_key = 'scrypt'
+
+
+class TunedArgon2PasswordHasher(TunedHasherMixin, Argon2PasswordHasher):
+    options_key = 'argon2'
+
+
+class TunedPBKDF2PasswordHasher(TunedHasherMixin, PBKDF2PasswordHasher):
+    options_key = 'pbkdf2'
+
+
+class HashingBusy(Exception):
+    """More password hashes are waiting on this server than PASSWORD_HASH_QUEUE allows."""
+
+
+def _try_lock(slot):
+    """Lock an open slot file without blocking; returns False while another holder has it."""
+    try:
+        if fcntl:
+            fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(slot.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _lock_any(kind, count):
+    """
+    Lock one of `count` slot files of `kind` in PASSWORD_HASH_SLOTS_DIR and
+    return it open; closing it (or the process exiting) frees the slot.
+    Returns None when every slot is held, by any process on the server.
+    """
+    directory = Path(settings.PASSWORD_HASH_SLOTS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    first = random.randrange(count)
+    for number in range(count):
+        slot = open(directory / f'{kind}-{(first + number) % count}', 'a')
+        if _try_lock(slot):
+            return slot
+        slot.close()
+    return None
+
+
+@contextmanager
+def hashing_slot():
+    """
+    Hold one of the server's PASSWORD_HASH_WORKERS hashing slots. The slots
+    are file locks, so the bound holds across all worker processes. Past
+    PASSWORD_HASH_QUEUE hashes waiting for one, or after waiting
+    PASSWORD_HASH_WAIT seconds, HashingBusy is raised instead of queueing
+    without limit.
+    """
+    ticket = _lock_any('ticket', settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE)
+    if ticket is None:
+        raise HashingBusy
+    try:
+        deadline = time.monotonic() + settings.PASSWORD_HASH_WAIT
+        while (slot := _lock_any('slot', settings.PASSWORD_HASH_WORKERS)) is None:
+            if time.monotonic() >= deadline:
+                raise HashingBusy
+            time.sleep(SLOT_POLL_INTERVAL)
+        with slot:
+            yield
+    finally:
+        ticket.close()
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.8 on 2026-10-18 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_hot_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="auth_version",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Bumped when the role, password or active flag changes; revokes older tokens",
+            ),
+        ),
+    ]
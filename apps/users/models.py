@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from django.contrib.auth.hashers import check_password
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -33,11 +34,53 @@ class User(AbstractUser):
     username = None
     email = models.EmailField(unique=True)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='student')
+    auth_version = models.PositiveIntegerField(
+        default=0, help_text="Bumped when the role, password or active flag changes; revokes older tokens"
+    )
     
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name']
     
     objects = UserManager()
     
+    # Changing one of these invalidates the access tokens issued before.
+    AUTH_FIELDS = ('role', 'is_active', 'password')
+    
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['role', 'id'], name='user_role_id_idx'),
+        ]
+    
     def __str__(self):
-        return self.email
\ No newline at end of file
+        return self.email
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        user._loaded_auth_fields = user.auth_fields()
+        return user
+    
+    def auth_fields(self):
+        return {field: self.__dict__[field] for field in self.AUTH_FIELDS if field in self.__dict__}
+    
+    def check_password(self, raw_password):
+        def rehash(raw_password):
+            self.set_password(raw_password)
+            self._password = None
+            # Same password, new hash or parameters: keep the issued tokens valid.
+            if getattr(self, '_loaded_auth_fields', None):
+                self._loaded_auth_fields['password'] = self.password
+            self.save(update_fields=['password'])
+        return check_password(raw_password, self.password, rehash)
+    
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_auth_fields', None)
+        self.auth_version_bumped = bool(loaded) and any(
+            self.__dict__.get(field, value) != value for field, value in loaded.items()
+        )
+        if self.auth_version_bumped:
+            self.auth_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'auth_version'}
+        super().save(*args, **kwargs)
+        self._loaded_auth_fields = self.auth_fields()
\ No newline at end of file
@@ -1,6 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import remember_auth_version, token_claims
 
 User = get_user_model()
 
@@ -26,4 +30,28 @@ class RegisterSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data.pop('password2')
         user = User.objects.create_user(**validated_data)
-        return user
\ No newline at end of file
+        return user
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Embed the claims TokenUserAuthentication builds the user from."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim, value in token_claims(user).items():
+            token[claim] = value
+        remember_auth_version(user)
+        return token
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuse to refresh tokens issued before the user's current auth_version."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if 'auth_version' in refresh:
+            current = User.objects.filter(
+                **{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}
+            ).values_list('auth_version', flat=True).first()
+            if current != refresh['auth_version']:
+                raise AuthenticationFailed('Token has been revoked.', code='token_revoked')
+        return super().validate(attrs)
@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.common.cache import bump_namespace
+from apps.stats.cache import bump_student_stats
+from .authentication import revoke_tokens
+
+User = get_user_model()
+
+PROFILE_NAMESPACE = 'users'
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    bump_namespace(PROFILE_NAMESPACE, instance.pk)
+    # Student stats include the email.
+    bump_student_stats(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def revoke_outdated_tokens(sender, instance, **kwargs):
+    if getattr(instance, 'auth_version_bumped', False):
+        revoke_tokens(instance)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    instance.auth_version += 1
+    revoke_tokens(instance)
@@ -1,8 +1,14 @@
 import pytest
+import time
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password, get_hasher
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from . import hashers
 
 User = get_user_model()
 
@@ -60,4 +66,187 @@ def test_get_user_profile(api_client, create_user):
     
     response = api_client.get(url)
     assert response.status_code == status.HTTP_200_OK
-    assert response.data['email'] == user.email
\ No newline at end of file
+    assert response.data['email'] == user.email
+
+@pytest.mark.django_db
+def test_user_list_keyset_pagination(api_client, create_user):
+    admin = create_user(email='admin@example.com', role='admin')
+    for index in range(24):
+        create_user(email=f'user{index}@example.com')
+    api_client.force_authenticate(user=admin)
+    
+    seen = []
+    pages = []
+    response = api_client.get(reverse('user_list'), {'pagination': 'cursor'})
+    while True:
+        assert response.status_code == status.HTTP_200_OK
+        assert 'count' not in response.data
+        seen.extend(user['id'] for user in response.data['results'])
+        pages.append(response.data)
+        if response.data['next'] is None:
+            break
+        response = api_client.get(response.data['next'])
+    
+    assert seen == sorted(User.objects.values_list('id', flat=True))
+    assert [len(page['results']) for page in pages] == [10, 10, 5]
+    
+    response = api_client.get(pages[-1]['previous'])
+    assert response.data['results'] == pages[1]['results']
+
+@pytest.mark.django_db
+def test_user_list_can_skip_count(api_client, create_user):
+    admin = create_user(email='admin@example.com', role='admin')
+    for index in range(10):
+        create_user(email=f'user{index}@example.com')
+    api_client.force_authenticate(user=admin)
+    
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.get(reverse('user_list'), {'count': 'false'})
+    
+    assert 'count' not in response.data
+    assert len(response.data['results']) == 10
+    assert response.data['next'] is not None
+    assert not any('COUNT(' in query['sql'] for query in queries)
+    
+    response = api_client.get(response.data['next'])
+    assert len(response.data['results']) == 1
+    assert response.data['next'] is None
+
+USER_LIST_QUERY_BUDGET = 2
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('user_count', [5, 50, 200])
+def test_user_list_stays_within_query_budget(api_client, create_user, query_budget, user_count):
+    admin = create_user(email='admin@example.com', role='admin')
+    User.objects.bulk_create([
+        User(email=f'user{index}@example.com', role='student', first_name='Test', last_name='User')
+        for index in range(user_count)
+    ])
+    api_client.force_authenticate(user=admin)
+    
+    # The page and its count.
+    with query_budget(USER_LIST_QUERY_BUDGET):
+        response = api_client.get(reverse('user_list'))
+    assert response.data['count'] == user_count + 1
+    with query_budget(USER_LIST_QUERY_BUDGET):
+        response = api_client.get(reverse('user_list'), {'pagination': 'cursor', 'role': 'student'})
+    assert len(response.data['results']) == min(user_count, 10)
+
+@pytest.fixture
+def login(api_client):
+    # Revocation entries outlive the rolled-back users whose ids get reused.
+    cache.clear()
+    
+    def _login(email='test@example.com', password='testpass123'):
+        response = api_client.post(reverse('token_obtain_pair'), {'email': email, 'password': password})
+        assert response.status_code == status.HTTP_200_OK
+        return response.data
+    return _login
+
+@pytest.mark.django_db
+def test_access_token_authenticates_without_loading_the_user(api_client, create_user, login):
+    teacher = create_user(email='teacher@example.com', role='teacher')
+    tokens = login('teacher@example.com')
+    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+    
+    response = api_client.post('/api/v1/tests/', {'title': 'Exam', 'subject': 'Math', 'time_limit': 30})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['created_by'] == teacher.email
+    
+    api_client.get(reverse('user_detail'))
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.get(reverse('user_detail'))
+    assert response.data['first_name'] == 'Test'
+    assert len(queries) == 0
+
+@pytest.mark.django_db
+def test_role_change_revokes_issued_tokens(api_client, create_user, login):
+    user = create_user(role='teacher')
+    tokens = login()
+    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+    assert api_client.get('/api/v1/tests/').status_code == status.HTTP_200_OK
+    
+    user = User.objects.get(pk=user.pk)
+    user.role = 'student'
+    user.save()
+    
+    assert api_client.get('/api/v1/tests/').status_code == status.HTTP_401_UNAUTHORIZED
+    api_client.credentials()
+    response = api_client.post(reverse('token_refresh'), {'refresh': tokens['refresh']})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    
+    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {login()["access"]}')
+    assert api_client.get(reverse('user_detail')).data['role'] == 'student'
+
+@pytest.mark.django_db
+def test_revocation_is_checked_in_the_database_without_the_cache(api_client, create_user, login, monkeypatch):
+    user = create_user(role='teacher')
+    tokens = login()
+    User.objects.filter(pk=user.pk).update(role='student', auth_version=1)
+    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+    
+    # The deny-list entry was evicted.
+    cache.clear()
+    assert api_client.get('/api/v1/tests/').status_code == status.HTTP_401_UNAUTHORIZED
+    
+    # The shared cache is down.
+    cache.clear()
+    def unreachable(*args, **kwargs):
+        raise OSError('cache down')
+    monkeypatch.setattr(caches['default'], 'get', unreachable)
+    assert api_client.get('/api/v1/tests/').status_code == status.HTTP_401_UNAUTHORIZED
+
+@pytest.mark.django_db
+def test_profile_update_does_not_write_back_token_claims(api_client, create_user, login):
+    user = create_user()
+    tokens = login()
+    User.objects.filter(pk=user.pk).update(email='renamed@example.com')
+    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+    
+    response = api_client.patch(reverse('user_detail'), {'first_name': 'Changed'})
+    assert response.status_code == status.HTTP_200_OK
+    user.refresh_from_db()
+    assert (user.email, user.first_name) == ('renamed@example.com', 'Changed')
+
+@pytest.mark.django_db
+def test_login_upgrades_the_password_hash_and_keeps_tokens(api_client, create_user, login):
+    user = create_user()
+    User.objects.filter(pk=user.pk).update(password=make_password('testpass123', hasher='pbkdf2_sha1'))
+    
+    tokens = login()
+    user.refresh_from_db()
+    assert user.password.startswith(f'{get_hasher().algorithm}$')
+    assert user.auth_version == 0
+    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+    assert api_client.get(reverse('user_detail')).status_code == status.HTTP_200_OK
+
+@pytest.mark.django_db
+def test_login_is_refused_while_the_hashing_queue_is_full(api_client, create_user, settings, tmp_path):
+    create_user()
+    settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE = 1, 0
+    settings.PASSWORD_HASH_SLOTS_DIR = str(tmp_path)
+    
+    # Held as another worker process would hold it.
+    with hashers.hashing_slot():
+        response = api_client.post(reverse('token_obtain_pair'), {'email': 'test@example.com', 'password': 'testpass123'})
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response['Retry-After'] == '1'
+        
+        # Outside the login and register views passwords hash without a slot.
+        assert User.objects.create_user(email='other@example.com', password='testpass123').check_password('testpass123')
+    
+    response = api_client.post(reverse('token_obtain_pair'), {'email': 'test@example.com', 'password': 'testpass123'})
+    assert response.status_code == status.HTTP_200_OK
+
+@pytest.mark.django_db
+def test_login_waits_for_a_hashing_slot_until_the_deadline(api_client, create_user, settings, tmp_path):
+    create_user()
+    settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE = 1, 1
+    settings.PASSWORD_HASH_SLOTS_DIR = str(tmp_path)
+    settings.PASSWORD_HASH_WAIT = 0.05
+    
+    with hashers.hashing_slot():
+        started = time.monotonic()
+        response = api_client.post(reverse('token_obtain_pair'), {'email': 'test@example.com', 'password': 'testpass123'})
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert time.monotonic() - started < 1
@@ -1,11 +1,13 @@
+from django.conf import settings
 from django.urls import path
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import RegisterView, UserDetailView, UserListView
+from rest_framework_simplejwt.views import TokenRefreshView
+from .views import LoginView, RegisterView, UserDetailView, UserListView, profile
 
 urlpatterns = [
-    path('auth/login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('auth/login/', LoginView.as_view(), name='token_obtain_pair'),
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('auth/register/', RegisterView.as_view(), name='register'),
-    path('users/me/', UserDetailView.as_view(), name='user_detail'),
+    # Under ASGI, GET is async and PUT and PATCH go on to UserDetailView.
+    path('users/me/', profile if settings.SERVER_MODE == 'asgi' else UserDetailView.as_view(), name='user_detail'),
     path('users/', UserListView.as_view(), name='user_list'),
 ]
\ No newline at end of file
@@ -1,13 +1,46 @@
+from functools import partial
 from rest_framework import generics, permissions, status
+from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
 from .serializers import UserSerializer, RegisterSerializer
+from .hashers import HashingBusy, hashing_slot
 from apps.common.permissions import IsAdmin
+from apps.common.mixins import ReplicaReadMixin
+from apps.common.cache import get_or_build, aget_or_build
+from apps.common.asyncviews import async_read_view, json_response
+from .signals import PROFILE_NAMESPACE
 
 User = get_user_model()
 
-class RegisterView(generics.CreateAPIView):
+class HashingUnavailable(APIException):
+    status_code = 503
+    default_detail = 'Too many sign-ins at once, try again in a moment.'
+    default_code = 'hashing_busy'
+    # Sent as Retry-After by DRF's exception handler.
+    wait = 1
+
+class HashingSlotMixin:
+    """
+    Handle POSTs, which hash a password, in one of the server's hashing
+    slots, and answer 503 with Retry-After while every slot is taken.
+    """
+    
+    def post(self, request, *args, **kwargs):
+        with hashing_slot():
+            return super().post(request, *args, **kwargs)
+    
+    def handle_exception(self, exc):
+        if isinstance(exc, HashingBusy):
+            exc = HashingUnavailable()
+        return super().handle_exception(exc)
+
+class LoginView(HashingSlotMixin, TokenObtainPairView):
+    pass
+
+class RegisterView(HashingSlotMixin, generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = (permissions.AllowAny,)
     serializer_class = RegisterSerializer
@@ -17,9 +50,37 @@ class UserDetailView(generics.RetrieveUpdateAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     
     def get_object(self):
-        return self.request.user
+        if self.request.method in permissions.SAFE_METHODS:
+            return self.request.user
+        # The token user carries the email and role as of login, and saving
+        # it would write them back; update the current row instead.
+        return User.objects.using(DEFAULT_DB_ALIAS).get(pk=self.request.user.pk)
+    
+    def retrieve(self, request, *args, **kwargs):
+        user = self.get_object()
+        return Response(get_or_build(PROFILE_NAMESPACE, user.pk, 'profile', partial(render_profile, user.pk)))
+
+@async_read_view(UserDetailView.as_view(), [permissions.IsAuthenticated])
+async def profile(request):
+    """Async GET of `UserDetailView`, routed under SERVER_MODE=asgi."""
+    user_id = request.user.pk
+    return json_response(await aget_or_build(PROFILE_NAMESPACE, user_id, 'profile', partial(arender_profile, user_id)))
+
+def render_profile(user_id):
+    return UserSerializer(User.objects.only(*UserSerializer.Meta.fields).get(pk=user_id)).data
 
-class UserListView(generics.ListAPIView):
+async def arender_profile(user_id):
+    return UserSerializer(await User.objects.only(*UserSerializer.Meta.fields).aget(pk=user_id)).data
+
+class UserListView(ReplicaReadMixin, generics.ListAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
-    permission_classes = (IsAdmin,)
\ No newline at end of file
+    permission_classes = (IsAdmin,)
+    cursor_ordering = ('id',)
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        role = self.request.query_params.get('role')
+        if role in dict(User.ROLE_CHOICES):
+            queryset = queryset.filter(role=role)
+        return queryset
\ No newline at end of file
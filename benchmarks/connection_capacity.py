@@ -0,0 +1,212 @@
+"""
+Compare how the WSGI and ASGI server modes cope with many open connections.
+
+    python -m benchmarks.connection_capacity --workers 2 --idle 0,10,100,500
+    python -m benchmarks.connection_capacity --modes asgi --idle 0,1000,5000 --requests 500
+
+For each mode in `--modes`, gunicorn is started the way gunicorn.conf.py
+runs it (`SERVER_MODE=wsgi`: sync workers; `SERVER_MODE=asgi`: uvicorn
+workers) with `--workers` workers, against a temporary SQLite database
+holding one test and a student. At each level of `--idle`, that many clients
+connect and send an unfinished request, like phones on a bad connection,
+and hold on; meanwhile `--requests` student reads (exam start, questions,
+/users/me/ and student stats, `--concurrency` at a time) are timed.
+
+Reports per mode and idle level the reads that succeeded, failed or timed
+out after `--timeout` seconds, their p50/p95 latency and reads per second.
+A sync worker is pinned by each idle connection it accepts, so WSGI stalls
+once the idle clients outnumber its workers.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+HOST = '127.0.0.1'
+
+
+def seed(questions):
+    """Create a test with `questions` questions and a student; returns (test id, the student's access token)."""
+    from django.contrib.auth import get_user_model
+    from apps.tests.models import Test, Question, Choice
+    from apps.users.serializers import ClaimsTokenObtainPairSerializer
+
+    User = get_user_model()
+    teacher = User.objects.create_user(email='teacher@bench.local', password='bench-password-123', role='teacher')
+    student = User.objects.create_user(email='student@bench.local', password='bench-password-123', role='student')
+    test = Test.objects.create(title='Exam', subject='Benchmark', created_by=teacher, time_limit=60)
+    question_rows = Question.objects.bulk_create([
+        Question(test=test, text=f'Question {number}', question_type='single_choice', points=1, order=number)
+        for number in range(questions)
+    ])
+    Choice.objects.bulk_create([
+        Choice(question=question, text=str(number), is_correct=number == 0)
+        for question in question_rows
+        for number in range(4)
+    ])
+    return test.id, str(ClaimsTokenObtainPairSerializer.get_token(student).access_token)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, workers, port, env, log):
+    server = subprocess.Popen(
+        ['gunicorn', '--bind', f'{HOST}:{port}', '--workers', str(workers)],
+        cwd=BASE_DIR, env={**env, 'SERVER_MODE': mode}, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f'gunicorn ({mode}) did not start, see {log.name}')
+
+
+async def fetch(port, path, token, timeout):
+    """GET `path`; returns (status, seconds), with status None on a timeout or connection error."""
+    started = time.perf_counter()
+    writer = None
+
+    async def exchange():
+        nonlocal writer
+        reader, writer = await asyncio.open_connection(HOST, port)
+        writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: {HOST}\r\nAuthorization: Bearer {token}\r\n'
+            f'Connection: close\r\n\r\n'.encode()
+        )
+        await writer.drain()
+        return await reader.read()
+
+    try:
+        # asyncio.wait_for rather than asyncio.timeout(), which needs Python 3.11.
+        response = await asyncio.wait_for(exchange(), timeout)
+        status = int(response.split(b' ', 2)[1])
+    except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+        status = None
+    finally:
+        if writer is not None:
+            writer.close()
+    return status, time.perf_counter() - started
+
+
+async def hold_idle(port, count):
+    """Open `count` connections that send the start of a request and then go quiet."""
+    async def open_one():
+        try:
+            _, writer = await asyncio.open_connection(HOST, port)
+        except OSError:
+            return None
+        writer.write(f'GET /api/v1/users/me/ HTTP/1.1\r\nHost: {HOST}\r\n'.encode())
+        return writer
+
+    writers = []
+    for start in range(0, count, 100):
+        writers.extend(await asyncio.gather(*(open_one() for _ in range(min(100, count - start)))))
+    return [writer for writer in writers if writer is not None]
+
+
+async def measure(port, test_id, token, idle, requests, concurrency, timeout):
+    paths = [
+        f'/api/v1/tests/{test_id}/start/',
+        f'/api/v1/tests/{test_id}/questions/',
+        '/api/v1/users/me/',
+        '/api/v1/stats/student/',
+    ]
+    # Warm the caches so both modes serve the same hits.
+    for path in paths:
+        await fetch(port, path, token, timeout)
+
+    idle_writers = await hold_idle(port, idle)
+    await asyncio.sleep(0.5)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(number):
+        async with semaphore:
+            return await fetch(port, paths[number % len(paths)], token, timeout)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(number) for number in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    for writer in idle_writers:
+        writer.close()
+    await asyncio.sleep(0.5)
+
+    latencies = sorted(seconds for status, seconds in results if status == 200)
+    return {
+        'idle': len(idle_writers),
+        'ok': len(latencies),
+        'failed': sum(1 for status, _ in results if status not in (200, None)),
+        'timed_out': sum(1 for status, _ in results if status is None),
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else None,
+        'p95_ms': latencies[int(0.95 * (len(latencies) - 1))] * 1000 if latencies else None,
+        'per_second': len(latencies) / elapsed,
+    }
+
+
+def print_row(mode, row):
+    def ms(value):
+        return 'n/a' if value is None else f'{value:.1f}'
+    print(f'{mode:<5} {row["idle"]:>6} {row["ok"]:>6} {row["failed"]:>6} {row["timed_out"]:>9} '
+          f'{ms(row["p50_ms"]):>8} {ms(row["p95_ms"]):>8} {row["per_second"]:>8.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default='wsgi,asgi', help='Comma-separated SERVER_MODE values.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--idle', default='0,10,100,500', help='Comma-separated numbers of idle connections.')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--questions', type=int, default=20)
+    options = parser.parse_args()
+
+    directory = Path(tempfile.mkdtemp(prefix='connection-capacity-'))
+    env = {
+        **os.environ,
+        'DATABASE_URL': f'sqlite:///{directory / "db.sqlite3"}',
+        'PROMETHEUS_MULTIPROC_DIR': str(directory / 'prometheus'),
+        'DJANGO_SETTINGS_MODULE': 'config.settings',
+    }
+    os.environ.update(env)
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+    test_id, token = seed(options.questions)
+
+    print(f'{"mode":<5} {"idle":>6} {"ok":>6} {"failed":>6} {"timed out":>9} {"p50 ms":>8} {"p95 ms":>8} {"reads/s":>8}')
+    for mode in options.modes.split(','):
+        port = free_port()
+        with open(directory / f'{mode}.log', 'w') as log:
+            server = start_server(mode, options.workers, port, env, log)
+            try:
+                for idle in (int(level) for level in options.idle.split(',')):
+                    row = asyncio.run(measure(
+                        port, test_id, token, idle, options.requests, options.concurrency, options.timeout
+                    ))
+                    print_row(mode, row)
+            finally:
+                server.terminate()
+                server.wait()
+    print(f'Server logs in {directory}')
+
+
+if __name__ == '__main__':
+    main()
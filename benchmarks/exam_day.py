@@ -0,0 +1,323 @@
+"""
+Load test modelled on an exam-day spike: every student logs in, fetches the
+exam and submits it within the same few minutes while teachers watch the
+stats.
+
+    python -m benchmarks.exam_day --teachers 5 --questions 20 --students 500 --concurrency 16
+    python -m benchmarks.exam_day --save-baseline benchmarks/baseline.json
+    python -m benchmarks.exam_day --compare benchmarks/baseline.json
+    python -m benchmarks.exam_day --base-url http://localhost:8000 --students 200
+
+Data: `--teachers` teachers each own `--tests-per-teacher` active tests of
+`--questions` single-choice questions; `--students` students are spread
+over the tests. Each student runs `auth/login`, `tests/{id}/start` (GET for
+the exam, POST to open the timed session) and `submissions`; every `--stats-every` submissions a teacher requests
+`stats/tests/{id}`.
+
+By default requests go through Django's test client in-process, against a
+throwaway test database (a temporary SQLite file with the default
+settings), and SQL queries per request are counted. With `--base-url` they
+go over HTTP to a running server, whose database is seeded through the
+ORM; query counts are then unavailable.
+
+Prints p50/p95/p99 latency, requests/s and queries per request per route.
+`--save-baseline` stores them as JSON with the current commit; `--compare`
+exits non-zero when a route's p95 regressed by more than `--tolerance` or
+it runs more queries than the baseline.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+PASSWORD = 'bench-password-123'
+EMAIL_DOMAIN = 'bench.local'
+
+
+def seed(teachers, tests_per_teacher, questions, students):
+    """Create the exam-day data set; returns (teacher emails per test id, student (email, test id) pairs)."""
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from apps.tests.models import Test, Question, Choice
+
+    User = get_user_model()
+    User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+    # One hash for everybody: seeding should not take as long as the logins.
+    password = make_password(PASSWORD)
+
+    teacher_rows = User.objects.bulk_create([
+        User(email=f'teacher{number}@{EMAIL_DOMAIN}', role='teacher', password=password)
+        for number in range(teachers)
+    ])
+    tests = Test.objects.bulk_create([
+        Test(title=f'Exam {number}', subject='Benchmark', created_by=teacher, time_limit=60)
+        for teacher in teacher_rows
+        for number in range(tests_per_teacher)
+    ])
+    question_rows = Question.objects.bulk_create([
+        Question(test=test, text=f'Question {number}', question_type='single_choice', points=1, order=number)
+        for test in tests
+        for number in range(questions)
+    ])
+    Choice.objects.bulk_create([
+        Choice(question=question, text=str(number), is_correct=number == 0)
+        for question in question_rows
+        for number in range(4)
+    ])
+
+    teacher_emails = {test.id: test.created_by.email for test in tests}
+    student_rows = User.objects.bulk_create([
+        User(email=f'student{number}@{EMAIL_DOMAIN}', role='student', password=password)
+        for number in range(students)
+    ])
+    return teacher_emails, [
+        (student.email, tests[number % len(tests)].id) for number, student in enumerate(student_rows)
+    ]
+
+
+class InProcessDriver:
+    """Requests through Django's test client; counts the SQL queries of each request."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def request(self, method, path, token=None, data=None):
+        from django.db import connection
+        from django.test import Client
+
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client()
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            response = self.local.client.generic(
+                method, path, json.dumps(data) if data is not None else '', content_type='application/json',
+                **headers
+            )
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, body, queries
+
+
+class HttpDriver:
+    """Requests over HTTP to a running server."""
+
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.requests = requests
+        self.local = threading.local()
+
+    def request(self, method, path, token=None, data=None):
+        if not hasattr(self.local, 'session'):
+            self.local.session = self.requests.Session()
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = self.local.session.request(method, self.base_url + path, json=data, headers=headers)
+        return response.status_code, response.content, None
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, driver, route, method, path, token=None, data=None, expected=(200, 201)):
+        started = time.perf_counter()
+        status, body, queries = driver.request(method, path, token, data)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies[route].append(elapsed)
+            if queries is not None:
+                self.queries[route].append(queries)
+            if status not in expected:
+                self.errors[route] += 1
+        return json.loads(body) if status in expected and body else None
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(driver, teacher_emails, students, concurrency, stats_every):
+    recorder = Recorder()
+    teacher_tokens = {}
+    for test_id, email in teacher_emails.items():
+        tokens = recorder.call(driver, 'auth/login', 'POST', '/api/v1/auth/login/', data={
+            'email': email, 'password': PASSWORD,
+        })
+        teacher_tokens[test_id] = tokens['access']
+    recorder = Recorder()
+    submitted = 0
+    submitted_lock = threading.Lock()
+
+    def sit_exam(student):
+        nonlocal submitted
+        email, test_id = student
+        tokens = recorder.call(driver, 'auth/login', 'POST', '/api/v1/auth/login/', data={
+            'email': email, 'password': PASSWORD,
+        })
+        if tokens is None:
+            return
+        exam = recorder.call(driver, 'tests/{id}/start', 'GET', f'/api/v1/tests/{test_id}/start/', tokens['access'])
+        if exam is None:
+            return
+        session = recorder.call(driver, 'tests/{id}/start POST', 'POST', f'/api/v1/tests/{test_id}/start/', tokens['access'])
+        if session is None:
+            return
+        answers = [
+            {'question_id': question['id'], 'selected_choice_ids': [question['choices'][0]['id']]}
+            for question in exam['questions']
+        ]
+        recorder.call(driver, 'submissions', 'POST', '/api/v1/submissions/', tokens['access'], {
+            'test': test_id, 'answers': answers,
+        }, expected=(200, 201, 202))
+        with submitted_lock:
+            submitted += 1
+            poll = stats_every and submitted % stats_every == 0
+        if poll:
+            recorder.call(driver, 'stats/tests/{id}', 'GET', f'/api/v1/stats/tests/{test_id}/', teacher_tokens[test_id])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(sit_exam, students))
+    elapsed = time.perf_counter() - started
+
+    routes = {}
+    for route, latencies in recorder.latencies.items():
+        latencies = sorted(latencies)
+        queries = recorder.queries.get(route)
+        routes[route] = {
+            'requests': len(latencies),
+            'errors': recorder.errors[route],
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return {'seconds': round(elapsed, 2), 'requests_per_second': round(total / elapsed, 1), 'routes': routes}
+
+
+def print_report(result):
+    print(f'{"route":<22} {"requests":>8} {"errors":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8}')
+    for route, numbers in result['routes'].items():
+        queries = numbers['queries_per_request']
+        print(f'{route:<22} {numbers["requests"]:>8} {numbers["errors"]:>6} {numbers["p50_ms"]:>8} '
+              f'{numbers["p95_ms"]:>8} {numbers["p99_ms"]:>8} {"n/a" if queries is None else queries:>8}')
+    print(f'{result["requests_per_second"]} requests/s over {result["seconds"]}s')
+
+
+def compare(result, baseline, tolerance):
+    """Return the regressions of `result` against `baseline` as printable lines."""
+    regressions = []
+    for route, numbers in result['routes'].items():
+        before = baseline['routes'].get(route)
+        if before is None:
+            continue
+        if numbers['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{route}: p95 {before["p95_ms"]} -> {numbers["p95_ms"]} ms')
+        if None not in (numbers['queries_per_request'], before['queries_per_request']) and (
+            numbers['queries_per_request'] > before['queries_per_request']
+        ):
+            regressions.append(
+                f'{route}: queries {before["queries_per_request"]} -> {numbers["queries_per_request"]}'
+            )
+    return regressions
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--teachers', type=int, default=5)
+    parser.add_argument('--tests-per-teacher', type=int, default=1)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--stats-every', type=int, default=10, help='A teacher stats request per N submissions.')
+    parser.add_argument('--base-url', help='Drive a running server instead of the in-process test client.')
+    parser.add_argument('--save-baseline', metavar='PATH')
+    parser.add_argument('--compare', metavar='PATH')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 regression, as a fraction.')
+    options = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    config = {
+        name: getattr(options, name)
+        for name in ('teachers', 'tests_per_teacher', 'questions', 'students', 'concurrency', 'stats_every')
+    }
+    old_name = None
+    if options.base_url:
+        driver = HttpDriver(options.base_url)
+    else:
+        setup_test_environment()
+        if connection.vendor == 'sqlite':
+            # In-memory test databases cannot take concurrent writers.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'exam_day.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        driver = InProcessDriver()
+
+    try:
+        started = time.perf_counter()
+        teacher_emails, students = seed(
+            options.teachers, options.tests_per_teacher, options.questions, options.students
+        )
+        print(f'Seeded {len(teacher_emails)} tests and {len(students)} students in {time.perf_counter() - started:.1f}s')
+        result = run(driver, teacher_emails, students, options.concurrency, options.stats_every)
+    finally:
+        if old_name is not None:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    result = {'commit': current_commit(), 'mode': 'http' if options.base_url else 'in-process', 'config': config,
+              **result}
+    print_report(result)
+
+    if options.save_baseline:
+        with open(options.save_baseline, 'w') as output:
+            json.dump(result, output, indent=2)
+        print(f'Baseline saved to {options.save_baseline}')
+
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('config') != config or baseline.get('mode') != result['mode']:
+            print('Warning: the baseline was recorded with a different configuration.')
+        regressions = compare(result, baseline, options.tolerance)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions against {options.compare} ({baseline.get("commit")}).')
+
+
+if __name__ == '__main__':
+    main()
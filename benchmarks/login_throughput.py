@@ -0,0 +1,94 @@
+"""
+Benchmark logins per second for each password hasher configuration.
+
+    python -m benchmarks.login_throughput --logins 50 --threads 4
+    SCRYPT_WORK_FACTOR=32768 python -m benchmarks.login_throughput --hashers scrypt
+
+For every hasher in `--hashers` (tuned by the PASSWORD_HASHER_OPTIONS
+environment variables) a user is created in a throwaway test database and
+logs in through `POST /api/v1/auth/login/`: once to upgrade the stored hash,
+then `--logins` times on one thread and again spread over `--threads`
+threads. Password hashes release the GIL, so the single-thread rate is the
+rate per core and the threaded rate shows how hashing scales up to
+PASSWORD_HASH_WORKERS hashes at once.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PASSWORD = 'bench-password-123'
+
+
+def login_rate(logins, threads):
+    from django.test import Client
+
+    def login(_):
+        response = Client().post('/api/v1/auth/login/', {'email': 'login@bench.local', 'password': PASSWORD})
+        assert response.status_code == 200, response.content
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(login, range(logins)))
+    return logins / (time.perf_counter() - started)
+
+
+def benchmark(hasher_name, logins, threads):
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import get_hasher
+    from django.db import close_old_connections
+    from django.test.utils import override_settings
+
+    hashers = [settings.PASSWORD_HASHER_CLASSES[hasher_name]] + [
+        hasher for hasher in settings.PASSWORD_HASHERS if hasher != settings.PASSWORD_HASHER_CLASSES[hasher_name]
+    ]
+    with override_settings(PASSWORD_HASHERS=hashers):
+        User = get_user_model()
+        User.objects.filter(email='login@bench.local').delete()
+        User.objects.create_user(email='login@bench.local', password=PASSWORD)
+        hasher = get_hasher()
+
+        started = time.perf_counter()
+        hasher.verify(PASSWORD, hasher.encode(PASSWORD, hasher.salt()))
+        verify_ms = (time.perf_counter() - started) * 1000 / 2
+
+        login_rate(1, 1)
+        single = login_rate(logins, 1)
+        threaded = login_rate(logins, threads)
+        close_old_connections()
+
+    params = settings.PASSWORD_HASHER_OPTIONS.get(hasher_name, {})
+    print(f'{hasher_name:<8} {" ".join(f"{key}={value}" for key, value in params.items()):<45} '
+          f'{verify_ms:8.1f} ms/hash {single:8.1f} logins/s/core {threaded:8.1f} logins/s on {threads} threads')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hashers', default='scrypt,argon2,pbkdf2', help='Comma-separated PASSWORD_HASHER names.')
+    parser.add_argument('--logins', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    options = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        for hasher_name in options.hashers.split(','):
+            try:
+                benchmark(hasher_name, options.logins, options.threads)
+            except ValueError as error:
+                # e.g. argon2 without argon2-cffi installed
+                print(f'{hasher_name:<8} skipped: {error}')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
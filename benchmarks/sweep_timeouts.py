@@ -0,0 +1,125 @@
+"""
+Benchmark the timeout sweeper against a large number of open exam sessions.
+
+    python -m benchmarks.sweep_timeouts --sessions 100000 --questions 10
+
+Seeds a throwaway test database (SQLite by default, whatever DATABASE_URL
+points at otherwise) with one test, `--sessions` in-progress submissions
+with one saved answer per question, of which `--expired` percent are past
+their deadline, then times `sweep_expired_submissions()` and prints the
+plan of the range query that selects each batch.
+"""
+import argparse
+import os
+import time
+from datetime import timedelta
+
+
+def seed(sessions, questions, expired_percent, chunk_size=5000):
+    from django.contrib.auth import get_user_model
+    from django.utils import timezone
+    from apps.tests.models import Test, Question, Choice
+    from apps.results.models import TestSubmission, Answer
+
+    User = get_user_model()
+    teacher = User.objects.create_user(email='teacher@bench.local', password='bench', role='teacher')
+    test = Test.objects.create(title='Benchmark', subject='Math', created_by=teacher, time_limit=60)
+    question_rows = Question.objects.bulk_create([
+        Question(test=test, text=f'Question {index}', question_type='single_choice', points=1, order=index)
+        for index in range(questions)
+    ])
+    correct = {}
+    for question in question_rows:
+        choices = Choice.objects.bulk_create([
+            Choice(question=question, text=str(index), is_correct=index == 0) for index in range(4)
+        ])
+        correct[question.id] = [choice.id for choice in choices]
+
+    now = timezone.now()
+    expired_count = sessions * expired_percent // 100
+    SelectedChoice = Answer.selected_choices.through
+    for start in range(0, sessions, chunk_size):
+        numbers = range(start, min(start + chunk_size, sessions))
+        students = User.objects.bulk_create([
+            User(email=f'student{number}@bench.local', role='student', password='!')
+            for number in numbers
+        ])
+        submissions = TestSubmission.objects.bulk_create([
+            TestSubmission(
+                test=test, student=student, status='in_progress',
+                expires_at=now - timedelta(minutes=5) if number < expired_count else now + timedelta(hours=1)
+            )
+            for number, student in zip(numbers, students)
+        ])
+        answers = Answer.objects.bulk_create([
+            Answer(submission=submission, question=question)
+            for submission in submissions
+            for question in question_rows
+        ])
+        SelectedChoice.objects.bulk_create([
+            SelectedChoice(answer_id=answer.id, choice_id=correct[answer.question_id][answer.id % 4])
+            for answer in answers
+        ])
+    return expired_count
+
+
+def explain_batch_query(batch_size):
+    from django.utils import timezone
+    from apps.results.models import TestSubmission
+
+    expired = TestSubmission.objects.filter(status='in_progress', expires_at__lt=timezone.now()).order_by('expires_at')
+    return expired.values_list('id', flat=True)[:batch_size].explain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=100000)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--expired', type=int, default=50, help='Percent of sessions past their deadline.')
+    parser.add_argument('--batch-size', type=int, default=None)
+    options = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    from django.utils import timezone
+    from apps.results.grading import sweep_expired_submissions
+    from apps.results.models import TestSubmission
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        started = time.perf_counter()
+        expired_count = seed(options.sessions, options.questions, options.expired)
+        print(f'Seeded {options.sessions} sessions ({expired_count} expired) with {options.questions} answers each '
+              f'in {time.perf_counter() - started:.1f}s')
+
+        batch_size = options.batch_size or settings.TIMEOUT_SWEEP_BATCH_SIZE
+        print(f'Batch query plan:\n{explain_batch_query(batch_size)}')
+
+        query_count = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_queries):
+            closed = sweep_expired_submissions(batch_size=batch_size)
+        elapsed = time.perf_counter() - started
+
+        assert closed == expired_count, (closed, expired_count)
+        assert not TestSubmission.objects.filter(status='in_progress', expires_at__lt=timezone.now()).exists()
+        print(f'Swept {closed} sessions in {elapsed:.2f}s '
+              f'({closed / elapsed:,.0f} submissions/s, batch size {batch_size}, {query_count} queries)')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
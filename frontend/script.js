@@ -16,6 +16,8 @@ let accessToken = localStorage.getItem('accessToken');
 let refreshToken = localStorage.getItem('refreshToken');
 let currentTest = null;
 let testTimer = null;
+let currentSession = null;
+let autosaveTimers = {};
 
 // Initialize the application
 function init() {
@@ -444,12 +446,17 @@ async function startTest(testId) {
         // Display test
         renderTest(currentTest);
         
+        // Open (or resume) the server-side session and restore autosaved answers
+        await openTestSession(testId);
+        
         // Hide dashboard and show test section
         hideAllSections();
         testSection.classList.remove('hidden');
         
-        // Start timer
-        if (test.time_limit && test.time_limit > 0) {
+        // Start timer (unless the session already started it from the server deadline)
+        if (currentSession && currentSession.expires_at) {
+            console.log('Timer follows the session deadline:', currentSession.expires_at);
+        } else if (test.time_limit && test.time_limit > 0) {
             startTestTimer(test.time_limit);
         } else {
             console.warn('No time limit set for test');
@@ -550,7 +557,7 @@ function renderTest(test) {
 }
 
 function startTestTimer(minutes) {
-    let totalSeconds = minutes * 60;
+    let totalSeconds = Math.round(minutes * 60);
     const timerElement = document.getElementById('time-remaining');
     
     // Clear any existing timer
@@ -648,44 +655,13 @@ async function submitTest(timedOut = false) {
         }
         
         questionCards.forEach(card => {
-            const questionId = parseInt(card.dataset.questionId);
-            const questionType = card.dataset.questionType;
-            
-            if (!questionId || isNaN(questionId)) {
-                console.warn('Invalid question ID:', card.dataset.questionId);
-                return;
-            }
-            
-            const answer = {
-                question_id: questionId,
-                selected_choice_ids: [],
-                text_answer: ''
-            };
-            
             try {
-                if (questionType === 'multiple_choice') {
-                    const checkedChoices = card.querySelectorAll('input[type="checkbox"]:checked');
-                    answer.selected_choice_ids = Array.from(checkedChoices)
-                        .map(choice => parseInt(choice.value))
-                        .filter(id => !isNaN(id));
-                } else if (questionType === 'single_choice') {
-                    const selectedChoice = card.querySelector('input[type="radio"]:checked');
-                    if (selectedChoice) {
-                        const choiceId = parseInt(selectedChoice.value);
-                        if (!isNaN(choiceId)) {
-                            answer.selected_choice_ids = [choiceId];
-                        }
-                    }
-                } else if (questionType === 'text') {
-                    const textArea = card.querySelector('textarea');
-                    if (textArea) {
-                        answer.text_answer = textArea.value.trim();
-                    }
+                const answer = collectAnswer(card);
+                if (answer) {
+                    answers.push(answer);
                 }
-                
-                answers.push(answer);
             } catch (err) {
-                console.error(`Error processing question ${questionId}:`, err);
+                console.error(`Error processing question ${card.dataset.questionId}:`, err);
             }
         });
         
@@ -696,17 +672,29 @@ async function submitTest(timedOut = false) {
         console.log('Submitting answers:', answers);
         console.log('Test ID:', testId);
         
-        const response = await fetchWithAuth(`${API_BASE_URL}/api/v1/submissions/`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
-            },
-            body: JSON.stringify({
-                test: parseInt(testId),
-                answers: answers
-            })
-        });
+        let response;
+        if (currentSession) {
+            // Answers are already stored by autosave; only grade them
+            await flushAutosaves();
+            response = await fetchWithAuth(`${API_BASE_URL}/api/v1/submissions/${currentSession.id}/submit/`, {
+                method: 'POST',
+                headers: {
+                    'Accept': 'application/json'
+                }
+            });
+        } else {
+            response = await fetchWithAuth(`${API_BASE_URL}/api/v1/submissions/`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'application/json'
+                },
+                body: JSON.stringify({
+                    test: parseInt(testId),
+                    answers: answers
+                })
+            });
+        }
         
         console.log('Submission response:', response);
         
@@ -726,6 +714,7 @@ async function submitTest(timedOut = false) {
         localStorage.removeItem('currentTestId');
         localStorage.removeItem('currentTestData');
         currentTest = null;
+        currentSession = null;
         testSection.dataset.testId = '';
         
         showNotification('Test submitted successfully!', 'success');
@@ -745,6 +734,144 @@ async function submitTest(timedOut = false) {
     }
 }
 
+function collectAnswer(card) {
+    const questionId = parseInt(card.dataset.questionId);
+    const questionType = card.dataset.questionType;
+    
+    if (!questionId || isNaN(questionId)) {
+        console.warn('Invalid question ID:', card.dataset.questionId);
+        return null;
+    }
+    
+    const answer = {
+        question_id: questionId,
+        selected_choice_ids: [],
+        text_answer: ''
+    };
+    
+    if (questionType === 'multiple_choice') {
+        const checkedChoices = card.querySelectorAll('input[type="checkbox"]:checked');
+        answer.selected_choice_ids = Array.from(checkedChoices)
+            .map(choice => parseInt(choice.value))
+            .filter(id => !isNaN(id));
+    } else if (questionType === 'single_choice') {
+        const selectedChoice = card.querySelector('input[type="radio"]:checked');
+        if (selectedChoice) {
+            const choiceId = parseInt(selectedChoice.value);
+            if (!isNaN(choiceId)) {
+                answer.selected_choice_ids = [choiceId];
+            }
+        }
+    } else if (questionType === 'text') {
+        const textArea = card.querySelector('textarea');
+        if (textArea) {
+            answer.text_answer = textArea.value.trim();
+        }
+    }
+    
+    return answer;
+}
+
+async function openTestSession(testId) {
+    try {
+        const response = await fetchWithAuth(`${API_BASE_URL}/api/v1/tests/${testId}/start/`, {
+            method: 'POST'
+        });
+        
+        if (!response.ok) {
+            currentSession = null;
+            return;
+        }
+        
+        currentSession = await response.json();
+        restoreAnswers(currentSession.answers || []);
+        
+        // The server deadline wins over the local timer, e.g. after a reload
+        if (currentSession.expires_at) {
+            const remainingSeconds = (new Date(currentSession.expires_at) - Date.now()) / 1000;
+            startTestTimer(Math.max(0, remainingSeconds) / 60);
+        }
+        
+        document.querySelectorAll('.question-card').forEach(card => {
+            card.addEventListener('change', () => scheduleAutosave(card, 0));
+            card.addEventListener('input', event => {
+                if (event.target.tagName === 'TEXTAREA') {
+                    scheduleAutosave(card, 1000);
+                }
+            });
+        });
+    } catch (error) {
+        console.warn('Could not open a test session; answers will be sent on submit:', error);
+        currentSession = null;
+    }
+}
+
+function restoreAnswers(answers) {
+    answers.forEach(answer => {
+        const card = document.querySelector(`.question-card[data-question-id="${answer.question_id}"]`);
+        if (!card) {
+            return;
+        }
+        
+        (answer.selected_choice_ids || []).forEach(choiceId => {
+            const input = card.querySelector(`input[value="${choiceId}"]`);
+            if (input) {
+                input.checked = true;
+            }
+        });
+        
+        const textArea = card.querySelector('textarea');
+        if (textArea && answer.text_answer) {
+            textArea.value = answer.text_answer;
+        }
+    });
+}
+
+function scheduleAutosave(card, delay) {
+    const questionId = card.dataset.questionId;
+    clearTimeout(autosaveTimers[questionId]);
+    autosaveTimers[questionId] = setTimeout(() => {
+        delete autosaveTimers[questionId];
+        saveAnswer(card);
+    }, delay);
+}
+
+async function saveAnswer(card) {
+    if (!currentSession) {
+        return;
+    }
+    
+    const answer = collectAnswer(card);
+    if (!answer) {
+        return;
+    }
+    
+    try {
+        const response = await fetchWithAuth(`${API_BASE_URL}/api/v1/submissions/${currentSession.id}/answers/`, {
+            method: 'PATCH',
+            body: JSON.stringify(answer)
+        });
+        
+        if (!response.ok) {
+            console.warn('Autosave failed for question', answer.question_id);
+        }
+    } catch (error) {
+        console.warn('Autosave failed:', error);
+    }
+}
+
+async function flushAutosaves() {
+    // Save answers whose autosave is still waiting on its debounce timer
+    const pending = Object.keys(autosaveTimers);
+    pending.forEach(questionId => clearTimeout(autosaveTimers[questionId]));
+    autosaveTimers = {};
+    
+    const cards = pending
+        .map(questionId => document.querySelector(`.question-card[data-question-id="${questionId}"]`))
+        .filter(card => card);
+    await Promise.all(cards.map(card => saveAnswer(card)));
+}
+
 async function loadSubmissionResult(submissionId) {
     try {
         const response = await fetchWithAuth(`${API_BASE_URL}/api/v1/submissions/${submissionId}/`);
@@ -906,28 +1033,8 @@ async function handleCreateTest(e) {
     const isActive = document.getElementById('test-active').checked;
     
     try {
-        // Create test
-        const testResponse = await fetchWithAuth(`${API_BASE_URL}/api/v1/tests/`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                title,
-                description,
-                subject,
-                time_limit: timeLimit,
-                is_active: isActive
-            })
-        });
-        
-        if (!testResponse.ok) {
-            throw new Error('Failed to create test');
-        }
-        
-        const testData = await testResponse.json();
-        
-        // Add questions
+        // Collect questions so the test and all of its questions are created in one request
+        const questions = [];
         const questionFields = document.querySelectorAll('.question-field');
         
         for (const questionField of questionFields) {
@@ -961,18 +1068,27 @@ async function handleCreateTest(e) {
                 });
             }
             
-            // Create question
-            const questionResponse = await fetchWithAuth(`${API_BASE_URL}/api/v1/tests/${testData.id}/questions/`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(questionData)
-            });
-            
-            if (!questionResponse.ok) {
-                throw new Error(`Failed to create question ${index}`);
-            }
+            questions.push(questionData);
+        }
+        
+        // Create test
+        const testResponse = await fetchWithAuth(`${API_BASE_URL}/api/v1/tests/`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                title,
+                description,
+                subject,
+                time_limit: timeLimit,
+                is_active: isActive,
+                questions
+            })
+        });
+        
+        if (!testResponse.ok) {
+            throw new Error('Failed to create test');
         }
         
         showNotification('Test created successfully!', 'success');
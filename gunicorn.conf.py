@@ -0,0 +1,37 @@
+"""
+Gunicorn settings, loaded automatically from the working directory.
+
+SERVER_MODE=asgi serves config.asgi with uvicorn workers instead of
+config.wsgi with sync workers. A sync worker is held by each open request,
+however idle the client; an ASGI worker keeps any number of them waiting
+and runs the async views (exam start, questions, /users/me, student stats)
+on its event loop, while DRF views run in its thread pool.
+
+Workers write Prometheus samples to PROMETHEUS_MULTIPROC_DIR so that
+/metrics reports all of them, whichever worker serves the scrape.
+"""
+import os
+import shutil
+
+bind = '0.0.0.0:8000'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2 * (os.cpu_count() or 1) + 1))
+
+if os.environ.get('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app = 'config.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'config.wsgi:application'
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus-multiproc')
+
+
+def on_starting(server):
+    # Samples of a previous run would otherwise be added to the new ones.
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)